@@ -390,6 +390,65 @@ def studyAreaProperties(cursor, upwindTable, stackedBlockTable, vegetationTable)
     
     return z0, d, H_r, H_max, lambda_f
 
+def zoneExtends(cursor, zonePropertiesTable, safetyFactor = ZONE_EXTEND_SAFETY_FACTOR):
+    """ Calculates the distances the grid should extend around the obstacle
+    zones: downwind, the obstacles disturb the flow up to the wake length
+    Lw (Kaplan et al. - 1996), upwind up to the displacement length Lf 
+    (Bagal et al. - 2004) while cross wind, they disturb it up to a distance
+    of the order of the width of their zones (the cross-wind width of the
+    obstacles). The maximum values of the study area are used.
+    
+    References:
+            Bagal, N, ER Pardyjak, et MJ Brown. « Improved upwind cavity 
+       parameterization for a fast response urban wind model ». In 84th Annual
+       AMS Meeting. Seattle, WA, 2004.
+            Kaplan, H., et N. Dinar. « A Lagrangian Dispersion Model for Calculating
+       Concentration Distribution within a Built-up Domain ». Atmospheric 
+       Environment 30, nᵒ 24 (1 décembre 1996): 4197‑4207.
+       https://doi.org/10.1016/1352-2310(96)00144-6.
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _ 
+
+            cursor: conn.cursor
+                A cursor object, used to perform spatial SQL queries
+            zonePropertiesTable: String
+                Name of the table containing the properties of each obstacle
+                zones (such as calculated by 'zoneProperties')
+            safetyFactor: float, default ZONE_EXTEND_SAFETY_FACTOR
+                Factor applied to the zone lengths and widths
+            
+		Returns
+		_ _ _ _ _ _ _ _ _ _ 
+
+            alongWindZoneExtend: float
+                Distance (in meter) of the extend of the grid downwind of the
+                obstacle zones
+            upwindZoneExtend: float
+                Distance (in meter) of the extend of the grid upwind of the
+                obstacle zones
+            crossWindZoneExtend: float
+                Distance (in meter) of the extend of the grid around the
+                obstacle zones in the cross-wind direction"""
+    print("Calculates the grid extends from the obstacle zone dimensions")
+    
+    # (the obstacles being rotated such as the wind blows along the Y-axis)
+    cursor.execute("""
+           SELECT   MAX({0}) AS LW_MAX,
+                    MAX({1}) AS LF_MAX,
+                    MAX(ST_XMAX({2}) - ST_XMIN({2})) AS WIDTH_MAX
+           FROM {3}""".format(WAKE_LENGTH_FIELD,
+                              DISPLACEMENT_LENGTH_FIELD,
+                              GEOM_FIELD,
+                              zonePropertiesTable))
+    Lw_max, Lf_max, width_max = cursor.fetchall()[0]
+    
+    # Default extends if there is no obstacle zone
+    if Lw_max is None:
+        return ALONG_WIND_ZONE_EXTEND, ALONG_WIND_ZONE_EXTEND, CROSS_WIND_ZONE_EXTEND
+    
+    return safetyFactor * Lw_max, safetyFactor * Lf_max, safetyFactor * width_max
+
 def maxObstacleHeight(cursor, stackedBlockTable, vegetationTable):
     """ Calculates the maximum height of the obstacles within the study area.
 
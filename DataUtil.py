@@ -83,6 +83,128 @@ def degToRad(angleDeg, origin = 0, direction = "CLOCKWISE"):
     
     return (angleDeg+d*origin)*np.pi/180
 
+def createArray(shape, dtype, directory = None, name = None):
+    """ Create an array filled with zeros, either in memory or backed by a
+    numpy file (memory-mapped) when a directory is given
+    
+    Parameters
+	_ _ _ _ _ _ _ _ _ _ 
+		shape : tuple
+			Shape of the array
+        dtype : String or numpy dtype
+            Type of the array values
+        directory : String, default None
+            Directory where is saved the file backing the array (if None,
+            the array is created in memory)
+        name : String, default None
+            Name of the file backing the array (without extension)
+            
+    
+    Returns
+	_ _ _ _ _ _ _ _ _ _ 	
+		The array filled with zeros"""
+    if directory is None:
+        return np.zeros(shape, dtype = dtype)
+    else:
+        return np.lib.format.open_memmap(os.path.join(directory, 
+                                                      "{0}_{1}.npy".format(MEMMAP_PREFIX,
+                                                                           name)),
+                                         mode = "w+", dtype = dtype, shape = shape)
+
+def centersToFaces(u, v, w, dz = None):
+    """ Interpolate (in place) the wind speed components from the center of
+    the cells to the faces of the cells (each component being averaged with
+    the one of the previous cell along its axis). For a vertically stretched
+    grid, w is linearly interpolated at the face located between the two
+    cell centers (each cell being weighted by the thickness of the other 
+    one). The arrays are processed one X plane at a time such as no 
+    temporary array of the grid size is created (the arrays being possibly 
+    memory-mapped)
+    
+    Parameters
+	_ _ _ _ _ _ _ _ _ _ 
+		u : 3D array
+			Wind speed along X-axis
+        v : 3D array
+            Wind speed along Y-axis
+        w : 3D array
+            Wind speed along Z-axis
+        dz : float or 1D array, default None
+            Thickness of each level (a plain average being used along
+            Z-axis if None or a single value)
+            
+    
+    Returns
+	_ _ _ _ _ _ _ _ _ _ 	
+		None"""
+    nx, ny, nz = u.shape
+    # Descending order such as the previous plane is not yet modified
+    for i in range(nx - 1, 0, -1):
+        u[i] = (u[i - 1] + u[i]) / 2
+    if np.ndim(dz) > 0:
+        dz = np.asarray(dz)
+        weightBelow = dz[1:nz] / (dz[0:nz-1] + dz[1:nz])
+    else:
+        weightBelow = 0.5
+    for i in range(nx):
+        v[i, 1:ny, :] = (v[i, 0:ny-1, :] + v[i, 1:ny, :]) / 2
+        w[i, :, 1:nz] = weightBelow * w[i, :, 0:nz-1] + (1 - weightBelow) * w[i, :, 1:nz]
+
+def facesToCenters(u, v, w):
+    """ Interpolate (in place) the wind speed components from the faces of
+    the cells to the center of the cells (except for the last cell along each
+    axis). The arrays are processed one X plane at a time such as no 
+    temporary array of the grid size is created (the arrays being possibly
+    memory-mapped)
+    
+    Parameters
+	_ _ _ _ _ _ _ _ _ _ 
+		u : 3D array
+			Wind speed along X-axis
+        v : 3D array
+            Wind speed along Y-axis
+        w : 3D array
+            Wind speed along Z-axis
+            
+    
+    Returns
+	_ _ _ _ _ _ _ _ _ _ 	
+		None"""
+    nx, ny, nz = u.shape
+    # Ascending order such as the next plane is not yet modified
+    for i in range(nx - 1):
+        u[i, 0:ny-1, 0:nz-1] = (u[i, 0:ny-1, 0:nz-1] + u[i + 1, 0:ny-1, 0:nz-1]) / 2
+        v[i, 0:ny-1, 0:nz-1] = (v[i, 0:ny-1, 0:nz-1] + v[i, 1:ny, 0:nz-1]) / 2
+        w[i, 0:ny-1, 0:nz-1] = (w[i, 0:ny-1, 0:nz-1] + w[i, 0:ny-1, 1:nz]) / 2
+
+def levelInterpolation(z, levelCenters):
+    """ Identify the two levels of a vertically stretched grid surrounding a 
+    given height and the weight of the upper one for a linear interpolation
+    (the nearest level being used out of the range of the level centers)
+    
+    Parameters
+	_ _ _ _ _ _ _ _ _ _ 
+		z : float
+			Height where the values are interpolated
+        levelCenters : 1D array
+            Height of the center of each level (increasing)
+            
+    
+    Returns
+	_ _ _ _ _ _ _ _ _ _ 	
+		n_lev : int
+			Index of the lower level
+        n_lev1 : int
+            Index of the upper level
+        weight1 : float
+            Weight of the upper level (the one of the lower level being 1 - weight1)"""
+    n_lev = int(np.searchsorted(levelCenters, z, side = "right")) - 1
+    n_lev = min(max(n_lev, 0), len(levelCenters) - 2)
+    n_lev1 = n_lev + 1
+    weight1 = (z - levelCenters[n_lev]) / (levelCenters[n_lev1] - levelCenters[n_lev])
+    
+    return n_lev, n_lev1, float(min(max(weight1, 0.), 1.))
+
 def postfix(tableName, suffix = None, separator = "_"):
     """ Add a suffix to an input table name
     
@@ -45,6 +45,7 @@ DELETE_OUTPUT_IF_EXISTS = True
 # CAD_TRIANGLE_FILENAME = "AllTriangles.shp"
 # CAD_VEG_INTERSECTION_FILENAME = "treesIntersection.shp"
 TEMPO_HORIZ_WIND_FILE = "tempo_horiz_wind.csv"
+SOLVER_HISTORY_FILE = "solver_history.csv"
 # Output files
 OUTPUT_FILENAME = "UROCK_OUTPUT"
 OUTPUT_RASTER_EXTENSION = ".GTiff"
@@ -77,6 +78,101 @@ ONLY_INITIALIZATION = False
 SAVE_ROCKLE_ZONES = False
 MAX_ITERATIONS = 500      # Based on QUIC-URB default values (2021)
 THRESHOLD_ITERATIONS = 1e-4 # Based on QUIC-URB default values (2021)
+CONVERGENCE_CHECK_INTERVAL = 1 # Number of iterations between two checks of the solver stopping condition
+TELEMETRY_INTERVAL = 10 # Number of iterations between two records of the solver convergence history
+# Floating point precision of the 3D fields (wind speeds, lambda) from the
+# wind initialization to the outputs ("float32" halves memory and bandwidth,
+# the solver convergence norms being anyway accumulated in double precision)
+PRECISION = "float64"
+LIST_OF_PRECISIONS = ["float64", "float32"]
+# Whether the lambda field resulting from the wind solver is saved in the temporary
+# directory to initialize the solver of the next calculations having the same 
+# grid and buildings (e.g. same geometry with another inflow speed or profile)
+LAMBDA_CACHE = False
+# Whether the 3D fields (initial and final wind speeds, lambda and the solver
+# coefficients) are backed by memory-mapped files saved in the temporary
+# directory, such as the size of the grid is limited by the disk rather than
+# by the RAM (the files are named using the following prefix)
+OUT_OF_CORE = False
+MEMMAP_PREFIX = "memmap"
+# Method used by the wind solver to iterate the Lagrange multiplier field:
+#   - "sor": sequential successive over-relaxation (Gauss-Seidel ordering)
+#   - "masked-sor": same as "sor" but sweeping the whole grid in memory order
+#                   (the cells which are not solved being skipped using a mask)
+#   - "domain-decomposition": SOR of slabs of the grid along X-axis, each pair
+#                             of slabs iterated by a separate thread
+#   - "red-black": checkerboard ordered SOR, each color sweep running on all cores
+#   - "line-sor": SOR of vertical lines (each column of cells solved at once,
+#                 columns ordered as a checkerboard and solved in parallel)
+#   - "multigrid": geometric multigrid V-cycles (initialized by a full multigrid cycle)
+#   - "cg": preconditioned conjugate gradient on the sparse matrix of the equation
+#           (the stopping threshold then applies to the relative residual)
+# Note that a symmetric SOR (forward then backward sweep) is not proposed: 
+# whatever its relaxation factor, it needs about twice as many sweeps as "sor"
+# to reach the same divergence (no gain over "sor" or "red-black" for this operator)
+# Neither is an active-set SOR (skipping the blocks of cells which have converged):
+# the error of the lambda equation decays globally, the blocks thus remaining
+# active until the convergence
+SOLVER_METHOD = "sor"
+LIST_OF_SOLVER_METHODS = ["sor", "masked-sor", "domain-decomposition", "red-black", "line-sor", "multigrid", "cg"]
+# Number of threads (pairs of slabs) of the domain decomposition (0 to use all cores)
+DOMAIN_DECOMPOSITION_THREADS = 0
+# Maximum number of cases solved simultaneously by threads of a same process
+# when several cases are solved at once (0 to use all cores)
+SOLVER_THREADS = 0
+# Number of times the grid is coarsened by 2 (in each direction) to initialize 
+# lambda by solving it on coarse grids before the full-resolution solver 
+# (grid sequencing, 0 for none - not used by the "multigrid" method)
+GRID_SEQUENCING = 0
+# Boundary condition of the solver at the top of the domain: "dirichlet" 
+# (lambda = 0, the vertical wind speed through the top face being corrected)
+# or "neumann" (zero vertical gradient of lambda, the vertical wind speed 
+# through the top face keeping its initial value)
+TOP_BOUNDARY = "dirichlet"
+LIST_OF_BOUNDARY_CONDITIONS = ["dirichlet", "neumann"]
+# Boundary condition of the solver at the lateral faces of the domain: 
+# "dirichlet" (lambda = 0), "neumann" (zero normal gradient of lambda, the wind
+# speed through the faces keeping its initial value) or "outflow" ("neumann" 
+# for the faces where the initial wind enters the domain, "dirichlet" for the
+# faces where it leaves the domain, thus keeping the inflow wind speed)
+LATERAL_BOUNDARY = "dirichlet"
+LIST_OF_LATERAL_BOUNDARY_CONDITIONS = ["dirichlet", "neumann", "outflow"]
+# Solve only the levels below the free stream region (the upper levels where
+# the initial wind field is the undisturbed vertical profile, kept as it is),
+# the top of the solved domain being set some levels (margin) above the 
+# lowest free stream level (with a "neumann" boundary condition)
+FREE_STREAM = False
+FREE_STREAM_MARGIN = 4
+# Multigrid parameters: smoother ("sor" or "red-black"), number of smoothing
+# sweeps before and after the coarse grid correction, number of SOR sweeps 
+# on the coarsest grid and minimum number of cells along an axis of the coarsest grid
+MULTIGRID_SMOOTHER = "red-black"
+MULTIGRID_PRE_SMOOTHING = 2
+MULTIGRID_POST_SMOOTHING = 2
+MULTIGRID_COARSEST_SWEEPS = 50
+MULTIGRID_MIN_CELLS = 5
+# Preconditioner of the conjugate gradient:
+#   - "jacobi": inverse of the matrix diagonal
+#   - "ic": diagonal incomplete Cholesky factorization (IC(0) for the 7-point stencil)
+#   - "amg": algebraic multigrid V-cycle (needs the 'pyamg' Python package,
+#            "ic" is used when it is not installed)
+CG_PRECONDITIONER = "amg"
+LIST_OF_CG_PRECONDITIONERS = ["jacobi", "ic", "amg"]
+# Relaxation factor (omega) of the SOR based methods ("sor", "red-black", "line-sor"):
+#   - "fixed": calculated from the horizontal grid shape only
+#   - "adaptive": starting from Gauss-Seidel iterations (omega = 1), the
+#                 spectral radius is regularly estimated from the decay of the
+#                 lambda variation in order to deduce a near-optimal omega
+#                 ("sor", "red-black" and "line-sor" only). The first 
+#                 iterations being slower, it is only worth using on flat grids
+#                 (horizontal extent much larger than the height, e.g. 60 x 60
+#                 x 8 cells) where the "fixed" omega is too high
+#   - "chebyshev": Chebyshev acceleration, omega being modified at each
+#                  half-sweep from the spectral radius of the 3D grid
+#                  ("red-black" and "line-sor" only)
+RELAXATION = "fixed"
+LIST_OF_RELAXATIONS = ["fixed", "adaptive", "chebyshev"]
+RELAXATION_ESTIMATION_ITERATIONS = 20
 
 # Note that the number of points of an ellipse is only used to identify whether
 # the upper or lower part of an ellipse should be used (fro displacement zones),
@@ -89,6 +185,16 @@ DZ = 2
 ALONG_WIND_ZONE_EXTEND = 60
 CROSS_WIND_ZONE_EXTEND = 40
 VERTICAL_EXTEND = 20
+# If True, the extends of the grid are calculated from the obstacle zones
+# (the maximum wake length downwind, the maximum displacement length upwind
+# and the maximum zone width cross wind) multiplied by a safety factor, 
+# instead of using ALONG_WIND_ZONE_EXTEND and CROSS_WIND_ZONE_EXTEND
+AUTO_ZONE_EXTEND = False
+ZONE_EXTEND_SAFETY_FACTOR = 1.
+# Vertical stretching of the grid: the levels located below the highest obstacle
+# have a DZ thickness while the thickness of the levels above is multiplied
+# by VERTICAL_STRETCHING from one level to the next one (1 for a uniform grid)
+VERTICAL_STRETCHING = 1.
 
 # The "perpendicular vortex scheme" for rooftop and displacement zones is activated
 # if the wind angle if more or less 'PERPENDICULAR_THRESHOLD_ANGLE' ° higher
@@ -248,3 +354,11 @@ WINDSPEED_Y = "windSpeed_y"
 WINDSPEED_Z = "windSpeed_z"
 LEVELS = "Levels"
 WINDSPEED_PROFILE = "windSpeed"
+
+# Columns of the solver convergence history
+ITERATION_FIELD = "ITERATION"
+EPS_FIELD = "EPS"
+MAX_RESIDUAL_FIELD = "MAX_RESIDUAL"
+DIVERGENCE_NORM_FIELD = "DIVERGENCE_NORM"
+CELLS_PER_SECOND_FIELD = "CELLS_PER_SECOND"
+ELAPSED_TIME_FIELD = "ELAPSED_TIME"
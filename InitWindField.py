@@ -40,7 +40,7 @@ from .GlobalVariables import ALONG_WIND_ZONE_EXTEND, CROSS_WIND_ZONE_EXTEND,\
     SIN_BLOCK_LEFT_AZIMUTH, SIN_BLOCK_AZIMUTH, STACKED_BLOCK_WIDTH,\
     DOWNSTREAM_X_RELATIVE_POSITION, V_WEIGHT, U_WEIGHT, W_WEIGHT,\
     STACKED_BLOCK_X_MED, REMOVE_INITIALIZATION_OFFSET, IS_UPSTREAM_FIELD,\
-    IS_UPSTREAM_UPSTREAM_WEIGHTING
+    IS_UPSTREAM_UPSTREAM_WEIGHTING, VERTICAL_STRETCHING
 import math
 import numpy as np
 import os
@@ -49,11 +49,13 @@ def createGrid(cursor, dicOfInputTables,  srid,
                alongWindZoneExtend = ALONG_WIND_ZONE_EXTEND, 
                crossWindZoneExtend = CROSS_WIND_ZONE_EXTEND, 
                meshSize = MESH_SIZE,
-               prefix = PREFIX_NAME):
+               prefix = PREFIX_NAME,
+               upwindZoneExtend = None):
     """ Creates a grid of points which will be used to initiate the wind
     speed field. The grid limits are defined by the enveloppe of a set of 
     geometries ('dicOfInputTables') extended to a certain distance
-    along wind ('alongWindZoneExtend') and cross wind ('crossWindZoneExtend') 
+    along wind ('alongWindZoneExtend' downwind and 'upwindZoneExtend' 
+    upwind) and cross wind ('crossWindZoneExtend') 
  
 		Parameters
 		_ _ _ _ _ _ _ _ _ _ 
@@ -66,8 +68,8 @@ def createGrid(cursor, dicOfInputTables,  srid,
             srid: int
                 SRID of the building data (useful for grid creation)
             alongWindZoneExtend: float, default ALONG_WIND_ZONE_EXTEND
-                Distance (in meter) of the extend of the zone around the
-                rotated obstacles in the along-wind direction
+                Distance (in meter) of the extend of the zone downwind of the
+                rotated obstacles
             crosswindZoneExtend: float, default CROSS_WIND_ZONE_EXTEND
                 Distance (in meter) of the extend of the zone around the
                 rotated obstacles in the cross-wind direction
@@ -75,6 +77,9 @@ def createGrid(cursor, dicOfInputTables,  srid,
                 Resolution (in meter) of the grid 
             prefix: String, default PREFIX_NAME
                 Prefix to add to the output table name
+            upwindZoneExtend: float, default None
+                Distance (in meter) of the extend of the zone upwind of the
+                rotated obstacles (same as 'alongWindZoneExtend' if None)
             
 		Returns
 		_ _ _ _ _ _ _ _ _ _ 
@@ -83,6 +88,9 @@ def createGrid(cursor, dicOfInputTables,  srid,
                 Name of the grid point table"""
     print("Creates the grid of points")
     
+    if upwindZoneExtend is None:
+        upwindZoneExtend = alongWindZoneExtend
+    
     # Output base name
     outputBaseName = "GRID"
     
@@ -94,7 +102,8 @@ def createGrid(cursor, dicOfInputTables,  srid,
                                                            dicOfInputTables[t])
                      for t in dicOfInputTables.keys()]
     
-    # Calculate the extend of the envelope of all geometries
+    # Calculate the extend of the envelope of all geometries (the wind 
+    # blowing from the top to the bottom of the Y-axis)
     finalQuery = """
         DROP TABLE IF EXISTS {0};
         CREATE TABLE {0}
@@ -103,9 +112,11 @@ def createGrid(cursor, dicOfInputTables,  srid,
                         ID_COL AS {7},
                         ID_ROW AS {8},
                         ST_Y({1}) AS {10},
-            FROM ST_MAKEGRIDPOINTS((SELECT ST_EXPAND(ST_EXTENT({1}),
-                                                      {2},
-                                                      {3}) FROM ({5})), 
+            FROM ST_MAKEGRIDPOINTS((SELECT ST_MAKEENVELOPE(ST_XMIN(EXTENT) - {2},
+                                                           ST_YMIN(EXTENT) - {3},
+                                                           ST_XMAX(EXTENT) + {2},
+                                                           ST_YMAX(EXTENT) + {11})
+                                    FROM (SELECT ST_EXTENT({1}) AS EXTENT FROM ({5}))), 
                                     {4}, 
                                     {4})""".format(gridTable, 
                                                    GEOM_FIELD,
@@ -117,11 +128,147 @@ def createGrid(cursor, dicOfInputTables,  srid,
                                                    ID_POINT_X,
                                                    ID_POINT_Y,
                                                    srid,
-                                                   Y_POINT)
+                                                   Y_POINT,
+                                                   upwindZoneExtend)
     cursor.execute(finalQuery)
     
     return gridTable
 
+def gridSize(cursor, gridTable, sketchHeight, dz = DZ, stretchingHeight = 0.,
+             stretchingRatio = VERTICAL_STRETCHING):
+    """ Calculates the number of points of the 3D grid along each axis.
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _ 
+
+            cursor: conn.cursor
+                A cursor object, used to perform spatial SQL queries
+            gridTable: String
+                Name of the grid point table
+            sketchHeight: float
+                Height of the sketch (m)
+            dz: float, default DZ
+                Resolution (in meter) of the grid in the vertical direction
+                (thickness of the levels below the stretching height)
+            stretchingHeight: float, default 0.
+                Height (in meter) above which the grid levels are stretched
+            stretchingRatio: float, default VERTICAL_STRETCHING
+                Ratio between the thickness of two consecutive stretched levels
+            
+		Returns
+		_ _ _ _ _ _ _ _ _ _ 
+
+            nPoints: dictionary
+                Number of points along each axis (X, Y and Z keys)"""
+    cursor.execute("""SELECT   MAX({0}) AS ID_POINT_X,
+                               MAX({1}) AS ID_POINT_Y
+                       FROM     {2}
+                       """.format(ID_POINT_X, ID_POINT_Y, gridTable))
+    nPointsResults = cursor.fetchall()
+    
+    # One point per level of the vertical profile plus the ground level
+    return {X: nPointsResults[0][0]   , Y: nPointsResults[0][1],
+            Z: levelHeights(maxHeight = sketchHeight, dz = dz,
+                            stretchingHeight = stretchingHeight,
+                            stretchingRatio = stretchingRatio)[0].size + 1}
+
+def levelHeights(maxHeight, dz = DZ, stretchingHeight = 0.,
+                 stretchingRatio = VERTICAL_STRETCHING):
+    """ Calculates the height of the center and the thickness of the grid 
+    levels located below a given height. The levels located below the 
+    stretching height have a 'dz' thickness while the thickness of the 
+    levels above is multiplied by 'stretchingRatio' from one level to the
+    next one. Whatever the maximum height, the levels are always the same
+    (only their number changes) thus a level has the same index (ID_POINT_Z)
+    in all tables.
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _ 
+
+            maxHeight: float
+                Height (in meter) below which the levels are located
+            dz: float, default DZ
+                Resolution (in meter) of the grid in the vertical direction
+                (thickness of the levels below the stretching height)
+            stretchingHeight: float, default 0.
+                Height (in meter) above which the grid levels are stretched
+            stretchingRatio: float, default VERTICAL_STRETCHING
+                Ratio between the thickness of two consecutive stretched levels
+            
+		Returns
+		_ _ _ _ _ _ _ _ _ _ 
+
+            heights: 1D array
+                Height (in meter) of the center of each level
+            thicknesses: 1D array
+                Thickness (in meter) of each level"""
+    if stretchingRatio < 1:
+        raise ValueError("The vertical stretching ratio should be greater or equal to 1 (got {0})"\
+                         .format(stretchingRatio))
+    # Uniform grid (levels starting at dz/2)
+    if stretchingRatio == 1:
+        heights = np.arange(float(dz)/2,
+                            float(dz)/2+math.trunc(maxHeight/dz)*dz,
+                            dz)
+        return heights, np.full(heights.size, float(dz))
+    
+    # Number of levels having a 'dz' thickness, the first stretched level
+    # being 'stretchingRatio' times thicker
+    nFineLevels = math.ceil(stretchingHeight / dz)
+    thicknesses = []
+    levelTop = 0.
+    # No level is thinner than dz thus there is at most maxHeight / dz levels
+    for n in range(math.trunc(maxHeight / dz + 1e-6)):
+        thickness = float(dz) * stretchingRatio ** max(len(thicknesses) + 1 - nFineLevels, 0)
+        if levelTop + thickness > maxHeight + 1e-6:
+            break
+        thicknesses.append(thickness)
+        levelTop += thickness
+    thicknesses = np.array(thicknesses)
+    
+    return np.cumsum(thicknesses) - thicknesses / 2, thicknesses
+
+def levelIndexQuery(heightExpression, dz = DZ, stretchingHeight = 0.,
+                    stretchingRatio = VERTICAL_STRETCHING):
+    """ Returns the SQL expression of the index (ID_POINT_Z, starting at 1)
+    of the grid level containing a given height (see 'levelHeights' for
+    the definition of the levels).
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _ 
+
+            heightExpression: String
+                SQL expression of the height (in meter)
+            dz: float, default DZ
+                Resolution (in meter) of the grid in the vertical direction
+                (thickness of the levels below the stretching height)
+            stretchingHeight: float, default 0.
+                Height (in meter) above which the grid levels are stretched
+            stretchingRatio: float, default VERTICAL_STRETCHING
+                Ratio between the thickness of two consecutive stretched levels
+            
+		Returns
+		_ _ _ _ _ _ _ _ _ _ 
+
+            query: String
+                SQL expression of the level index"""
+    if stretchingRatio < 1:
+        raise ValueError("The vertical stretching ratio should be greater or equal to 1 (got {0})"\
+                         .format(stretchingRatio))
+    if stretchingRatio == 1:
+        return "TRUNC({0} / {1}) + 1".format(heightExpression, dz)
+    
+    # Above the 'dz' levels, the top of the m-th stretched level is located
+    # at fineTop + dz * r * (r^m - 1) / (r - 1)
+    nFineLevels = math.ceil(stretchingHeight / dz)
+    fineTop = nFineLevels * dz
+    return """CASE WHEN {0} < {1}
+                   THEN TRUNC({0} / {2}) + 1
+                   ELSE {3} + FLOOR(LN(1 + ({0} - {1}) * ({4} - 1) / ({2} * {4})) / LN({4})) + 1
+                   END""".format(heightExpression  , fineTop,
+                                 dz                , nFineLevels,
+                                 stretchingRatio)
+
 def affectsPointToBuildZone(cursor, gridTable, dicOfBuildRockleZoneTable,
                             prefix = PREFIX_NAME):
     """ Affects each point to a building Rockle zone and calculates relative
@@ -1243,7 +1390,8 @@ def removeBuildZonePoints(cursor, dicOfInitBuildZoneGridPoint,
 
 def manageBackwardZones(cursor, dicOfBuildZoneGridPoint, cavity2dInitPoints,
                         wake2dInitPoints, streetCanyonTable, gridTable, 
-                        prefix, meshSize = MESH_SIZE, dz = DZ):
+                        prefix, meshSize = MESH_SIZE, dz = DZ,
+                        stretchingHeight = 0., stretchingRatio = VERTICAL_STRETCHING):
     """ A building having a horizontal piece its upwind facade entirely (vertically)
     located within the cavity zone of an upwind taller building will create:
         -> a backward zone system within the 2 buildings (ie. the downwind building 
@@ -1276,6 +1424,10 @@ def manageBackwardZones(cursor, dicOfBuildZoneGridPoint, cavity2dInitPoints,
                 Resolution (in meter) of the grid 
             dz: float, default DZ
                 Resolution (in meter) of the grid in the vertical direction
+            stretchingHeight: float, default 0.
+                Height (in meter) above which the grid levels are stretched
+            stretchingRatio: float, default VERTICAL_STRETCHING
+                Ratio between the thickness of two consecutive stretched levels
             
 		Returns
 		_ _ _ _ _ _ _ _ _ _ 
@@ -1324,7 +1476,7 @@ def manageBackwardZones(cursor, dicOfBuildZoneGridPoint, cavity2dInitPoints,
            DROP TABLE IF EXISTS {14};
            CREATE TABLE {14}
                AS SELECT   a.{1}, a.{2}, a.{3}, a.{4}, b.{17}-b.{18} AS {17}, b.{18}, b.{19}, 
-                           TRUNC(b.{16} / {21}) + 1 AS {22}, b.{20}
+                           {21} AS {22}, b.{20}
                FROM {0} AS a LEFT JOIN {5} AS b
                ON a.{1} = b.{1} AND a.{3} = b.{3} AND a.{4} = b.{4}
                WHERE b.{15} > b.{16}
@@ -1359,7 +1511,10 @@ def manageBackwardZones(cursor, dicOfBuildZoneGridPoint, cavity2dInitPoints,
                        MAX_CANYON_HEIGHT_FIELD          , Y_WALL,
                        LENGTH_ZONE_FIELD+STREET_CANYON_NAME[0],
                        UPWIND_FACADE_FIELD              , ID_POINT,
-                       dz                               , ID_POINT_Z))
+                       levelIndexQuery(heightExpression = "b." + MAX_CANYON_HEIGHT_FIELD,
+                                       dz = dz, stretchingHeight = stretchingHeight,
+                                       stretchingRatio = stretchingRatio),
+                       ID_POINT_Z))
             
     # Then get the stacked blocks concerned by the backward cavity and wake zones
     # and revert the cavity and wake wind speed factors from downwind to upwind stacked block
@@ -1504,7 +1659,8 @@ def manageBackwardZones(cursor, dicOfBuildZoneGridPoint, cavity2dInitPoints,
 
 
 def calculates3dBuildWindFactor(cursor, dicOfBuildZoneGridPoint,
-                                dz = DZ, prefix = PREFIX_NAME):
+                                dz = DZ, prefix = PREFIX_NAME, stretchingHeight = 0.,
+                                stretchingRatio = VERTICAL_STRETCHING):
     """ Calculates the 3D wind speed factors for each building zone.
 
 		Parameters
@@ -1519,6 +1675,10 @@ def calculates3dBuildWindFactor(cursor, dicOfBuildZoneGridPoint,
                 Resolution (in meter) of the grid in the vertical direction
             prefix: String, default PREFIX_NAME
                 Prefix to add to the output table name
+            stretchingHeight: float, default 0.
+                Height (in meter) above which the grid levels are stretched
+            stretchingRatio: float, default VERTICAL_STRETCHING
+                Ratio between the thickness of two consecutive stretched levels
             
 		Returns
 		_ _ _ _ _ _ _ _ _ _ 
@@ -1561,9 +1721,9 @@ def calculates3dBuildWindFactor(cursor, dicOfBuildZoneGridPoint,
     
     # Creates the table of z levels impacted by building obstacles (start at dz/2)
     if maxHeight:
-        listOfZ = [str(i) for i in np.arange(float(dz)/2,
-                                             float(dz)/2+math.trunc(maxHeight/dz)*dz,
-                                             dz)]
+        listOfZ = [str(i) for i in levelHeights(maxHeight = maxHeight, dz = dz,
+                                                stretchingHeight = stretchingHeight,
+                                                stretchingRatio = stretchingRatio)[0]]
         cursor.execute("""
                    DROP TABLE IF EXISTS {0};
                    CREATE TABLE {0}({2} SERIAL, {3} DOUBLE);
@@ -1792,7 +1952,8 @@ def calculates3dBuildWindFactor(cursor, dicOfBuildZoneGridPoint,
 
 
 def calculates3dVegWindFactor(cursor, dicOfVegZoneGridPoint, sketchHeight,
-                              z0, d, dz = DZ, prefix = PREFIX_NAME):
+                              z0, d, dz = DZ, prefix = PREFIX_NAME, stretchingHeight = 0.,
+                              stretchingRatio = VERTICAL_STRETCHING):
     """ Calculates the 3D wind speed factors for each zone according to 
     Nelson et al. (2009) method. Note that for vegetation located in 
     open areas (Equations 8 and 9), the displacement height is defined by
@@ -1825,6 +1986,10 @@ def calculates3dVegWindFactor(cursor, dicOfVegZoneGridPoint, sketchHeight,
                 Resolution (in meter) of the grid in the vertical direction
             prefix: String, default PREFIX_NAME
                 Prefix to add to the output table name
+            stretchingHeight: float, default 0.
+                Height (in meter) above which the grid levels are stretched
+            stretchingRatio: float, default VERTICAL_STRETCHING
+                Ratio between the thickness of two consecutive stretched levels
             
 		Returns
 		_ _ _ _ _ _ _ _ _ _ 
@@ -1849,9 +2014,9 @@ def calculates3dVegWindFactor(cursor, dicOfVegZoneGridPoint, sketchHeight,
     tempoAllVeg = DataUtil.postfix("TEMPO_ALL_VEG")
     
     # Creates the table of z levels of the sketch
-    listOfZ = [str(i) for i in np.arange(float(dz)/2, 
-                                         float(dz)/2+math.trunc(sketchHeight/dz)*dz, 
-                                         dz)]
+    listOfZ = [str(i) for i in levelHeights(maxHeight = sketchHeight, dz = dz,
+                                            stretchingHeight = stretchingHeight,
+                                            stretchingRatio = stretchingRatio)[0]]
     cursor.execute("""
             DROP TABLE IF EXISTS {0};
             CREATE TABLE {0}({2} SERIAL, {3} DOUBLE);
@@ -2842,6 +3007,7 @@ def setInitialWindField(cursor, initializedWindFactorTable, gridPoint,
                         df_gridBuil, z0, sketchHeight, profileType = PROFILE_TYPE,
                         meshSize = MESH_SIZE,  dz = DZ, z_ref = Z_REF, 
                         V_ref = V_REF, tempoDirectory = TEMPO_DIRECTORY,
+                        stretchingHeight = 0., stretchingRatio = VERTICAL_STRETCHING,
                         **kwargs):
     """ Set the initial 3D wind speed according to the wind speed factor in
     the Röckle zones and to the initial vertical wind speed profile.
@@ -2880,6 +3046,10 @@ def setInitialWindField(cursor, initializedWindFactorTable, gridPoint,
                 Path of the directory where will be stored the grid points
                 having Röckle initial wind speed values (in order to exchange
                                                          data between H2 to Python)
+            stretchingHeight: float, default 0.
+                Height (in meter) above which the grid levels are stretched
+            stretchingRatio: float, default VERTICAL_STRETCHING
+                Ratio between the thickness of two consecutive stretched levels
             (optional) d: float
                 Value of the study area displacement length (only if profileType = "log" or "urban")
             (optional) H: float
@@ -2920,9 +3090,9 @@ def setInitialWindField(cursor, initializedWindFactorTable, gridPoint,
     tempoZoneWindSpeedFactorTable = DataUtil.postfix("TEMPO_ZONE_WIND_SPEED_FACTOR")
     
     # Set a list of the level height and get their horizontal wind speed
-    levelHeightList = [i for i in np.arange(float(dz)/2, 
-                                            float(dz)/2+math.trunc(sketchHeight/dz)*dz,
-                                            dz)]
+    levelHeightList = [i for i in levelHeights(maxHeight = sketchHeight, dz = dz,
+                                               stretchingHeight = stretchingHeight,
+                                               stretchingRatio = stretchingRatio)[0]]
     verticalWindSpeedProfile = \
         getVerticalProfile( cursor = cursor,
                             pointHeightList = levelHeightList,
@@ -3112,7 +3282,8 @@ def setInitialWindField(cursor, initializedWindFactorTable, gridPoint,
 
 def identifyBuildPoints(cursor, gridPoint, stackedBlocksWithBaseHeight,
                         meshSize = MESH_SIZE, dz = DZ, 
-                        tempoDirectory = TEMPO_DIRECTORY):
+                        tempoDirectory = TEMPO_DIRECTORY, stretchingHeight = 0.,
+                        stretchingRatio = VERTICAL_STRETCHING):
     """ Identify grid cells intersecting buildings.
     
     		Parameters
@@ -3131,6 +3302,10 @@ def identifyBuildPoints(cursor, gridPoint, stackedBlocksWithBaseHeight,
                 Path of the directory where will be stored the grid points
                 intersecting with buildings (in order to exchange
                                              data between H2 to Python)
+            stretchingHeight: float, default 0.
+                Height (in meter) above which the grid levels are stretched
+            stretchingRatio: float, default VERTICAL_STRETCHING
+                Ratio between the thickness of two consecutive stretched levels
             
         
     		Returns
@@ -3178,9 +3353,10 @@ def identifyBuildPoints(cursor, gridPoint, stackedBlocksWithBaseHeight,
     # Set a list of the level height (and indice) which can intersect with buildings
     if buildMaxHeight:
         levelHeightList = [str(j+1)+","+str(i)
-                               for j, i in enumerate(np.arange(float(dz)/2, 
-                                                               float(dz)/2+math.trunc(buildMaxHeight/dz)*dz,
-                                                               dz))]
+                               for j, i in enumerate(levelHeights(maxHeight = buildMaxHeight,
+                                                                  dz = dz,
+                                                                  stretchingHeight = stretchingHeight,
+                                                                  stretchingRatio = stretchingRatio)[0])]
 
         # ...and insert them into a table
         cursor.execute("""
@@ -39,6 +39,9 @@ def main(javaEnvironmentPath,
          alongWindZoneExtend = ALONG_WIND_ZONE_EXTEND,
          crossWindZoneExtend = CROSS_WIND_ZONE_EXTEND,
          verticalExtend = VERTICAL_EXTEND,
+         autoZoneExtend = AUTO_ZONE_EXTEND,
+         zoneExtendSafetyFactor = ZONE_EXTEND_SAFETY_FACTOR,
+         verticalStretching = VERTICAL_STRETCHING,
          tempoDirectory = TEMPO_DIRECTORY,
          inputDirectory = INPUT_DIRECTORY,
          outputDirectory = OUTPUT_DIRECTORY,
@@ -62,11 +65,25 @@ def main(javaEnvironmentPath,
          saveNetcdf = True,
          debug = DEBUG,
          profileType = PROFILE_TYPE,
-         verticalProfileFile = None):
+         verticalProfileFile = None,
+         solverMethod = SOLVER_METHOD,
+         precision = PRECISION,
+         lambdaCache = LAMBDA_CACHE,
+         relaxation = RELAXATION,
+         gridSequencing = GRID_SEQUENCING,
+         outOfCore = OUT_OF_CORE,
+         freeStream = FREE_STREAM,
+         lateralBoundary = LATERAL_BOUNDARY):
     # If the function is called within QGIS, a feedback is sent into the QGIS interface
     if feedback:
         feedback.setProgressText('Initiating algorithm')
     
+    # The vertical stretching is checked before any calculation (a ratio 
+    # lower than 1 would make the levels thinner and thinner)
+    if not verticalStretching >= 1:
+        raise ValueError("The vertical stretching ratio should be greater or equal to 1 (got {0})"\
+                         .format(verticalStretching))
+    
     ################################ INIT OUTPUT VARIABLES ############################
     # Define dictionaries of input and output relative directories
     outputDataRel = {}
@@ -395,6 +412,18 @@ def main(javaEnvironmentPath,
             feedback.setProgressText("Calculation cancelled by user")
             return {}
         
+    # The grid extends around the obstacle zones may be based on the zone 
+    # dimensions (else the along-wind extend is used both upwind and downwind)
+    upwindZoneExtend = alongWindZoneExtend
+    if autoZoneExtend:
+        alongWindZoneExtend, upwindZoneExtend, crossWindZoneExtend = \
+            CalculatesIndicators.zoneExtends(cursor = cursor,
+                                             zonePropertiesTable = zonePropertiesTable,
+                                             safetyFactor = zoneExtendSafetyFactor)
+        print("Grid extends around the obstacle zones: {0} m downwind, {1} m upwind, {2} m cross wind"\
+              .format(round(alongWindZoneExtend, 1), round(upwindZoneExtend, 1),
+                      round(crossWindZoneExtend, 1)))
+    
     # Creates the grid of points
     gridPoint = InitWindField.createGrid(cursor = cursor, 
                                          dicOfInputTables = dict(dicOfBuildRockleZoneTable,
@@ -403,7 +432,8 @@ def main(javaEnvironmentPath,
                                          alongWindZoneExtend = alongWindZoneExtend, 
                                          crossWindZoneExtend = crossWindZoneExtend, 
                                          meshSize = meshSize,
-                                         prefix = prefix)
+                                         prefix = prefix,
+                                         upwindZoneExtend = upwindZoneExtend)
     
     # Affects each 2D point to a build Rockle zone and calculates needed variables for 3D wind speed factors
     dicOfInitBuildZoneGridPoint, verticalLineTable = \
@@ -435,7 +465,9 @@ def main(javaEnvironmentPath,
                                           gridTable = gridPoint,
                                           meshSize = meshSize,
                                           dz = dz,
-                                          prefix = prefix)
+                                          prefix = prefix,
+                                          stretchingHeight = H_ob_max,
+                                          stretchingRatio = verticalStretching)
     
     if debug or saveRockleZones:
         for t in dicOfBuildZoneGridPoint:
@@ -476,7 +508,9 @@ def main(javaEnvironmentPath,
         InitWindField.calculates3dBuildWindFactor(cursor = cursor,
                                                   dicOfBuildZoneGridPoint = dicOfBuildZoneGridPoint,
                                                   dz = dz,
-                                                  prefix = prefix)
+                                                  prefix = prefix,
+                                                  stretchingHeight = H_ob_max,
+                                                  stretchingRatio = verticalStretching)
     if debug or saveRockleZones:
         for t in dicOfBuildZone3DWindFactor:
             cursor.execute("""
@@ -510,6 +544,19 @@ def main(javaEnvironmentPath,
         if maxBuildZoneHeight > H_ob_max:
             maxHeight = maxBuildZoneHeight
     sketchHeight = maxHeight + verticalExtend
+    
+    # Report the grid size before the 3D fields are allocated
+    nPoints = InitWindField.gridSize(cursor = cursor, gridTable = gridPoint,
+                                     sketchHeight = sketchHeight, dz = dz,
+                                     stretchingHeight = H_ob_max,
+                                     stretchingRatio = verticalStretching)
+    nCells = nPoints[X] * nPoints[Y] * nPoints[Z]
+    textToSend = "Grid size: {0} x {1} x {2} = {3} cells ({4} MB per 3D field)"\
+        .format(nPoints[X], nPoints[Y], nPoints[Z], nCells,
+                round(nCells * np.dtype(precision).itemsize / 1e6, 1))
+    print(textToSend)
+    if feedback:
+        feedback.setProgressText(textToSend)
     vegetationWeightFactorTable = \
         InitWindField.calculates3dVegWindFactor(cursor = cursor,
                                                 dicOfVegZoneGridPoint = dicOfVegZoneGridPoint,
@@ -517,7 +564,9 @@ def main(javaEnvironmentPath,
                                                 z0 = z0,
                                                 d = d,
                                                 dz = dz,
-                                                prefix = prefix)
+                                                prefix = prefix,
+                                                stretchingHeight = H_ob_max,
+                                                stretchingRatio = verticalStretching)
     if debug or saveRockleZones:
         cursor.execute("""
            DROP TABLE IF EXISTS point3D_AllVegZone;
@@ -605,7 +654,9 @@ def main(javaEnvironmentPath,
                                           gridPoint = gridPoint,
                                           stackedBlocksWithBaseHeight = rotatedPropStackedBlocks,
                                           dz = dz,
-                                          tempoDirectory = tempoDirectory)
+                                          tempoDirectory = tempoDirectory,
+                                          stretchingHeight = H_ob_max,
+                                          stretchingRatio = verticalStretching)
     
     # Set the initial 3D wind speed field
     df_wind0, nPoints, verticalWindProfile = \
@@ -621,6 +672,8 @@ def main(javaEnvironmentPath,
                                           z_ref = z_ref,
                                           V_ref = v_ref, 
                                           tempoDirectory = tempoDirectory,
+                                          stretchingHeight = H_ob_max,
+                                          stretchingRatio = verticalStretching,
                                           d = d,
                                           H = Hr,
                                           lambda_f = lambda_f,
@@ -648,9 +701,21 @@ def main(javaEnvironmentPath,
     # (note that v axis direction is changed since we first use Röckle schemes
     # considering wind speed coming from North thus axis facing South)
     buildGrid3D = np.array([buildGrid3D.xs(i, level = 0).unstack().values for i in range(0,nx)])
-    u0 = np.array([df_wind0[U].xs(i, level = 0).unstack().values for i in range(0,nx)])
-    v0 = -np.array([df_wind0[V].xs(i, level = 0).unstack().values for i in range(0,nx)])
-    w0 = np.array([df_wind0[W].xs(i, level = 0).unstack().values for i in range(0,nx)])
+    # (the 3D fields are backed by files of the temporary directory if out-of-core)
+    if outOfCore:
+        memmapDirectory = tempoDirectory
+    else:
+        memmapDirectory = None
+    u0 = DataUtil.createArray(buildGrid3D.shape, dtype = precision,
+                              directory = memmapDirectory, name = "u0")
+    v0 = DataUtil.createArray(buildGrid3D.shape, dtype = precision,
+                              directory = memmapDirectory, name = "v0")
+    w0 = DataUtil.createArray(buildGrid3D.shape, dtype = precision,
+                              directory = memmapDirectory, name = "w0")
+    for i in range(0,nx):
+        u0[i] = df_wind0[U].xs(i, level = 0).unstack().values
+        v0[i] = -df_wind0[V].xs(i, level = 0).unstack().values
+        w0[i] = df_wind0[W].xs(i, level = 0).unstack().values
     
     # Identify all cells needing to be updated by the wind solver and store
     # their coordinates in a 1D array
@@ -667,11 +732,32 @@ def main(javaEnvironmentPath,
     # Identify building 3D coordinates
     buildingCoordinates = np.stack(np.where(buildGrid3D==0)).astype(np.int32)
     
+    # The initial wind field and building cells data frames are released 
+    # before the wind solver (they are larger than the 3D arrays they filled)
+    del df_wind0, df_gridBuil, buildGrid3D
+    
+    # Create local grid space coordinates (x, y, z)
+    Lx = (nx-1) * meshSize
+    Ly = (ny-1) * meshSize
+    x = np.linspace(0, Lx, nx)  
+    y = np.linspace(0, Ly, ny)
+    if verticalStretching == 1:
+        Lz = (nz-1) * dz
+        z = np.linspace(0, Lz, nz)
+        levelThicknesses = dz
+    else:
+        # Thickness of each level (the ground level having a dz thickness)
+        # used as vertical grid spacing by the solver and the outputs
+        levelThicknesses = np.concatenate([[dz],
+                                           InitWindField.levelHeights(maxHeight = sketchHeight,
+                                                                      dz = dz,
+                                                                      stretchingHeight = H_ob_max,
+                                                                      stretchingRatio = verticalStretching)[1]])
+        z = np.concatenate([[0.], np.cumsum(levelThicknesses[1:])])
+    
     # Interpolation is made in order to have wind speed located on the face of
     # each grid cell
-    u0[1:nx, :, :] =   (u0[0:nx-1, :, :] + u0[1:nx, :, :])/2
-    v0[:, 1:ny, :] =   (v0[:, 0:ny-1, :] + v0[:,1:ny,:])/2
-    w0[:, :, 1:nz] =   (w0[:, :, 0:nz-1] + w0[:, :, 1:nz])/2
+    DataUtil.centersToFaces(u0, v0, w0, dz = levelThicknesses)
     
     # Reset input and output wind speed to zero for building cells
     u0[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
@@ -681,14 +767,6 @@ def main(javaEnvironmentPath,
     w0[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
     w0[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]+1]=0
     
-    # Create local grid space coordinates (x, y, z)
-    Lz = (nz-1) * dz
-    Lx = (nx-1) * meshSize
-    Ly = (ny-1) * meshSize
-    x = np.linspace(0, Lx, nx)  
-    y = np.linspace(0, Ly, ny)
-    z = np.linspace(0, Lz, nz)
-    
     print("Time spent for wind speed initialization: {0} s".format(time.time()-timeStartCalculation))
     print("Shape: " + str(u0.shape) + " - " + "Nb cells: " + str(u0.shape[0] * u0.shape[1] * u0.shape[2]))
     # -------------------------------------------------------------------
@@ -701,25 +779,32 @@ def main(javaEnvironmentPath,
             return {}
     if not onlyInitialization:
         # Apply a mass-flow balance to have a more physical 3D wind speed field
-        u, v, w = \
+        u, v, w, solverHistory = \
             WindSolver.solver(  x = x                       , y = y                 , z = z,
-                                dx = meshSize               , dy = meshSize         , dz = dz,
+                                dx = meshSize               , dy = meshSize         , dz = levelThicknesses,
                                 u0 = u0                     , v0 = v0               , w0 = w0,
                                 buildingCoordinates = buildingCoordinates   , cells4Solver = cells4Solver,
                                 maxIterations = maxIterations, thresholdIterations = thresholdIterations,
-                                feedback = feedback)
+                                feedback = feedback         , solverMethod = solverMethod,
+                                precision = precision,
+                                lambdaCacheDirectory = tempoDirectory if lambdaCache else None,
+                                lambdaCacheInputs = {"windDirection": windDirection,
+                                                     "v_ref": v_ref, "z_ref": z_ref},
+                                relaxation = relaxation,
+                                gridSequencing = gridSequencing,
+                                memmapDirectory = memmapDirectory,
+                                freeStream = freeStream,
+                                lateralBoundary = lateralBoundary,
+                                historyFile = os.path.join(tempoDirectory, SOLVER_HISTORY_FILE)\
+                                    if debug else None)
     else:
         u = u0
         v = v0
         w = w0
         
     # Wind speed values are recentered to the middle of the cells
-    u[0:nx-1 ,0:ny-1 ,0:nz-1]=   (u[0:nx-1, 0:ny-1, 0:nz-1] + u[1:nx, 0:ny-1, 0:nz-1])/2
-    v[0:nx-1 ,0:ny-1, 0:nz-1]=   (v[0:nx-1, 0:ny-1, 0:nz-1] + v[0:nx-1, 1:ny, 0:nz-1])/2
-    w[0:nx-1, 0:ny-1, 0:nz-1]=   (w[0:nx-1, 0:ny-1, 0:nz-1] + w[0:nx-1, 0:ny-1, 1:nz])/2
-    u0[0:nx-1 ,0:ny-1 ,0:nz-1]=   (u0[0:nx-1, 0:ny-1, 0:nz-1] + u0[1:nx, 0:ny-1, 0:nz-1])/2
-    v0[0:nx-1 ,0:ny-1, 0:nz-1]=   (v0[0:nx-1, 0:ny-1, 0:nz-1] + v0[0:nx-1, 1:ny, 0:nz-1])/2
-    w0[0:nx-1, 0:ny-1, 0:nz-1]=   (w0[0:nx-1, 0:ny-1, 0:nz-1] + w0[0:nx-1, 0:ny-1, 1:nz])/2
+    DataUtil.facesToCenters(u, v, w)
+    DataUtil.facesToCenters(u0, v0, w0)
     
     # Reset input and output wind speed to zero for building cells
     u[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
@@ -758,17 +843,27 @@ def main(javaEnvironmentPath,
     
     x_rot = np.zeros((nx, ny))
     y_rot = np.zeros((nx, ny))
+    u_rot = DataUtil.createArray(u.shape, dtype = u.dtype,
+                                 directory = memmapDirectory, name = "u_rot")
+    v_rot = DataUtil.createArray(v.shape, dtype = v.dtype,
+                                 directory = memmapDirectory, name = "v_rot")
+    u0_rot = DataUtil.createArray(u0.shape, dtype = u0.dtype,
+                                  directory = memmapDirectory, name = "u0_rot")
+    v0_rot = DataUtil.createArray(v0.shape, dtype = v0.dtype,
+                                  directory = memmapDirectory, name = "v0_rot")
     x_rot, y_rot, u_rot, v_rot = rotateData(theta = -windDirection*np.pi/180, nx = nx, 
                                             ny = ny                         , nz = nz, 
                                             x = x                           , y = y,
                                             x_rot = x_rot                   , y_rot = y_rot,
-                                            u = u                           , v = v)
+                                            u = u                           , v = v,
+                                            u_rot = u_rot                   , v_rot = v_rot)
 
     x_rot, y_rot, u0_rot, v0_rot = rotateData(theta = -windDirection*np.pi/180  , nx = nx, 
                                               ny = ny                           , nz = nz, 
                                               x = x                             , y = y,
                                               x_rot = x_rot                     , y_rot = y_rot,
-                                              u = u0                            , v = v0)
+                                              u = u0                            , v = v0,
+                                              u_rot = u0_rot                    , v_rot = v0_rot)
     # Set the real (x,y) grid coordinates
     x_rot += rotationCenterCoordinates[0]
     y_rot += rotationCenterCoordinates[1]
@@ -784,7 +879,7 @@ def main(javaEnvironmentPath,
     
     dicVectorTables, netcdf_path =\
         saveData.saveBasicOutputs(cursor = cursor                , z_out = z_out,
-                                  dz = dz                        , u = u_rot,
+                                  dz = levelThicknesses          , u = u_rot,
                                   v = v_rot                      , w = w, 
                                   gridName = rotated_grid        , verticalWindProfile = verticalWindProfile,
                                   outputFilePath = outputFilePath, outputFilename = outputFilename,
@@ -796,7 +891,7 @@ def main(javaEnvironmentPath,
     if debug:
         dicVectorTables_ini, netcdf_path_ini =\
             saveData.saveBasicOutputs(cursor = cursor                , z_out = z_out,
-                                      dz = dz                        , u = u0_rot,
+                                      dz = levelThicknesses          , u = u0_rot,
                                       v = v0_rot                     , w = w0, 
                                       gridName = rotated_grid        , verticalWindProfile = verticalWindProfile,
                                       outputFilePath = tempoDirectory, outputFilename = "wind_initiatlisation",
@@ -811,10 +906,36 @@ def main(javaEnvironmentPath,
             buildingCoordinates, cursor, rotated_grid, rotationCenterCoordinates,\
             verticalWindProfile, dicVectorTables, netcdf_path, netcdf_path_ini
 
-@jit(nopython=True)
-def rotateData(theta, nx, ny, nz, x, y, x_rot, y_rot, u, v):
-    u_rot = np.zeros(u.shape)
-    v_rot = np.zeros(v.shape)
+def warmUpKernels(precision = PRECISION, solverMethod = SOLVER_METHOD):
+    """ Compiles the numba kernels of the wind calculation (or loads them from
+    the cache of compiled kernels), such as the first calculation does not
+    wait for their compilation (may be called in a background thread). The
+    kernels are compiled for the solver options used by the calculation 
+    (GlobalVariables) and for the argument types it uses.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            precision: String, default PRECISION
+                Floating point precision of the 3D arrays ("float64" or "float32")
+            solverMethod: String, default SOLVER_METHOD
+                Method used by the wind solver to iterate lambda
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            None"""
+    WindSolver.warmUp(precision = precision, solverMethod = solverMethod,
+                      relaxation = RELAXATION, gridSequencing = GRID_SEQUENCING,
+                      lambdaCache = LAMBDA_CACHE, freeStream = FREE_STREAM,
+                      lateralBoundary = LATERAL_BOUNDARY)
+    u = np.ones((2, 2, 2), dtype = precision)
+    rotateData(theta = 0., nx = 2, ny = 2, nz = 2, x = np.zeros(2), y = np.zeros(2),
+               x_rot = np.zeros((2, 2)), y_rot = np.zeros((2, 2)), u = u, v = u,
+               u_rot = np.zeros_like(u), v_rot = np.zeros_like(u))
+
+@jit(nopython=True, nogil=True, cache=True)
+def rotateData(theta, nx, ny, nz, x, y, x_rot, y_rot, u, v, u_rot, v_rot):
     rot = np.array([[math.cos(theta), -math.sin(theta)],
                     [math.sin(theta), math.cos(theta)]])
     xmax = x.max()
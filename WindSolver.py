@@ -12,14 +12,67 @@ Created on Mon Mar 29 14:57:25 2021
 # Department of Earth Sciences
 """
 import numpy as np
-import time
-from .GlobalVariables import MAX_ITERATIONS, THRESHOLD_ITERATIONS, DESCENDING_Y
-from numba import jit
 import pandas as pd
+import time
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .GlobalVariables import MAX_ITERATIONS, THRESHOLD_ITERATIONS, DESCENDING_Y,\
+    SOLVER_METHOD, LIST_OF_SOLVER_METHODS, MULTIGRID_SMOOTHER, MULTIGRID_PRE_SMOOTHING,\
+    MULTIGRID_POST_SMOOTHING, MULTIGRID_COARSEST_SWEEPS, MULTIGRID_MIN_CELLS,\
+    CG_PRECONDITIONER, LIST_OF_CG_PRECONDITIONERS, CONVERGENCE_CHECK_INTERVAL,\
+    GRID_SEQUENCING,\
+    DOMAIN_DECOMPOSITION_THREADS, SOLVER_THREADS,\
+    PRECISION, LIST_OF_PRECISIONS, RELAXATION, LIST_OF_RELAXATIONS,\
+    RELAXATION_ESTIMATION_ITERATIONS, TELEMETRY_INTERVAL, ITERATION_FIELD, EPS_FIELD,\
+    MAX_RESIDUAL_FIELD, DIVERGENCE_NORM_FIELD, CELLS_PER_SECOND_FIELD, ELAPSED_TIME_FIELD,\
+    TOP_BOUNDARY, LIST_OF_BOUNDARY_CONDITIONS, FREE_STREAM, FREE_STREAM_MARGIN,\
+    LATERAL_BOUNDARY, LIST_OF_LATERAL_BOUNDARY_CONDITIONS, LAMBDA_CACHE
+from .DataUtil import createArray
+import numba
+from numba import jit, prange
+from scipy import sparse
+
+try:
+    import pyamg
+except ImportError:
+    pyamg = None
+
+# Bits of the obstacle flags (one flag per cell) coding the coefficients of 
+# table 1 (Pardyjak et Brown, 2003): the coefficients e, f, g, h, m and n are 0
+# if their bit is set (1 otherwise) and the coefficients o, p and q are 0.5
+# if their bit is set (1 otherwise)
+FLAG_E = 1
+FLAG_F = 2
+FLAG_G = 4
+FLAG_H = 8
+FLAG_M = 16
+FLAG_N = 32
+FLAG_O = 64
+FLAG_P = 128
+FLAG_Q = 256
+
+# Lock held during the warm-up of the kernels: the parallel kernels can not be
+# launched from several threads at once, thus the solver waits for the end of
+# a warm-up running in another thread
+WARM_UP_LOCK = threading.RLock()
+# Whether the numba threading layer has been launched by 'initThreadingLayer'
+THREADING_LAYER_LAUNCHED = False
 
 def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver,
            maxIterations = MAX_ITERATIONS, thresholdIterations = THRESHOLD_ITERATIONS,
-           feedback = None):
+           feedback = None, solverMethod = SOLVER_METHOD,
+           multigridSmoother = MULTIGRID_SMOOTHER,
+           cgPreconditioner = CG_PRECONDITIONER, operator = None,
+           convergenceCheckInterval = CONVERGENCE_CHECK_INTERVAL,
+           precision = PRECISION, initialLambda = None,
+           lambdaCacheDirectory = None, relaxation = RELAXATION,
+           gridSequencing = GRID_SEQUENCING, memmapDirectory = None,
+           telemetry = None, telemetryInterval = TELEMETRY_INTERVAL,
+           historyFile = None, topBoundary = TOP_BOUNDARY,
+           lateralBoundary = LATERAL_BOUNDARY, freeStream = FREE_STREAM, freeStreamMargin = FREE_STREAM_MARGIN,
+           lambdaCacheInputs = None):
     """ Use the mass-balance solver minimizing the modification of the initial
     wind speed field. The method used is based on Pardyjak and Brown (2003).
     
@@ -41,8 +94,9 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver,
                 Grid spacing along X-axis
             dy: int
                 Grid spacing along Y-axis  
-            dz: int
-                Grid spacing along Z-axis
+            dz: int or 1D array
+                Grid spacing along Z-axis (thickness of each level for a 
+                vertically stretched grid)
             u0: 3D array
                 Initialized 3D wind speed value in X direction
             v0: 3D array
@@ -61,6 +115,102 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver,
                 threshold, the wind solver stops
             feedback: Qgis.core class QgsProcessingFeedback
                 Base class for providing feedback to QGIS from a processing algorithm (if not in standalone mode).
+            solverMethod: String, default SOLVER_METHOD
+                Method used to iterate lambda:
+                    -> "sor": sequential SOR, cells updated in the cells4Solver order
+                    -> "masked-sor": same as "sor" but the whole grid is swept
+                    in memory order, the cells which are not solved being 
+                    skipped using a mask (cells4Solver should be in memory order)
+                    -> "domain-decomposition": the grid is split into slabs
+                    along X-axis, each pair of slabs being iterated using SOR
+                    by a separate thread (the slabs updated simultaneously 
+                    being never neighbours)
+                    -> "red-black": checkerboard ordered SOR, cells of a same
+                    color being updated in parallel (uses all available cores)
+                    -> "line-sor": SOR of vertical lines, the cells of a column
+                    being solved together (tridiagonal system), columns of a
+                    same color of the horizontal checkerboard in parallel
+                    -> "multigrid": geometric multigrid V-cycles (one V-cycle 
+                    per iteration) initialized by a full multigrid cycle
+                    -> "cg": preconditioned conjugate gradient applied to the
+                    sparse matrix of the equation (thresholdIterations is then
+                    used on the residual norm relative to the initial divergence)
+            multigridSmoother: String, default MULTIGRID_SMOOTHER
+                Smoother used within the multigrid cycles ("sor" or "red-black")
+            cgPreconditioner: String, default CG_PRECONDITIONER
+                Preconditioner used by the conjugate gradient ("jacobi", "ic" or "amg")
+            operator: dictionary, default None
+                Operator of the lambda equation (such as returned by 
+                'solverOperator') for this geometry. If None, it is calculated.
+                Passing the same operator to several calls avoids to recalculate
+                it (and the multigrid levels or the conjugate gradient matrix
+                and preconditioner it stores once used) when only the initial
+                wind field changes
+            convergenceCheckInterval: int, default CONVERGENCE_CHECK_INTERVAL
+                Number of iterations between two checks of the stopping
+                condition (not used by the "cg" method)
+            precision: String, default PRECISION
+                Floating point precision of the 3D arrays ("float64" or "float32")
+            initialLambda: 3D array, default None
+                Lambda field used to initialize the solver (e.g. the solution of
+                a previous calculation on the same geometry). Only the values of
+                the solver cells are used. If None, lambda is initialized to 1
+                (or by a full multigrid cycle for the "multigrid" method)
+            lambdaCacheDirectory: String, default None
+                Directory where the resulting lambda field is saved (file named 
+                from the grid shape, spacings, buildings, boundary conditions
+                and 'lambdaCacheInputs'). If a lambda field corresponding to the
+                same grid, buildings and inputs has already been saved there, it
+                is used to initialize the solver (when 'initialLambda' is None).
+                If None, no lambda field is saved or loaded
+            relaxation: String, default RELAXATION
+                Way the SOR relaxation factor is set ("fixed", "adaptive" or
+                "chebyshev", the latter only for "red-black" and "line-sor")
+            gridSequencing: int, default GRID_SEQUENCING
+                Number of times the grid is coarsened (by 2 in each direction)
+                to solve lambda on coarse grids before the full-resolution 
+                solver, the solution of each grid initializing the next finer 
+                one (0 for no grid sequencing). Not used for "multigrid" (already
+                initialized by a full multigrid cycle) or when 'initialLambda' is given
+            memmapDirectory: String, default None
+                Directory where are saved the files backing (memory-mapped) 
+                the lambda, right-hand side, inverse diagonal and final wind 
+                speed arrays. If None, they are created in memory. The cells
+                of cells4Solver being ordered along X-axis, the "sor" sweeps 
+                read the files plane by plane
+            telemetry: function, default None
+                Function called with the record (dictionary having the 
+                columns of the convergence history as keys) each time the 
+                convergence state is recorded (e.g. to monitor the calculation
+                from another thread). If None, nothing is called
+            telemetryInterval: int, default TELEMETRY_INTERVAL
+                Number of iterations between two records of the convergence
+                state (the last iteration being always recorded)
+            historyFile: String, default None
+                Path of the CSV file where the convergence history is saved.
+                If None, it is not saved
+            topBoundary: String, default TOP_BOUNDARY
+                Boundary condition at the top of the domain: "dirichlet" 
+                (lambda = 0) or "neumann" (zero vertical gradient of lambda,
+                the vertical wind speed through the top face being not modified)
+            lateralBoundary: String, default LATERAL_BOUNDARY
+                Boundary condition of the lateral faces of the domain: 
+                "dirichlet" (lambda = 0), "neumann" (zero normal gradient of
+                lambda, the wind speed through the faces being not modified)
+                or "outflow" ("neumann" for the faces where the initial wind
+                enters the domain and "dirichlet" for the others)
+            freeStream: boolean, default FREE_STREAM
+                Whether only the levels below the free stream region (upper
+                levels having a horizontally uniform initial wind field and
+                no building) are solved, the wind speed of the upper levels
+                being the initial one
+            freeStreamMargin: int, default FREE_STREAM_MARGIN
+                Number of free stream levels included in the solved domain 
+                (its top having a "neumann" boundary condition)
+            lambdaCacheInputs: dictionary, default None
+                Inputs of the calculation which are not solver parameters 
+                (e.g. wind direction and speed) identifying the lambda field
+                saved in 'lambdaCacheDirectory'
         
     		Returns
     		_ _ _ _ _ _ _ _ _ _ 
@@ -70,8 +220,117 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver,
             v: 3D array
                 Updated 3D wind speed value in Y direction 
             w: 3D array
-                Updated 3D wind speed value in Z direction"""    
+                Updated 3D wind speed value in Z direction
+            history: pd.DataFrame
+                Convergence history of the solver, one row per record:
+                    -> ITERATION_FIELD: iteration number
+                    -> EPS_FIELD: relative variation of lambda (relative 
+                    residual for the "cg" method)
+                    -> MAX_RESIDUAL_FIELD: maximum absolute residual of the
+                    lambda equation
+                    -> DIVERGENCE_NORM_FIELD: root mean square of the 
+                    divergence of the wind field corresponding to lambda
+                    -> CELLS_PER_SECOND_FIELD: number of solver cells updated
+                    per second since the previous record
+                    -> ELAPSED_TIME_FIELD: time since the solver start (s)"""    
 
+    if solverMethod not in LIST_OF_SOLVER_METHODS:
+        raise ValueError("Unknown solver method '{0}', should be one of {1}"\
+                         .format(solverMethod, LIST_OF_SOLVER_METHODS))
+    if precision not in LIST_OF_PRECISIONS:
+        raise ValueError("Unknown precision '{0}', should be one of {1}"\
+                         .format(precision, LIST_OF_PRECISIONS))
+    if relaxation not in LIST_OF_RELAXATIONS:
+        raise ValueError("Unknown relaxation '{0}', should be one of {1}"\
+                         .format(relaxation, LIST_OF_RELAXATIONS))
+    if relaxation == "adaptive" and solverMethod not in ["sor", "masked-sor", "red-black", "line-sor"]:
+        raise ValueError("The 'adaptive' relaxation can only be used with the "+
+                         "'sor', 'masked-sor', 'red-black' or 'line-sor' solver methods")
+    if relaxation == "chebyshev" and solverMethod not in ["red-black", "line-sor"]:
+        raise ValueError("The 'chebyshev' relaxation can only be used with the "+
+                         "'red-black' or 'line-sor' solver methods")
+    if gridSequencing < 0:
+        raise ValueError("The number of grid sequencing levels should be positive or null")
+    if telemetryInterval < 1:
+        raise ValueError("The telemetry interval should be at least 1 iteration")
+    if topBoundary not in LIST_OF_BOUNDARY_CONDITIONS:
+        raise ValueError("Unknown top boundary condition '{0}', should be one of {1}"\
+                         .format(topBoundary, LIST_OF_BOUNDARY_CONDITIONS))
+    if lateralBoundary not in LIST_OF_LATERAL_BOUNDARY_CONDITIONS:
+        raise ValueError("Unknown lateral boundary condition '{0}', should be one of {1}"\
+                         .format(lateralBoundary, LIST_OF_LATERAL_BOUNDARY_CONDITIONS))
+    if DESCENDING_Y and solverMethod != "sor":
+        raise ValueError("Only the 'sor' solver method can be used with DESCENDING_Y")
+    if DESCENDING_Y and np.ndim(dz) > 0:
+        raise ValueError("DESCENDING_Y can only be used with a constant grid spacing along Z-axis")
+    # The coarse grids and the symmetric matrix of the equation are only 
+    # defined for a vertically uniform grid
+    if np.ndim(dz) > 0 and np.ptp(dz) > 0\
+        and (solverMethod in ["multigrid", "cg"] or gridSequencing > 0):
+        raise ValueError("The 'multigrid' and 'cg' solver methods and the grid sequencing "+
+                         "can not be used with a vertically stretched grid")
+    
+    # Waits for the end of the warm-up of the kernels if it is running (the
+    # first solver call launching the threading layer)
+    with WARM_UP_LOCK:
+        initThreadingLayer()
+    
+    # Only the levels below the free stream region are solved (with a 
+    # "neumann" top boundary condition such as the upper levels keep the
+    # initial wind speed)
+    if freeStream:
+        topLevel = freeStreamLevel(u0 = u0, v0 = v0, w0 = w0,
+                                   buildingCoordinates = buildingCoordinates)\
+            + freeStreamMargin
+        if topLevel < z.size - 1:
+            print("Free stream from the level {0}: the solver is applied to {1} levels out of {2}"\
+                  .format(topLevel - freeStreamMargin, topLevel + 1, z.size))
+            lowerShape = (x.size, y.size, topLevel + 1)
+            lowerWinds = []
+            for name, wind0 in [("u0", u0), ("v0", v0), ("w0", w0)]:
+                lowerWind = createArray(lowerShape, dtype = precision,
+                                        directory = memmapDirectory,
+                                        name = name + "Lower")
+                lowerWind[:] = wind0[:, :, :topLevel + 1]
+                lowerWinds.append(lowerWind)
+            if (operator is not None) and (operator["shape"] != lowerShape):
+                operator = None
+            uLower, vLower, wLower, history =\
+                solver(x = x, y = y, z = z[:topLevel + 1], dx = dx, dy = dy,
+                       dz = dz if np.ndim(dz) == 0 else dz[:topLevel + 1],
+                       u0 = lowerWinds[0], v0 = lowerWinds[1], w0 = lowerWinds[2],
+                       buildingCoordinates = buildingCoordinates[:, buildingCoordinates[2] <= topLevel],
+                       cells4Solver = cells4Solver[cells4Solver[:, 2] < topLevel],
+                       maxIterations = maxIterations, thresholdIterations = thresholdIterations,
+                       feedback = feedback, solverMethod = solverMethod,
+                       multigridSmoother = multigridSmoother,
+                       cgPreconditioner = cgPreconditioner, operator = operator,
+                       convergenceCheckInterval = convergenceCheckInterval,
+                       precision = precision,
+                       initialLambda = None if initialLambda is None\
+                           else initialLambda[:, :, :topLevel + 1],
+                       lambdaCacheDirectory = lambdaCacheDirectory,
+                       relaxation = relaxation, gridSequencing = gridSequencing,
+                       memmapDirectory = memmapDirectory, telemetry = telemetry,
+                       telemetryInterval = telemetryInterval, historyFile = historyFile,
+                       topBoundary = "neumann", lateralBoundary = lateralBoundary,
+                       freeStream = False, lambdaCacheInputs = lambdaCacheInputs)
+            
+            # The wind speed of the upper levels is the initial one (the 
+            # vertical wind speed through the top face of the solved domain
+            # being not modified by the "neumann" boundary condition), except
+            # for the first faces along X and Y axes (as in 'windFromLambda')
+            u = createArray(u0.shape, dtype = precision, directory = memmapDirectory, name = "uDomain")
+            v = createArray(u0.shape, dtype = precision, directory = memmapDirectory, name = "vDomain")
+            w = createArray(u0.shape, dtype = precision, directory = memmapDirectory, name = "wDomain")
+            for wind, windLower in [(u, uLower), (v, vLower), (w, wLower)]:
+                wind[:, :, :topLevel] = windLower[:, :, :topLevel]
+            u[1:, :, topLevel:] = u0[1:, :, topLevel:]
+            v[:, 1:, topLevel:] = v0[:, 1:, topLevel:]
+            w[:, :, topLevel:] = w0[:, :, topLevel:]
+            
+            return u, v, w, history
+    
     print("Start to apply the wind solver")
     timeStartCalculation = time.time()
 
@@ -80,155 +339,615 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver,
     ny = y.size
     nz = z.size
     
-    # Create empty matrix for the 3D wind speed calculation
-    u = np.zeros((nx, ny, nz))
-    v = np.zeros((nx, ny, nz))
-    w = np.zeros((nx, ny, nz))
-
-    # Preallocating lambda and lambda + 1 and set values to 0 on sketch boundaries
-    lambdaN = np.ones([nx, ny, nz])
-    lambdaN1 = np.ones([nx, ny, nz])
-    lambdaN[0, :, :] = 0.
-    lambdaN[:, 0, :] = 0.
-    lambdaN[:, :, 0] = 0.
-    lambdaN[-1, :, :] = 0.
-    lambdaN[:, -1, :] = 0.
-    lambdaN[:, :, -1] = 0.
-    lambdaN1[0, :, :] = 0.
-    lambdaN1[:, 0, :] = 0.
-    lambdaN1[:, :, 0] = 0.
-    lambdaN1[-1, :, :] = 0.
-    lambdaN1[:, -1, :] = 0.
-    lambdaN1[:, :, -1] = 0.
-
-    Xi = ((np.cos(np.pi / nx) + (dx / dy) ** 2 * np.cos(np.pi / ny)) / (1 + (dx / dy) ** 2)) ** 2
-
-    omega = 2. * ((1 - np.sqrt(1 - Xi)) / Xi)
-    if (omega < 1) or (omega > 2):
-        omega = 1.78
+    # Initial wind speeds are used in the solver precision
+    u0 = np.asarray(u0, dtype = precision)
+    v0 = np.asarray(v0, dtype = precision)
+    w0 = np.asarray(w0, dtype = precision)
+    
+    # Preallocating lambda and set values to 0 on sketch boundaries
+    lambdaN1 = createArray((nx, ny, nz), dtype = precision,
+                           directory = memmapDirectory, name = "lambdaN1")
+    lambdaN1[1:-1, 1:-1, 1:-1] = 1.
+    
+    # Initialize lambda from a previous solution if available
+    if lambdaCacheDirectory is not None:
+        lambdaCacheFile = lambdaCachePath(directory = lambdaCacheDirectory,
+                                          nx = nx, ny = ny, nz = nz,
+                                          dx = dx, dy = dy, dz = dz,
+                                          buildingCoordinates = buildingCoordinates,
+                                          topBoundary = topBoundary,
+                                          lateralBoundary = lateralBoundary,
+                                          inputs = lambdaCacheInputs)
+        if initialLambda is None and os.path.isfile(lambdaCacheFile):
+            print("Lambda initialized from the file {0}".format(lambdaCacheFile))
+            initialLambda = np.load(lambdaCacheFile)
+    if initialLambda is not None:
+        if initialLambda.shape != (nx, ny, nz):
+            raise ValueError("The initial lambda shape {0} does not correspond to the grid shape {1}"\
+                             .format(initialLambda.shape, (nx, ny, nz)))
+        i, j, k = cells4Solver[:, 0], cells4Solver[:, 1], cells4Solver[:, 2]
+        lambdaN1[i, j, k] = initialLambda[i, j, k]
 
     # Coefficients such as defined in Pardyjak et Brown (2003) 
     alpha1 = 1.
     alpha2 = 1.
-    eta = alpha1 / alpha2
-    A = dx ** 2 / dy ** 2
-    B = eta ** 2 * dx ** 2 / dz ** 2
+    
+    # Condition of each lateral face (lower and upper X, lower and upper Y)
+    # (the ground being a wall, at least one face should be "dirichlet")
+    lateralBoundaries = lateralFaceConditions(lateralBoundary = lateralBoundary,
+                                              u0 = u0, v0 = v0)
+    if topBoundary == "neumann" and "dirichlet" not in lateralBoundaries:
+        raise ValueError("At least one boundary of the domain should have a 'dirichlet' condition")
+    
+    # The residual of the lambda equation is the divergence of the wind
+    # field multiplied by the factor used for the right-hand side
+    divergenceFactor = 1. / (2. * alpha1 ** 2 * dx ** 2)
+    history = []
 
-    # Set coefficients according to table 1 (Pardyjak et Brown, 2003) 
-    # to modify the Equation near obstacles
-    e = np.ones([nx, ny, nz])
-    f = np.ones([nx, ny, nz])
-    g = np.ones([nx, ny, nz])
-    h = np.ones([nx, ny, nz])
-    m = np.ones([nx, ny, nz])
-    n = np.ones([nx, ny, nz])
-    o = np.ones([nx, ny, nz])
-    p = np.ones([nx, ny, nz])
-    q = np.ones([nx, ny, nz])
-    
-    # Identify index having wall below AND front, left, right or behind
-    indBelow = pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0], 
-                                                    buildingCoordinates[1], 
-                                                    buildingCoordinates[2] + 1])))
-    indBelowFront = indBelow.intersection(pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0], 
-                                                                               buildingCoordinates[1] - 1, 
-                                                                               buildingCoordinates[2]]))))
-    indBelowBehind = indBelow.intersection(pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0], 
-                                                                               buildingCoordinates[1] + 1, 
-                                                                               buildingCoordinates[2]]))))
-    indBelowLeft = indBelow.intersection(pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0] + 1, 
-                                                                               buildingCoordinates[1], 
-                                                                               buildingCoordinates[2]]))))
-    indBelowRight = indBelow.intersection(pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0] - 1, 
-                                                                               buildingCoordinates[1], 
-                                                                               buildingCoordinates[2]]))))
-    indBelowAnyAround = indBelowFront.union(indBelowBehind).union(indBelowLeft).union(indBelowRight)
-    indBelowLeftRight = indBelowLeft.union(indBelowRight)
-    indBelowFrontBehind = indBelowFront.union(indBelowBehind)  
+    # Set the operator of the lambda equation (it only depends on the geometry)
+    if operator is None:
+        operator = solverOperator(nx = nx, ny = ny, nz = nz, dx = dx, dy = dy, dz = dz,
+                                  buildingCoordinates = buildingCoordinates,
+                                  cells4Solver = cells4Solver,
+                                  alpha1 = alpha1, alpha2 = alpha2,
+                                  precision = precision,
+                                  memmapDirectory = memmapDirectory,
+                                  topBoundary = topBoundary,
+                                  lateralBoundaries = lateralBoundaries)
+    elif operator["shape"] != (nx, ny, nz):
+        raise ValueError("The solver operator shape {0} does not correspond to the grid shape {1}"\
+                         .format(operator["shape"], (nx, ny, nz)))
+    elif (operator["topBoundary"], operator["lateralBoundaries"]) != (topBoundary, lateralBoundaries):
+        raise ValueError("The solver operator boundary conditions {0} do not correspond to {1}"\
+                         .format((operator["topBoundary"], operator["lateralBoundaries"]),
+                                 (topBoundary, lateralBoundaries)))
+    flags = operator["flags"]
+    invDiag = operator["invDiag"]
+    A = operator["A"]
+    B = operator["B"]
+    omega = operator["omega"]
     
-    # Go descending order along y
-    if DESCENDING_Y:
-        e[buildingCoordinates[0] + 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.
-        e[indBelowLeft.get_level_values(0), indBelowLeft.get_level_values(1), indBelowLeft.get_level_values(2)] = 0.
-        f[buildingCoordinates[0] - 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.
-        f[indBelowRight.get_level_values(0), indBelowRight.get_level_values(1), indBelowRight.get_level_values(2)] = 0. 
-        g[buildingCoordinates[0], buildingCoordinates[1] + 1, buildingCoordinates[2]] = 0.
-        g[indBelowBehind.get_level_values(0), indBelowBehind.get_level_values(1), indBelowBehind.get_level_values(2)] = 0.
-        h[buildingCoordinates[0], buildingCoordinates[1] - 1, buildingCoordinates[2]] = 0.  
-        h[indBelowFront.get_level_values(0), indBelowFront.get_level_values(1), indBelowFront.get_level_values(2)] = 0.
-        m[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] + 1] = 0.
-        n[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] - 1] = 0.
-    else:    
-        e[buildingCoordinates[0] - 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.
-        e[indBelowRight.get_level_values(0), indBelowRight.get_level_values(1), indBelowRight.get_level_values(2)] = 0.        
-        f[buildingCoordinates[0] + 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.
-        f[indBelowLeft.get_level_values(0), indBelowLeft.get_level_values(1), indBelowLeft.get_level_values(2)] = 0.    
-        g[buildingCoordinates[0], buildingCoordinates[1] - 1, buildingCoordinates[2]] = 0.
-        g[indBelowFront.get_level_values(0), indBelowFront.get_level_values(1), indBelowFront.get_level_values(2)] = 0.
-        h[buildingCoordinates[0], buildingCoordinates[1] + 1, buildingCoordinates[2]] = 0.
-        h[indBelowBehind.get_level_values(0), indBelowBehind.get_level_values(1), indBelowBehind.get_level_values(2)] = 0.
-        m[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] - 1] = 0.
-        n[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] + 1] = 0.
-    
-    o[buildingCoordinates[0] - 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.5
-    o[buildingCoordinates[0] + 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.5
-    p[buildingCoordinates[0], buildingCoordinates[1] - 1, buildingCoordinates[2]] = 0.5
-    p[buildingCoordinates[0], buildingCoordinates[1] + 1, buildingCoordinates[2]] = 0.5
-    q[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] + 1] = 0.5
-    q[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] - 1] = 0.5
-    n[indBelowAnyAround.get_level_values(0), indBelowAnyAround.get_level_values(1), indBelowAnyAround.get_level_values(2)] = 0.
-    o[indBelowLeftRight.get_level_values(0), indBelowLeftRight.get_level_values(1), indBelowLeftRight.get_level_values(2)] = 0.5
-    p[indBelowFrontBehind.get_level_values(0), indBelowFrontBehind.get_level_values(1), indBelowFrontBehind.get_level_values(2)] = 0.5
-    q[indBelowAnyAround.get_level_values(0), indBelowAnyAround.get_level_values(1), indBelowAnyAround.get_level_values(2)] = 0.5
+    # Right-hand side of the lambda equation (calculated once for all iterations)
+    rhs = divergenceRhs(cells4Solver = cells4Solver, u0 = u0, v0 = v0, w0 = w0,
+                        dx = dx, dy = dy, dz = dz, alpha1 = alpha1,
+                        rhs = createArray((nx, ny, nz), dtype = precision,
+                                          directory = memmapDirectory, name = "rhs"))
+    
+    # Lambda being proportional to the right-hand side, the initial lambda 
+    # is rescaled to the current initial wind field
+    if initialLambda is not None:
+        lambdaN1 = scaleInitialLambda(operator = operator, lam = lambdaN1, rhs = rhs)
+    
+    # For grid sequencing, lambda is initialized by solving the equation
+    # on coarser grids (the same grids as for multigrid)
+    if gridSequencing > 0 and solverMethod != "multigrid" and initialLambda is None:
+        if "levels" not in operator:
+            operator["levels"] = multigridLevels(buildingCoordinates = buildingCoordinates,
+                                                 cells4Solver = cells4Solver,
+                                                 flags = flags, invDiag = invDiag,
+                                                 A = A, B = B, topBoundary = topBoundary,
+                                                 lateralBoundaries = lateralBoundaries)
+        lambdaN1 = nestedInitialization(levels = multigridWorkspace(operator["levels"][:gridSequencing + 1]),
+                                        lambdaN1 = lambdaN1, rhs = rhs,
+                                        maxIterations = maxIterations,
+                                        thresholdIterations = thresholdIterations)
+    
+    # For red-black ordering, split the cells into two colors: a cell only
+    # has neighbours of the other color, thus each color can be updated in parallel
+    if solverMethod == "red-black":
+        if "redCells" not in operator:
+            operator["redCells"], operator["blackCells"] = splitRedBlack(cells4Solver)
+    
+    # For masked SOR, identify the solver cells by a mask of the grid
+    elif solverMethod == "masked-sor":
+        if "mask" not in operator:
+            operator["mask"] = solverMask(shape = (nx, ny, nz), cells4Solver = cells4Solver,
+                                          memmapDirectory = memmapDirectory)
+    
+    # For domain decomposition, starts the threads iterating each slab
+    elif solverMethod == "domain-decomposition":
+        slabs = startSlabWorkers(lam = lambdaN1, rhs = rhs, invDiag = invDiag,
+                                 flags = flags, cells4Solver = cells4Solver,
+                                 omega = omega, A = A, B = B)
+        print("Domain decomposition in {0} slabs along X-axis ({1} threads)"\
+              .format(2 * len(slabs["firstSlabs"]), len(slabs["firstSlabs"])))
+    
+    # For line SOR, identify the vertical lines of consecutive solver cells
+    # and split them into two colors (according to their horizontal position)
+    elif solverMethod == "line-sor":
+        if "lineCells" not in operator:
+            operator["lineCells"], operator["redLines"], operator["blackLines"] =\
+                verticalLines(cells4Solver)
+        omega = relaxationFactor(jacobiSpectralRadius(nx = nx, ny = ny, nz = nz,
+                                                      A = A, B = B, lines = True))
+    
+    # For multigrid, creates the coarse grids and initializes lambda using
+    # a full multigrid cycle
+    elif solverMethod == "multigrid":
+        if multigridSmoother not in ["sor", "red-black"]:
+            raise ValueError("Unknown multigrid smoother '{0}'".format(multigridSmoother))
+        if "levels" not in operator:
+            operator["levels"] = multigridLevels(buildingCoordinates = buildingCoordinates,
+                                                 cells4Solver = cells4Solver,
+                                                 flags = flags, invDiag = invDiag,
+                                                 A = A, B = B, topBoundary = topBoundary,
+                                                 lateralBoundaries = lateralBoundaries)
+        levels = multigridWorkspace(operator["levels"])
+        print("Multigrid solver using {0} levels (coarsest shape: {1})"\
+              .format(len(levels), levels[-1]["shape"]))
+        if initialLambda is None:
+            lambdaN1 = fullMultigrid(levels = levels, lambdaN1 = lambdaN1, rhs = rhs,
+                                     smoother = multigridSmoother)
+    
+    # For the conjugate gradient, the sparse matrix of the equation is solved
+    # directly (iterations and stopping criterion are managed within the Krylov solver)
+    elif solverMethod == "cg":
+        if cgPreconditioner not in LIST_OF_CG_PRECONDITIONERS:
+            raise ValueError("Unknown conjugate gradient preconditioner '{0}', should be one of {1}"\
+                             .format(cgPreconditioner, LIST_OF_CG_PRECONDITIONERS))
+        lambdaN1 = krylovSolve(operator = operator, lam = lambdaN1, rhs = rhs,
+                               preconditioner = cgPreconditioner,
+                               maxIterations = maxIterations,
+                               thresholdIterations = thresholdIterations,
+                               feedback = feedback, history = history,
+                               telemetry = telemetry,
+                               telemetryInterval = telemetryInterval,
+                               divergenceFactor = divergenceFactor,
+                               timeStart = timeStartCalculation)
        
-    for N in range(maxIterations):
-        print("Iteration {0} (max {1})".format( N + 1, 
-                                                maxIterations))
-        lambdaN = np.copy(lambdaN1)
+    # Set the relaxation of the SOR based methods
+    estimatingOmega = False
+    if solverMethod in ["sor", "masked-sor", "domain-decomposition",
+                        "red-black", "line-sor"]:
+        if relaxation == "adaptive":
+            # Starts from Gauss-Seidel iterations, omega being updated after
+            # each series of iterations until it stabilizes
+            omega = 1.
+            changes = []
+            estimatingOmega = True
+            print("SOR relaxation factor estimated every {0} iterations"\
+                  .format(RELAXATION_ESTIMATION_ITERATIONS))
+        elif relaxation == "chebyshev":
+            # Square of the spectral radius of the Jacobi iteration
+            rhoJacobi2 = jacobiSpectralRadius(nx = nx, ny = ny, nz = nz, A = A, B = B,
+                                              lines = solverMethod == "line-sor") ** 2
+            omega = 1.
+            print("SOR relaxation factor: Chebyshev acceleration (from 1 to {0})"\
+                  .format(np.round(relaxationFactor(rhoJacobi2 ** 0.5), 4)))
+        else:
+            print("SOR relaxation factor: {0}".format(np.round(omega, 4)))
+            
+    if solverMethod != "cg":
+        # Sum of the absolute lambda values of the cells which are not solved
+        # (constant over iterations, needed for the relative variation of lambda)
+        fixedNorm = fixedLambdaNorm(cells4Solver, lambdaN1)
+        # Number of cell updates of an iteration
+        cellsPerIteration = cells4Solver.shape[0]
+        # Previous lambda, only kept by the methods which do not calculate
+        # the variation of lambda within their sweeps
+        if solverMethod == "multigrid" or (solverMethod == "sor" and DESCENDING_Y):
+            lambdaN = createArray((nx, ny, nz), dtype = precision,
+                                  directory = memmapDirectory, name = "lambdaN")
+        # (no iteration and no variation of lambda if maxIterations is 0)
+        N = -1
+        eps = np.inf
+        nextFeedback = 0
+        timeStartIterations = time.time()
+        for N in range(maxIterations):
+            # The convergence is only checked every 'convergenceCheckInterval' 
+            # iterations and when the convergence state is recorded
+            recordHistory = ((N + 1) % telemetryInterval == 0) or (N == maxIterations - 1)
+            checkConvergence = ((N + 1) % convergenceCheckInterval == 0) or recordHistory
+            
+            # The sums of the absolute variation of lambda and of the absolute
+            # lambda values are calculated within the sweeps (except for 
+            # multigrid and descending order where the previous lambda is kept)
+            if solverMethod == "multigrid":
+                if checkConvergence:
+                    np.copyto(lambdaN, lambdaN1)
+                lambdaN1 = multigridCycle(levels = levels, level = 0, lam = lambdaN1,
+                                          rhs = rhs, smoother = multigridSmoother)
+                if checkConvergence:
+                    change, norm = changeNorms(cells4Solver, lambdaN1, lambdaN)
+            elif solverMethod == "red-black":
+                change = 0.
+                norm = 0.
+                for colorCells in [operator["redCells"], operator["blackCells"]]:
+                    colorChange, colorNorm = smoothColor(colorCells, lambdaN1, rhs,
+                                                         invDiag, flags, omega, A, B)
+                    change += colorChange
+                    norm += colorNorm
+                    if relaxation == "chebyshev":
+                        omega = chebyshevOmega(omega, rhoJacobi2, firstHalfSweep = N == 0\
+                                               and colorCells is operator["redCells"])
+            elif solverMethod == "line-sor":
+                change = 0.
+                norm = 0.
+                for colorLines in [operator["redLines"], operator["blackLines"]]:
+                    colorChange, colorNorm = smoothLines(colorLines, operator["lineCells"],
+                                                         lambdaN1, rhs, invDiag, flags,
+                                                         omega, A, B)
+                    change += colorChange
+                    norm += colorNorm
+                    if relaxation == "chebyshev":
+                        omega = chebyshevOmega(omega, rhoJacobi2, firstHalfSweep = N == 0\
+                                               and colorLines is operator["redLines"])
+            elif solverMethod == "masked-sor":
+                change, norm = smoothSorMasked(operator["mask"], lambdaN1, rhs, invDiag,
+                                               flags, omega, A, B)
+            elif solverMethod == "domain-decomposition":
+                change, norm = slabIteration(slabs)
+            elif DESCENDING_Y:
+                np.copyto(lambdaN, lambdaN1)
+                lambdaN1 = calcLambda(cells4Solver, lambdaN, lambdaN1, omega, alpha1,
+                                      u0, v0, w0, dx, dy, dz, flags,
+                                      DESCENDING_Y, A, B)
+                change, norm = changeNorms(cells4Solver, lambdaN1, lambdaN)
+            else:
+                change, norm = smoothSor(cells4Solver, lambdaN1, rhs, invDiag, flags,
+                                         omega, A, B)
+            
+            # Updates the relaxation factor from the last iterations
+            if estimatingOmega:
+                changes.append(change)
+                if len(changes) == RELAXATION_ESTIMATION_ITERATIONS:
+                    newOmega = estimateOmega(changes, omega)
+                    changes = []
+                    # Stops the estimation once omega does not evolve significantly
+                    estimatingOmega = (newOmega - omega) > 0.05 * (2 - newOmega)
+                    omega = newOmega
+                    print("SOR relaxation factor: {0}".format(np.round(omega, 4)))
+                    if feedback is not None:
+                        feedback.setProgressText("SOR relaxation factor: {0}"\
+                                                 .format(np.round(omega, 4)))
+            
+            if not checkConvergence:
+                continue
+        
+            # Calculate how much lambda evolves between 2 consecutive iterations
+            eps = change / (norm + fixedNorm)
+            
+            # Record the convergence state
+            if recordHistory or eps < thresholdIterations:
+                maxResidual, squaredResidual = residualNorms(cells4Solver, lambdaN1,
+                                                             rhs, invDiag, flags, A, B)
+                recordConvergence(history = history, telemetry = telemetry,
+                                  iteration = N + 1, eps = eps,
+                                  maxResidual = maxResidual,
+                                  divergenceNorm = divergenceFactor\
+                                      * np.sqrt(squaredResidual / cells4Solver.shape[0]),
+                                  cellsPerIteration = cellsPerIteration,
+                                  timeStart = timeStartCalculation,
+                                  timeStartIterations = timeStartIterations)
+        
+            # Check if the condition for ending process is reached
+            if eps < thresholdIterations:
+                break
+            # Feedback (console and QGIS) every 50 iterations
+            elif N >= nextFeedback:
+                nextFeedback = N + 50
+                textToSend = "Iteration {0} (max {1}) - eps = {2} >= {3}"\
+                    .format(N + 1, maxIterations, np.round(eps,6), thresholdIterations)
+                print(textToSend)
+                if feedback is not None:
+                    feedback.setProgressText(textToSend)
+                    if feedback.isCanceled():
+                        feedback.setProgressText("Calculation cancelled by user")
+                        break
+        if feedback is not None:
+            feedback.setProgressText("Solver stopped after {0} iterations (eps = {1:.2e})"\
+                                     .format(N + 1, eps))
+    
+    
+    if solverMethod == "domain-decomposition":
+        lambdaN1 = stopSlabWorkers(slabs)
+    
+    # Zero normal gradient of lambda at the "neumann" boundaries, such as
+    # the wind speed through these faces is not modified
+    if topBoundary == "neumann":
+        lambdaN1[:, :, -1] = lambdaN1[:, :, -2]
+    for (axis, side), condition in zip([(0, 0), (0, -1), (1, 0), (1, -1)], lateralBoundaries):
+        if condition == "neumann":
+            boundarySlice = [slice(None)] * 3
+            boundarySlice[axis] = side
+            innerSlice = [slice(None)] * 3
+            innerSlice[axis] = 1 if side == 0 else -2
+            lambdaN1[tuple(boundarySlice)] = lambdaN1[tuple(innerSlice)]
+    
+    # Save lambda to initialize the next calculations on the same geometry
+    if lambdaCacheDirectory is not None:
+        np.save(lambdaCacheFile, lambdaN1)
+    
+    # Calculates the final wind speed
+    u, v, w = windFromLambda(u0 = u0, v0 = v0, w0 = w0, lam = lambdaN1,
+                             dx = dx, dy = dy, dz = dz,
+                             buildingCoordinates = buildingCoordinates,
+                             alpha1 = alpha1, alpha2 = alpha2,
+                             memmapDirectory = memmapDirectory)
+
+    # Convergence history (saved if needed)
+    history = pd.DataFrame(history, columns = [ITERATION_FIELD, EPS_FIELD, MAX_RESIDUAL_FIELD,
+                                               DIVERGENCE_NORM_FIELD, CELLS_PER_SECOND_FIELD,
+                                               ELAPSED_TIME_FIELD])
+    if historyFile is not None:
+        history.to_csv(historyFile, index = False)
 
-        lambdaN1 = calcLambda(cells4Solver, lambdaN, lambdaN1, omega, alpha1,
-                              u0, v0, w0, dx, dy, dz, e, f, g, h, m, n, o, p, q,
-                              DESCENDING_Y, A, B)
+    print("Time spent by the wind speed solver: {0} s".format(time.time()-timeStartCalculation))
+    
+    return u, v, w, history
+
+def solveCases(cases, nThreads = SOLVER_THREADS, **solverParameters):
+    """ Applies the wind solver to several cases (e.g. several wind directions)
+    simultaneously using a pool of threads of the current process. The numba
+    kernels releasing the GIL, the cases are solved in parallel. The parallel
+    kernels (used by the "red-black", "line-sor", "multigrid" and "cg" methods,
+    the grid sequencing and the lambda initialization) can not be launched 
+    from several threads at once (the numba threading layers abort or hang),
+    thus the cases using them are solved one after the other by the calling
+    thread.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            cases: list of dictionaries
+                Parameters of 'solver' specific to each case (e.g. "x", "y", 
+                "z", "dx", "dy", "dz", "u0", "v0", "w0", "buildingCoordinates",
+                "cells4Solver")
+            nThreads: int, default SOLVER_THREADS
+                Maximum number of cases solved simultaneously (all available
+                cores if 0)
+            **solverParameters: 
+                Parameters of 'solver' common to all cases
         
-        # Calculate how much lambda evolves between 2 consecutive iterations                                      
-        eps = np.sum(np.abs(lambdaN1 - lambdaN)) / np.sum(np.abs(lambdaN1))
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            results: list of tuples
+                (u, v, w, history) wind speed fields and convergence history
+                of each case (same order as 'cases')"""
+    if nThreads == 0:
+        nThreads = os.cpu_count()
+    if any(usesParallelKernels(**dict(solverParameters, **case)) for case in cases):
+        print("The solver options use parallel kernels: the cases are solved one after the other")
+        return [solver(**case, **solverParameters) for case in cases]
+    with ThreadPoolExecutor(max_workers = nThreads) as executor:
+        futures = [executor.submit(solver, **case, **solverParameters) for case in cases]
         
-        # Check if the condition for ending process is reached
-        if eps < thresholdIterations:
+        return [future.result() for future in futures]
+
+def usesParallelKernels(solverMethod = SOLVER_METHOD, gridSequencing = GRID_SEQUENCING,
+                        initialLambda = None, lambdaCacheDirectory = None, **otherParameters):
+    """ Identifies whether the wind solver launches parallel numba kernels for
+    the given parameters of 'solver'.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            solverMethod: String, default SOLVER_METHOD
+                Method used to iterate lambda
+            gridSequencing: int, default GRID_SEQUENCING
+                Number of grid sequencing levels
+            initialLambda: 3D array, default None
+                Lambda field used to initialize the solver
+            lambdaCacheDirectory: String, default None
+                Directory where the lambda fields are saved and loaded
+            **otherParameters:
+                Other parameters of 'solver' (not used)
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            parallel: boolean
+                Whether parallel kernels are used"""
+    return solverMethod in ["red-black", "line-sor", "multigrid", "cg"]\
+        or gridSequencing > 0 or initialLambda is not None\
+        or lambdaCacheDirectory is not None or DESCENDING_Y
+
+def batchSolver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver,
+                maxIterations = MAX_ITERATIONS, thresholdIterations = THRESHOLD_ITERATIONS,
+                feedback = None, operator = None, precision = PRECISION):
+    """ Applies the SOR mass-balance solver (same as 'solver' with the "sor"
+    method) to several initial wind fields of a same geometry at once (e.g.
+    an ensemble of inflow profiles). Each sweep updates the lambda of all
+    the initial wind fields of a cell at once, the coefficients of the
+    equation being loaded once for all of them. The iterations of an initial
+    wind field stop once its own stopping condition is reached.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            x: 1D array
+                X-axis cell coordinates in a local reference system (starting from 0)
+            y: 1D array
+                Y-axis cell coordinates in a local reference system (starting from 0)   
+            z: 1D array
+                Z-axis cell coordinates in a local reference system (starting from 0)
+            dx: int
+                Grid spacing along X-axis
+            dy: int
+                Grid spacing along Y-axis  
+            dz: int or 1D array
+                Grid spacing along Z-axis (thickness of each level for a 
+                vertically stretched grid)
+            u0: 4D array
+                Initialized 3D wind speed values in X direction (one 3D field
+                per element of the first axis)
+            v0: 4D array
+                Initialized 3D wind speed values in Y direction (one 3D field
+                per element of the first axis)
+            w0: 4D array
+                Initialized 3D wind speed values in Z direction (one 3D field
+                per element of the first axis)
+            buildingCoordinates: 3D array
+                Building 3D coordinates
+            cells4Solver: 1D array
+                Array of 3D cell coordinates for which the wind solver is applied
+            maxIterations: int, default MAX_ITERATIONS
+                Maximum number of wind solver iterations (solver stops if reached)
+            thresholdIterations: float, default THRESHOLD_ITERATIONS
+                Threshold for stopping wind solver (for each initial wind 
+                field): when the relative variation of lambda between 2 
+                iterations goes under this threshold
+            feedback: Qgis.core class QgsProcessingFeedback
+                Base class for providing feedback to QGIS from a processing algorithm (if not in standalone mode).
+            operator: dictionary, default None
+                Operator of the lambda equation (such as returned by 
+                'solverOperator') for this geometry. If None, it is calculated
+            precision: String, default PRECISION
+                Floating point precision of the 3D arrays ("float64" or "float32")
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            u: 4D array
+                Updated 3D wind speed values in X direction
+            v: 4D array
+                Updated 3D wind speed values in Y direction 
+            w: 4D array
+                Updated 3D wind speed values in Z direction"""
+    if precision not in LIST_OF_PRECISIONS:
+        raise ValueError("Unknown precision '{0}', should be one of {1}"\
+                         .format(precision, LIST_OF_PRECISIONS))
+    if DESCENDING_Y:
+        raise ValueError("The batch solver can not be used with DESCENDING_Y")
+    
+    print("Start to apply the wind solver to {0} initial wind fields".format(len(u0)))
+    timeStartCalculation = time.time()
+    
+    nx = x.size
+    ny = y.size
+    nz = z.size
+    nFields = len(u0)
+    u0 = np.asarray(u0, dtype = precision)
+    v0 = np.asarray(v0, dtype = precision)
+    w0 = np.asarray(w0, dtype = precision)
+    
+    if operator is None:
+        operator = solverOperator(nx = nx, ny = ny, nz = nz, dx = dx, dy = dy, dz = dz,
+                                  buildingCoordinates = buildingCoordinates,
+                                  cells4Solver = cells4Solver,
+                                  precision = precision)
+    elif operator["shape"] != (nx, ny, nz):
+        raise ValueError("The solver operator shape {0} does not correspond to the grid shape {1}"\
+                         .format(operator["shape"], (nx, ny, nz)))
+    
+    # The initial wind fields are the last axis of the lambda and right-hand
+    # side arrays, such as the values of a cell are contiguous in memory
+    rhs = np.zeros((nx, ny, nz, nFields), dtype = precision)
+    for f in range(nFields):
+        rhs[:, :, :, f] = divergenceRhs(cells4Solver = cells4Solver, u0 = u0[f],
+                                        v0 = v0[f], w0 = w0[f], dx = dx, dy = dy,
+                                        dz = dz, alpha1 = 1.)
+    lam = np.ones((nx, ny, nz, nFields), dtype = precision)
+    lam[0, :, :] = 0.
+    lam[:, 0, :] = 0.
+    lam[:, :, 0] = 0.
+    lam[-1, :, :] = 0.
+    lam[:, -1, :] = 0.
+    lam[:, :, -1] = 0.
+    
+    # Sum of the absolute lambda values of the cells which are not solved
+    fixedNorm = np.abs(lam).sum(axis = (0, 1, 2), dtype = np.float64)\
+        - np.abs(lam[cells4Solver[:, 0], cells4Solver[:, 1], cells4Solver[:, 2]])\
+            .sum(axis = 0, dtype = np.float64)
+    isActive = np.ones(nFields, dtype = np.bool_)
+    change = np.zeros(nFields)
+    norm = np.zeros(nFields)
+    for N in range(maxIterations):
+        smoothSorBatch(cells4Solver, lam, rhs, operator["invDiag"], operator["flags"],
+                       operator["omega"], operator["A"], operator["B"], isActive,
+                       change, norm)
+        eps = change / (norm + fixedNorm)
+        isActive &= eps >= thresholdIterations
+        if not isActive.any():
             break
-        else:
-            print("   eps = {0} >= {1}".format(np.round(eps,6),
-                                               thresholdIterations))
-            # Feedback to QGIS every 50 iterations
-            if (N % 50 == 0) & (feedback is not None):
-                textToSend = """Iteration {0} (max {1}) - eps = {2} >= {3}
-                            """.format( N + 1, 
-                                        maxIterations,
-                                        np.round(eps,6),
-                                        thresholdIterations)
+        # Feedback (console and QGIS) every 50 iterations
+        if N % 50 == 0:
+            textToSend = "Iteration {0} (max {1}): {2} wind fields not converged (max eps = {3})"\
+                .format(N + 1, maxIterations, isActive.sum(), np.round(eps.max(), 6))
+            print(textToSend)
+            if feedback is not None:
                 feedback.setProgressText(textToSend)
                 if feedback.isCanceled():
                     feedback.setProgressText("Calculation cancelled by user")
                     break
-            
+    print("Solver stopped after {0} iterations".format(N + 1))
     
-    # Calculates the final wind speed
+    u = np.zeros(u0.shape, dtype = precision)
+    v = np.zeros(u0.shape, dtype = precision)
+    w = np.zeros(u0.shape, dtype = precision)
+    for f in range(nFields):
+        u[f], v[f], w[f] = windFromLambda(u0 = u0[f], v0 = v0[f], w0 = w0[f],
+                                          lam = lam[:, :, :, f],
+                                          dx = dx, dy = dy, dz = dz,
+                                          buildingCoordinates = buildingCoordinates)
+    
+    print("Time spent by the wind speed solver: {0} s".format(time.time()-timeStartCalculation))
+    
+    return u, v, w
 
+def windFromLambda(u0, v0, w0, lam, dx, dy, dz, buildingCoordinates,
+                   alpha1 = 1., alpha2 = 1., memmapDirectory = None):
+    """ Calculates the wind speed field corresponding to a lambda field
+    (plane by plane along X-axis).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            u0: 3D array
+                Initialized 3D wind speed value in X direction
+            v0: 3D array
+                Initialized 3D wind speed value in Y direction 
+            w0: 3D array
+                Initialized 3D wind speed value in Z direction
+            lam: 3D array
+                Lambda field
+            dx: int
+                Grid spacing along X-axis
+            dy: int
+                Grid spacing along Y-axis  
+            dz: int or 1D array
+                Grid spacing along Z-axis (thickness of each level for a 
+                vertically stretched grid)
+            buildingCoordinates: 3D array
+                Building 3D coordinates
+            alpha1: float, default 1.
+                Gaussian precision moduli (horizontal)
+            alpha2: float, default 1.
+                Gaussian precision moduli (vertical)
+            memmapDirectory: String, default None
+                Directory where are saved the files backing the wind speed 
+                arrays (if None, they are created in memory)
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            u: 3D array
+                Updated 3D wind speed value in X direction
+            v: 3D array
+                Updated 3D wind speed value in Y direction 
+            w: 3D array
+                Updated 3D wind speed value in Z direction"""
+    nx, ny, nz = lam.shape
+    # Distance between the center of each level and the center of the level below
+    distances = levelSpacings(dz = dz, nz = nz)[1][1:nz]
+    u = createArray((nx, ny, nz), dtype = u0.dtype, directory = memmapDirectory, name = "u")
+    v = createArray((nx, ny, nz), dtype = u0.dtype, directory = memmapDirectory, name = "v")
+    w = createArray((nx, ny, nz), dtype = u0.dtype, directory = memmapDirectory, name = "w")
+    
     # go descending order along y
     if DESCENDING_Y:
-        u[1:nx, :, :] = u0[1:nx, :, :] + 0.5 * (
-                1. / (alpha1 ** 2)) * (lambdaN1[0:nx-1, :, :] - lambdaN1[1:nx, :, :]) / dx
-        v[:, 1:ny, :] = v0[:, 1:ny, :] + 0.5 * (
-                1. / (alpha1 ** 2)) * (lambdaN1[:, 0:ny-1, :] - lambdaN1[:, 1:ny, :]) / dy
-        w[:, :, 1:nz] = w0[:, :, 1:nz] + 0.5 * (
-                1. / (alpha2 ** 2)) * (lambdaN1[:, :, 0:nz - 1] - lambdaN1[:, :, 1:nz]) / dz
+        sign = -1.
     else:
-        u[1:nx, :, :] = u0[1:nx, :, :] + 0.5 * (
-                1. / (alpha1 ** 2)) * (lambdaN1[1:nx, :, :] - lambdaN1[0:nx - 1, :, :]) / dx
-        v[:, 1:ny, :] = v0[:, 1:ny, :] + 0.5 * (
-                1. / (alpha1 ** 2)) * (lambdaN1[:, 1:ny, :] - lambdaN1[:, 0:ny - 1, :]) / dy
-        w[:, :, 1:nz] = w0[:, :, 1:nz] + 0.5 * (
-                1. / (alpha2 ** 2)) * (lambdaN1[:, :, 1:nz] - lambdaN1[:, :, 0:nz - 1]) / dz
+        sign = 1.
+    for i in range(nx):
+        if i > 0:
+            u[i, :, :] = u0[i, :, :] + sign * 0.5 * (
+                    1. / (alpha1 ** 2)) * (lam[i, :, :] - lam[i - 1, :, :]) / dx
+        v[i, 1:ny, :] = v0[i, 1:ny, :] + sign * 0.5 * (
+                1. / (alpha1 ** 2)) * (lam[i, 1:ny, :] - lam[i, 0:ny - 1, :]) / dy
+        w[i, :, 1:nz] = w0[i, :, 1:nz] + sign * 0.5 * (
+                1. / (alpha2 ** 2)) * (lam[i, :, 1:nz] - lam[i, :, 0:nz - 1]) / distances
 
     # Reset input and output wind speed to zero for building cells
     u[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
@@ -237,34 +956,1902 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver,
     v[buildingCoordinates[0],buildingCoordinates[1]+1,buildingCoordinates[2]]=0
     w[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
     w[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]+1]=0
-
-    print("Time spent by the wind speed solver: {0} s".format(time.time()-timeStartCalculation))
     
     return u, v, w
 
-@jit(nopython=True)
-def calcLambda(cells4Solver, lambdaN, lambdaN1, omega, alpha1, u0, v0, w0, dx, dy, dz, e, f, g, h, m, n, o, p, q, DESCENDING_Y, A, B):
+def solverOperator(nx, ny, nz, dx, dy, dz, buildingCoordinates, cells4Solver,
+                   alpha1 = 1., alpha2 = 1., precision = PRECISION,
+                   memmapDirectory = None, topBoundary = TOP_BOUNDARY,
+                   lateralBoundaries = ("dirichlet",) * 4):
+    """ Calculates the operator of the lambda equation, i.e. everything which
+    does not depend on the initial wind field: obstacle flags, inverse of the
+    diagonal coefficients, grid spacing ratios and SOR relaxation factor. The
+    operator may be passed to 'solver' for several initial wind fields of a
+    same geometry (e.g. different inflow profiles), the multigrid levels and 
+    the conjugate gradient matrix and preconditioners being then also stored
+    in the operator the first time they are used.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            nx: int
+                Number of cells along X-axis
+            ny: int
+                Number of cells along Y-axis
+            nz: int
+                Number of cells along Z-axis
+            dx: int
+                Grid spacing along X-axis
+            dy: int
+                Grid spacing along Y-axis  
+            dz: int or 1D array
+                Grid spacing along Z-axis (thickness of each level for a 
+                vertically stretched grid)
+            buildingCoordinates: 3D array
+                Building 3D coordinates
+            cells4Solver: 2D array
+                Array of 3D cell coordinates for which the wind solver is applied
+            alpha1: float, default 1.
+                Gaussian precision moduli (horizontal)
+            alpha2: float, default 1.
+                Gaussian precision moduli (vertical)
+            precision: String, default PRECISION
+                Floating point precision of the inverse diagonal coefficients
+            memmapDirectory: String, default None
+                Directory where are saved the files backing the obstacle flags
+                and the inverse diagonal coefficients arrays (if None, they 
+                are created in memory)
+            topBoundary: String, default TOP_BOUNDARY
+                Boundary condition at the top of the domain ("dirichlet" or "neumann")
+            lateralBoundaries: tuple of String, default ("dirichlet",) * 4
+                Boundary conditions of the lower and upper X faces and of the
+                lower and upper Y faces ("dirichlet" or "neumann")
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            operator: dictionary
+                Operator of the lambda equation ("shape", "cells", "flags", 
+                "invDiag", "A", "B", "omega", "topBoundary" and 
+                "lateralBoundaries" keys)"""
+    eta = alpha1 / alpha2
+    A = dx ** 2 / dy ** 2
+    # Vertical coefficients of the upper and lower neighbours of each level
+    # (equal for a vertically uniform grid)
+    thicknesses, distances = levelSpacings(dz = dz, nz = nz)
+    B = np.array([eta ** 2 * dx ** 2 / (thicknesses * distances[1:]),
+                  eta ** 2 * dx ** 2 / (thicknesses * distances[:-1])])
+    
+    # Set coefficients according to table 1 (Pardyjak et Brown, 2003) 
+    # to modify the Equation near obstacles
+    flags = obstacleFlags(nx = nx, ny = ny, nz = nz,
+                          buildingCoordinates = buildingCoordinates,
+                          memmapDirectory = memmapDirectory)
+    boundaryFlags(flags = flags, topBoundary = topBoundary,
+                  lateralBoundaries = lateralBoundaries)
+    invDiag = createArray((nx, ny, nz), dtype = precision,
+                          directory = memmapDirectory, name = "invDiag")
+    for i in range(nx):
+        invDiag[i] = inverseDiagonal(flags = flags[i], A = A, B = B)
+    
+    return {"shape": (nx, ny, nz),
+            "cells": cells4Solver,
+            "flags": flags,
+            "invDiag": invDiag,
+            "A": A,
+            "B": B,
+            "omega": sorOmega(nx = nx, ny = ny, nz = nz, A = (dx / dy) ** 2),
+            "topBoundary": topBoundary,
+            "lateralBoundaries": tuple(lateralBoundaries)}
+
+def lateralFaceConditions(lateralBoundary, u0, v0):
+    """ Sets the boundary condition of each lateral face of the domain.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lateralBoundary: String
+                Lateral boundary condition ("dirichlet", "neumann" or "outflow")
+            u0: 3D array
+                Initialized 3D wind speed value in X direction
+            v0: 3D array
+                Initialized 3D wind speed value in Y direction 
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lateralBoundaries: tuple of String
+                Boundary conditions of the lower and upper X faces and of the
+                lower and upper Y faces ("dirichlet" or "neumann"). For 
+                "outflow", the faces where the mean initial wind speed enters
+                the domain are "neumann" (the other ones being "dirichlet")"""
+    if lateralBoundary != "outflow":
+        return (lateralBoundary,) * 4
+    
+    # Mean initial wind speed entering the domain through each face
+    inflows = [np.mean(u0[1, :, :]), -np.mean(u0[-1, :, :]),
+               np.mean(v0[:, 1, :]), -np.mean(v0[:, -1, :])]
+    
+    return tuple("neumann" if inflow > 0 else "dirichlet" for inflow in inflows)
+
+def boundaryFlags(flags, topBoundary = TOP_BOUNDARY, lateralBoundaries = ("dirichlet",) * 4):
+    """ Sets the obstacle flags of the cells next to the "neumann" boundaries 
+    of the domain: these boundaries are treated as walls by the lambda 
+    equation (zero normal gradient of lambda).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            flags: 3D array
+                Obstacle flags (modified in place)
+            topBoundary: String, default TOP_BOUNDARY
+                Boundary condition at the top of the domain ("dirichlet" or "neumann")
+            lateralBoundaries: tuple of String, default ("dirichlet",) * 4
+                Boundary conditions of the lower and upper X faces and of the
+                lower and upper Y faces ("dirichlet" or "neumann")
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            flags: 3D array
+                Obstacle flags including the "neumann" boundaries"""
+    if topBoundary == "neumann":
+        flags[:, :, -2] |= FLAG_M | FLAG_Q
     # Go descending order along y
     if DESCENDING_Y:
-        for k, j, i in np.flip(cells4Solver):
-            lambdaN1[i, j, k] = omega * (
-                ((-1.) * (dx ** 2 * (-2. * alpha1 ** 2) * (((u0[i, j, k] - u0[i + 1, j, k]) / (dx) + (
-                        v0[i, j, k] - v0[i, j + 1, k]) / (dy) +
-                                                            (w0[i, j, k] - w0[i, j, k + 1]) / (dz)))) + (
-                          e[i, j, k] * lambdaN[i - 1, j, k] + f[i, j, k] * lambdaN1[i + 1, j, k] + A * (
-                          g[i, j, k] * lambdaN[i, j - 1, k] + h[i, j, k] * lambdaN1[i, j + 1, k]) + B * (
-                                  m[i, j, k] * lambdaN[i, j, k - 1] + n[i, j, k] * lambdaN1[i, j, k + 1]))) / (
-                        2. * (o[i, j, k] + A * p[i, j, k] + B * q[i, j, k]))) + (1 - omega) * lambdaN1[i, j, k]  
-                                      
+        lowerYFlag, upperYFlag = FLAG_G, FLAG_H
     else:
-        for i, j, k in cells4Solver:
-            lambdaN1[i, j, k] = omega * (
-                ((-1.) * (dx ** 2 * (-2. * alpha1 ** 2) * (((u0[i + 1, j, k] - u0[i, j, k]) / (dx) + (
-                        v0[i, j + 1, k] - v0[i, j, k]) / (dy) +
-                                                            (w0[i, j, k + 1] - w0[i, j, k]) / (dz)))) + (
-                          e[i, j, k] * lambdaN[i + 1, j, k] + f[i, j, k] * lambdaN1[i - 1, j, k] + A * (
-                          g[i, j, k] * lambdaN[i, j + 1, k] + h[i, j, k] * lambdaN1[i, j - 1, k]) + B * (
-                                  m[i, j, k] * lambdaN[i, j, k + 1] + n[i, j, k] * lambdaN1[i, j, k - 1]))) / (
-                        2. * (o[i, j, k] + A * p[i, j, k] + B * q[i, j, k]))) + (1 - omega) * lambdaN1[i, j, k]  
-                                      
-    return lambdaN1
\ No newline at end of file
+        lowerYFlag, upperYFlag = FLAG_H, FLAG_G
+    lowerX, upperX, lowerY, upperY = lateralBoundaries
+    if lowerX == "neumann":
+        flags[1, :, :] |= FLAG_F | FLAG_O
+    if upperX == "neumann":
+        flags[-2, :, :] |= FLAG_E | FLAG_O
+    if lowerY == "neumann":
+        flags[:, 1, :] |= lowerYFlag | FLAG_P
+    if upperY == "neumann":
+        flags[:, -2, :] |= upperYFlag | FLAG_P
+    
+    return flags
+
+def freeStreamLevel(u0, v0, w0, buildingCoordinates, tolerance = 1e-6):
+    """ Identifies the lowest level from which the initial wind field is 
+    the free stream, i.e. horizontally uniform (no obstacle influence) in 
+    this level and all the upper ones.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            u0: 3D array
+                Initialized 3D wind speed value in X direction
+            v0: 3D array
+                Initialized 3D wind speed value in Y direction 
+            w0: 3D array
+                Initialized 3D wind speed value in Z direction
+            buildingCoordinates: 3D array
+                Building 3D coordinates
+            tolerance: float, default 1e-6
+                Maximum variation of the wind speed within a level (relative
+                to the maximum wind speed of the level) for a uniform level
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            level: int
+                Lowest free stream level (index along Z-axis)"""
+    nz = u0.shape[2]
+    lowestLevel = 1
+    if buildingCoordinates.shape[1] > 0:
+        lowestLevel = max(lowestLevel, buildingCoordinates[2].max() + 1)
+    level = nz
+    for k in range(nz - 1, lowestLevel - 1, -1):
+        speeds = [wind0[:, :, k] for wind0 in [u0, v0, w0]]
+        maxSpeed = max(np.abs(speed).max() for speed in speeds)
+        if any(speed.max() - speed.min() > tolerance * maxSpeed for speed in speeds):
+            break
+        level = k
+    
+    return level
+
+def scaleInitialLambda(operator, lam, rhs):
+    """ Scales the lambda values of the solver cells by the factor minimizing
+    the error (in the norm of the operator) of the initial lambda. If the 
+    initial lambda is the solution of the same geometry with an initial wind 
+    field only differing by a factor, the scaled lambda is the solution.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            operator: dictionary
+                Operator of the lambda equation (such as returned by 'solverOperator')
+            lam: 3D array
+                Initial lambda field (solver cells updated in place)
+            rhs: 3D array
+                Right-hand side of the lambda equation
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lam: 3D array
+                Scaled initial lambda field"""
+    cells = operator["cells"]
+    i, j, k = cells[:, 0], cells[:, 1], cells[:, 2]
+    # Operator applied to lambda (opposite of the residual for a null right-hand side)
+    operatorLambda = -calcResidual(cells, lam, np.zeros_like(rhs), np.zeros_like(rhs),
+                                   operator["invDiag"], operator["flags"],
+                                   operator["A"], operator["B"])[i, j, k]
+    lamCells = lam[i, j, k].astype(np.float64)
+    energy = np.dot(lamCells, operatorLambda.astype(np.float64))
+    if energy > 0:
+        factor = np.dot(lamCells, rhs[i, j, k].astype(np.float64)) / energy
+        print("Initial lambda scaled by a factor {0}".format(np.round(factor, 4)))
+        lam[i, j, k] = factor * lamCells
+    
+    return lam
+
+def lambdaCachePath(directory, nx, ny, nz, dx, dy, dz, buildingCoordinates,
+                    topBoundary = TOP_BOUNDARY, lateralBoundary = LATERAL_BOUNDARY,
+                    inputs = None):
+    """ Returns the path of the file used to save the lambda field of a 
+    given geometry: the file name is based on a hash of the grid shape, 
+    the grid spacings, the building coordinates, the boundary conditions 
+    and the other inputs of the calculation (e.g. wind direction and speed).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            directory: String
+                Directory where are saved the lambda fields
+            nx: int
+                Number of cells along X-axis
+            ny: int
+                Number of cells along Y-axis
+            nz: int
+                Number of cells along Z-axis
+            dx: int
+                Grid spacing along X-axis
+            dy: int
+                Grid spacing along Y-axis  
+            dz: int or 1D array
+                Grid spacing along Z-axis (thickness of each level for a 
+                vertically stretched grid)
+            buildingCoordinates: 3D array
+                Building 3D coordinates
+            topBoundary: String, default TOP_BOUNDARY
+                Boundary condition of the top face of the domain
+            lateralBoundary: String, default LATERAL_BOUNDARY
+                Boundary condition of the lateral faces of the domain
+            inputs: dictionary, default None
+                Other inputs of the calculation identifying the lambda field
+                (e.g. wind direction and speed)
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            path: String
+                Path of the lambda file (.npy) for this geometry and inputs"""
+    geometryHash = hashlib.sha1("{0}_{1}_{2}_{3}_{4}_{5}_{6}_{7}"\
+                                .format(nx, ny, nz, dx, dy, dz, topBoundary, lateralBoundary)\
+                                .encode())
+    geometryHash.update(np.ascontiguousarray(buildingCoordinates, dtype = np.int32).tobytes())
+    if inputs is not None:
+        geometryHash.update(repr(sorted(inputs.items())).encode())
+    
+    return os.path.join(directory, "lambda_{0}.npy".format(geometryHash.hexdigest()))
+
+def levelSpacings(dz, nz):
+    """ Calculates the thickness of each level of the grid and the distance
+    between the centers of consecutive levels.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            dz: int or 1D array
+                Grid spacing along Z-axis (thickness of each level for a 
+                vertically stretched grid)
+            nz: int
+                Number of cells along Z-axis
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            thicknesses: 1D array
+                Thickness of each level
+            distances: 1D array
+                Distance between the center of each level and the center of
+                the level below (nz + 1 values, the first and the last ones
+                being the thickness of the first and last levels)"""
+    if np.ndim(dz) > 0 and len(dz) != nz:
+        raise ValueError("The number of level thicknesses ({0}) does not correspond to the number of levels {1}"\
+                         .format(len(dz), nz))
+    thicknesses = np.broadcast_to(np.asarray(dz, dtype = np.float64), (nz, )).copy()
+    distances = np.concatenate([thicknesses[:1],
+                                (thicknesses[:-1] + thicknesses[1:]) / 2.,
+                                thicknesses[-1:]])
+    
+    return thicknesses, distances
+
+def obstacleFlags(nx, ny, nz, buildingCoordinates, memmapDirectory = None):
+    """ Set the coefficients modifying the solver equation near obstacles
+    according to table 1 of Pardyjak et Brown (2003). Since the coefficients
+    can only be 0, 0.5 or 1, they are coded as bits of a single flag per cell
+    (see FLAG_E to FLAG_Q).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            nx: int
+                Number of cells along X-axis
+            ny: int
+                Number of cells along Y-axis
+            nz: int
+                Number of cells along Z-axis
+            buildingCoordinates: 3D array
+                Building 3D coordinates
+            memmapDirectory: String, default None
+                Directory where is saved the file backing the flags array (if
+                None, it is created in memory)
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            flags: 3D array (uint16)
+                Obstacle flags coding the coefficients e, f, g, h, m, n, o, p, q
+                of the solver equation for each cell"""
+    flags = createArray((nx, ny, nz), dtype = np.uint16,
+                        directory = memmapDirectory, name = "flags")
+    
+    # For each axis, the flag of the cells having a building as next neighbour
+    # (upper index), as previous neighbour (lower index) and the half flag.
+    # Note that the cells having a wall below AND front, left, right or behind
+    # do not need a specific treatment since their coefficients are already
+    # set by these two neighbours
+    axisFlags = np.array([[FLAG_E, FLAG_F, FLAG_O],
+                          [FLAG_G, FLAG_H, FLAG_P],
+                          [FLAG_M, FLAG_N, FLAG_Q]], dtype = np.uint16)
+    # Go descending order along y
+    if DESCENDING_Y:
+        axisFlags[:, [0, 1]] = axisFlags[:, [1, 0]]
+    setObstacleFlags(np.ascontiguousarray(buildingCoordinates), flags, axisFlags)
+    
+    return flags
+
+def inverseDiagonal(flags, A, B, boundaryWeights = None):
+    """ Calculates the inverse of the diagonal coefficient 2 * (o + A*p) + 
+    B_up*m + B_low*n of the lambda equation for each cell (2 * (o + A*p + B*q)
+    for a vertically uniform grid).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            flags: 3D array
+                Obstacle flags coding the coefficients of the equation (the 
+                last axis being the vertical one)
+            A: float
+                Ratio dx²/dy²
+            B: 2D array
+                Ratios dx²/dz² of the upper (first row) and lower (second row)
+                neighbours of each level (multiplied by the square of the alpha ratio)
+            boundaryWeights: 2D array, default None
+                Weights of the boundary coefficient of the cells next to the 
+                lower and upper sketch boundaries of each axis (used for the
+                multigrid coarse levels). If None, the coefficients are not weighted
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            invDiag: 3D array
+                Inverse of the diagonal coefficient of the equation"""
+    # A cell located between two vertical walls keeps the mean vertical coefficient
+    vertical = np.where((flags & (FLAG_M | FLAG_N)) == (FLAG_M | FLAG_N),
+                        0.5 * (B[0] + B[1]),
+                        B[0] * np.where(flags & FLAG_M, 0., 1.)
+                        + B[1] * np.where(flags & FLAG_N, 0., 1.))
+    diag = 2. * (np.where(flags & FLAG_O, 0.5, 1.)
+                 + A * np.where(flags & FLAG_P, 0.5, 1.)) + vertical
+    
+    if boundaryWeights is not None:
+        for axis, (lowFactor, upFactor, lowFlag, upFlag) in enumerate([(1., 1., FLAG_F, FLAG_E),
+                                                                       (A, A, FLAG_H, FLAG_G),
+                                                                       (B[1, 1], B[0, -2], FLAG_N, FLAG_M)]):
+            lowSlice = [slice(None)] * 3
+            lowSlice[axis] = 1
+            upSlice = [slice(None)] * 3
+            upSlice[axis] = flags.shape[axis] - 2
+            diag[tuple(lowSlice)] += lowFactor * (boundaryWeights[axis, 0] - 1.)\
+                * np.where(flags[tuple(lowSlice)] & lowFlag, 0., 1.)
+            diag[tuple(upSlice)] += upFactor * (boundaryWeights[axis, 1] - 1.)\
+                * np.where(flags[tuple(upSlice)] & upFlag, 0., 1.)
+    
+    return 1. / diag
+
+def solverMask(shape, cells4Solver, memmapDirectory = None):
+    """ Creates the mask of the cells for which the wind solver is applied.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            shape: tuple
+                Number of cells along each axis (nx, ny, nz)
+            cells4Solver: 2D array
+                Array of 3D cell coordinates for which the wind solver is applied
+            memmapDirectory: String, default None
+                Directory where is saved the file backing the mask. If None,
+                it is created in memory
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            mask: 3D array
+                True for the solver cells (1 byte per cell)"""
+    mask = createArray(shape, dtype = np.bool_, directory = memmapDirectory, name = "mask")
+    mask[cells4Solver[:, 0], cells4Solver[:, 1], cells4Solver[:, 2]] = True
+    
+    return mask
+
+def splitRedBlack(cells):
+    """ Split an array of cell coordinates into two checkerboard colors.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            cells: 2D array
+                Array of 3D cell coordinates
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            redCells: 2D array
+                Cells having an even sum of their coordinates
+            blackCells: 2D array
+                Cells having an odd sum of their coordinates"""
+    isRed = cells.sum(axis = 1) % 2 == 0
+    
+    return np.ascontiguousarray(cells[isRed]), np.ascontiguousarray(cells[~isRed])
+
+def verticalLines(cells4Solver):
+    """ Identify the vertical lines of the solver, i.e. the sets of solver cells
+    being consecutive along the Z-axis for a given (X, Y) position. The lines
+    are split into two colors such as two horizontal neighbour columns have 
+    different colors: the lines of a same color can be solved simultaneously.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            cells4Solver: 2D array
+                Array of 3D cell coordinates for which the wind solver is applied
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lineCells: 2D array
+                Solver cells sorted by X, Y and Z coordinates
+            redLines: 2D array
+                Index of the first cell (in 'lineCells') and number of cells
+                of each line of the first color
+            blackLines: 2D array
+                Index of the first cell (in 'lineCells') and number of cells
+                of each line of the second color"""
+    lineCells = np.ascontiguousarray(cells4Solver[np.lexsort((cells4Solver[:, 2],
+                                                              cells4Solver[:, 1],
+                                                              cells4Solver[:, 0]))])
+    i, j, k = lineCells[:, 0], lineCells[:, 1], lineCells[:, 2]
+    
+    # A new line starts when the column changes or when a cell is not solved
+    isLineStart = np.ones(lineCells.shape[0], dtype = bool)
+    isLineStart[1:] = (i[1:] != i[:-1]) | (j[1:] != j[:-1]) | (k[1:] != k[:-1] + 1)
+    lineStarts = np.where(isLineStart)[0]
+    lines = np.stack([lineStarts,
+                      np.diff(np.append(lineStarts, lineCells.shape[0]))],
+                     axis = 1).astype(np.int64)
+    isRed = (i[lineStarts] + j[lineStarts]) % 2 == 0
+    
+    return lineCells, np.ascontiguousarray(lines[isRed]), np.ascontiguousarray(lines[~isRed])
+
+def slabLimits(cells4Solver, nx, nSlabs):
+    """ Splits the grid into slabs along X-axis having about the same number
+    of solver cells.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            cells4Solver: 2D array
+                Array of 3D cell coordinates for which the wind solver is applied
+            nx: int
+                Number of cells along X-axis
+            nSlabs: int
+                Number of slabs
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            limits: 1D array
+                First plane of each slab (the last value being the last plane
+                of the grid, nx - 1)"""
+    cellsPerPlane = np.bincount(cells4Solver[:, 0], minlength = nx)
+    cumulatedCells = np.cumsum(cellsPerPlane)
+    limits = np.searchsorted(cumulatedCells,
+                             cumulatedCells[-1] * np.arange(1, nSlabs) / nSlabs)
+    
+    return np.concatenate([[1], np.clip(limits + 1, 1, nx - 1), [nx - 1]])
+
+def startSlabWorkers(lam, rhs, invDiag, flags, cells4Solver, omega, A, B,
+                     nThreads = DOMAIN_DECOMPOSITION_THREADS):
+    """ Splits the grid into slabs along X-axis (having about the same number
+    of solver cells) and starts a pool of threads, each of them iterating a 
+    pair of consecutive slabs (the SOR kernel releasing the GIL, the slabs 
+    are updated in parallel). At each iteration, the first slab of each pair
+    is updated and then (once all of them are done) the second one: two slabs
+    being updated simultaneously are never neighbours, each slab thus uses the
+    last lambda of the planes bounding it (halos), such as a SOR of the whole 
+    grid ordered by slabs. The number of threads is reduced until each slab
+    has at least one plane.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lam: 3D array
+                Initial lambda field (updated in place by the iterations)
+            rhs: 3D array
+                Right-hand side of the lambda equation
+            invDiag: 3D array
+                Inverse of the diagonal coefficients of the equation
+            flags: 3D array
+                Obstacle flags coding the coefficients of the equation
+            cells4Solver: 2D array
+                Array of 3D cell coordinates for which the wind solver is applied
+            omega: float
+                Relaxation factor
+            A: float
+                Ratio dx²/dy²
+            B: 2D array
+                Ratios dx²/dz² of the upper (first row) and lower (second row)
+                neighbours of each level (multiplied by the square of the alpha ratio)
+            nThreads: int, default DOMAIN_DECOMPOSITION_THREADS
+                Maximum number of threads (half the number of slabs), all 
+                available cores if 0
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            slabs: dictionary
+                Pool of threads, slab limits, solver cells of the first and 
+                second slab of each pair and arrays of the equation"""
+    if nThreads == 0:
+        nThreads = os.cpu_count()
+    nx = lam.shape[0]
+    nThreads = max(1, min(nThreads, (nx - 2) // 2))
+    
+    # Slab limits (first plane of each slab) balancing the number of cells.
+    # An empty slab would make two slabs updated simultaneously neighbours
+    # (sharing the plane bounding them), thus the number of threads is
+    # reduced until each slab has at least one plane
+    limits = slabLimits(cells4Solver = cells4Solver, nx = nx, nSlabs = 2 * nThreads)
+    while nThreads > 1 and (np.diff(limits) < 1).any():
+        nThreads -= 1
+        limits = slabLimits(cells4Solver = cells4Solver, nx = nx, nSlabs = 2 * nThreads)
+    slabCells = [np.ascontiguousarray(cells4Solver[(cells4Solver[:, 0] >= limits[l])\
+                                                   & (cells4Solver[:, 0] < limits[l + 1])])
+                 for l in range(2 * nThreads)]
+    
+    return {"executor": ThreadPoolExecutor(max_workers = nThreads),
+            "limits": limits,
+            "firstSlabs": slabCells[0::2],
+            "secondSlabs": slabCells[1::2],
+            "lambda": lam, "rhs": rhs, "invDiag": invDiag, "flags": flags,
+            "omega": omega, "A": A, "B": B}
+
+def slabIteration(slabs):
+    """ Applies one SOR iteration to the slabs: the first slab of each pair
+    is updated by the threads and then the second one.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            slabs: dictionary
+                Slab threads (such as returned by 'startSlabWorkers')
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            change: float
+                Sum of the absolute lambda variations
+            norm: float
+                Sum of the absolute lambda of the solver cells"""
+    change = 0.
+    norm = 0.
+    for phaseSlabs in [slabs["firstSlabs"], slabs["secondSlabs"]]:
+        futures = [slabs["executor"].submit(smoothSor, cells, slabs["lambda"], slabs["rhs"],
+                                            slabs["invDiag"], slabs["flags"], slabs["omega"],
+                                            slabs["A"], slabs["B"])
+                   for cells in phaseSlabs]
+        # Waits for all slabs of the phase (an error of a thread being raised here)
+        for future in futures:
+            slabChange, slabNorm = future.result()
+            change += slabChange
+            norm += slabNorm
+    
+    return change, norm
+
+def stopSlabWorkers(slabs):
+    """ Stops the slab threads.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            slabs: dictionary
+                Slab threads (such as returned by 'startSlabWorkers')
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lam: 3D array
+                Lambda field resulting from the iterations"""
+    slabs["executor"].shutdown(wait = True)
+    
+    return slabs["lambda"]
+
+def divergenceRhs(cells4Solver, u0, v0, w0, dx, dy, dz, alpha1, rhs = None):
+    """ Calculates the right-hand side of the lambda equation (based on the
+    divergence of the initial wind field) for each cell of the solver.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            cells4Solver: 2D array
+                Array of 3D cell coordinates for which the wind solver is applied
+            u0: 3D array
+                Initialized 3D wind speed value in X direction
+            v0: 3D array
+                Initialized 3D wind speed value in Y direction 
+            w0: 3D array
+                Initialized 3D wind speed value in Z direction
+            dx: int
+                Grid spacing along X-axis
+            dy: int
+                Grid spacing along Y-axis  
+            dz: int or 1D array
+                Grid spacing along Z-axis (thickness of each level for a 
+                vertically stretched grid)
+            alpha1: float
+                Gaussian precision moduli (horizontal)
+            rhs: 3D array, default None
+                Array filled with the right-hand side (initialized to 0). If 
+                None, it is created in memory
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            rhs: 3D array
+                Right-hand side of the lambda equation (0 outside solver cells,
+                same precision as the initial wind speed)"""
+    if rhs is None:
+        rhs = np.zeros(u0.shape, dtype = u0.dtype)
+    calcDivergence(cells4Solver, u0, v0, w0, dx, dy,
+                   levelSpacings(dz = dz, nz = u0.shape[2])[0],
+                   2. * alpha1 ** 2 * dx ** 2, rhs)
+    
+    return rhs
+
+def multigridLevels(buildingCoordinates, cells4Solver, flags, invDiag, A, B,
+                    minCells = MULTIGRID_MIN_CELLS, topBoundary = TOP_BOUNDARY,
+                    lateralBoundaries = ("dirichlet",) * 4):
+    """ Creates the hierarchy of grids used by the multigrid solver. Each 
+    coarse grid has twice the spacing of the finer one in the 3 directions:
+    the coarse cell I (I > 0) gathers the fine cells 2I-1 and 2I, thus walls 
+    (cell faces) of the fine grid stay at the same location in the coarse 
+    grid. A coarse cell is considered as building if at least half of the
+    corresponding fine cells are buildings. The coarse operators are obtained 
+    by setting the obstacle flags again from the coarse building cells.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            buildingCoordinates: 3D array
+                Building 3D coordinates
+            cells4Solver: 2D array
+                Array of 3D cell coordinates for which the wind solver is applied
+            flags: 3D array
+                Obstacle flags of the finest grid
+            invDiag: 3D array
+                Inverse of the diagonal coefficients of the finest grid
+            A: float
+                Ratio dx²/dy²
+            B: 2D array
+                Ratios dx²/dz² of the upper (first row) and lower (second row)
+                neighbours of each level (multiplied by the square of the alpha ratio)
+            minCells: int, default MULTIGRID_MIN_CELLS
+                Minimum number of cells along each axis of the coarsest grid
+            topBoundary: String, default TOP_BOUNDARY
+                Boundary condition at the top of the domain ("dirichlet" or "neumann")
+            lateralBoundaries: tuple of String, default ("dirichlet",) * 4
+                Boundary conditions of the lower and upper X faces and of the
+                lower and upper Y faces ("dirichlet" or "neumann")
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            levels: list of dictionaries
+                For each level (from the finest to the coarsest), the grid 
+                shape, the solver cells (all, red and black), the obstacle flags,
+                the inverse diagonal coefficients, the residual and (except for 
+                the finest one) the lambda, the right-hand side and the 
+                non-building cells arrays"""
+    shape = flags.shape
+    isBuilding = np.zeros(shape, dtype = bool)
+    isBuilding[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2]] = True
+    redCells, blackCells = splitRedBlack(cells4Solver)
+    levels = [{"shape": shape,
+               "cells": cells4Solver,
+               "redCells": redCells,
+               "blackCells": blackCells,
+               "flags": flags,
+               "invDiag": invDiag,
+               "A": A,
+               "B": B,
+               "residual": np.zeros(shape, dtype = invDiag.dtype)}]
+    
+    while min(shape) >= 2 * minCells - 3:
+        # Coarsen the building cells of the inner grid (padded to get full 2x2x2 blocks)
+        coarseShape = tuple((ni - 1) // 2 + 2 for ni in shape)
+        padded = np.zeros([2 * (ni - 2) for ni in coarseShape], dtype = np.int8)
+        padded[:shape[0] - 2, :shape[1] - 2, :shape[2] - 2] = isBuilding[1:-1, 1:-1, 1:-1]
+        nBuildCells = padded.reshape(coarseShape[0] - 2, 2, 
+                                     coarseShape[1] - 2, 2,
+                                     coarseShape[2] - 2, 2).sum(axis = (1, 3, 5))
+        isBuilding = np.zeros(coarseShape, dtype = bool)
+        isBuilding[1:-1, 1:-1, 1:-1] = nBuildCells >= 4
+        # The ground is kept as a solid wall
+        isBuilding[1:-1, 1:-1, 0] = True
+        
+        coarseCells = np.transpose(np.where(~isBuilding[1:-1, 1:-1, 1:-1])).astype(np.int32) + 1
+        coarseBuildings = np.stack(np.where(isBuilding)).astype(np.int32)
+        redCells, blackCells = splitRedBlack(coarseCells)
+        coarseFlags = obstacleFlags(nx = coarseShape[0],
+                                    ny = coarseShape[1],
+                                    nz = coarseShape[2],
+                                    buildingCoordinates = coarseBuildings)
+        boundaryFlags(flags = coarseFlags, topBoundary = topBoundary,
+                      lateralBoundaries = lateralBoundaries)
+        
+        # The sketch boundaries (lambda = 0) are located at the center of the 
+        # finest boundary cells: the coarse cell centers being farther from 
+        # the boundaries than one coarse spacing, the boundary coefficient of
+        # the diagonal of the cells close to the boundaries is weighted 
+        # accordingly (lower and upper boundaries of each axis)
+        cellSize = 2 ** len(levels)
+        coarseB = np.full((2, coarseShape[2]), B[0, 0])
+        boundaryWeights = np.ones((3, 2))
+        for axis in range(3):
+            nFine = levels[0]["shape"][axis]
+            nCoarse = coarseShape[axis]
+            firstFine = cellSize * (nCoarse - 3) + 1
+            lastFine = min(cellSize * (nCoarse - 2), nFine - 2)
+            boundaryWeights[axis, 0] = 2. * cellSize / (cellSize + 1)
+            boundaryWeights[axis, 1] = cellSize / (nFine - 1 - (firstFine + lastFine) / 2.)
+        
+        levels.append({"shape": coarseShape,
+                       "cells": coarseCells,
+                       "redCells": redCells,
+                       "blackCells": blackCells,
+                       "flags": coarseFlags,
+                       "invDiag": inverseDiagonal(flags = coarseFlags, A = A, B = coarseB,
+                                                  boundaryWeights = boundaryWeights)\
+                                                      .astype(invDiag.dtype),
+                       "A": A,
+                       "B": coarseB,
+                       "residual": np.zeros(coarseShape, dtype = invDiag.dtype),
+                       "lambda": np.zeros(coarseShape, dtype = invDiag.dtype),
+                       "rhs": np.zeros(coarseShape, dtype = invDiag.dtype),
+                       "isFluid": (~isBuilding).astype(np.int8)})
+        shape = coarseShape
+    
+    return levels
+
+def multigridWorkspace(levels):
+    """ Copies the multigrid levels with new work arrays (residual, lambda and
+    right-hand side of each level), such as several calculations can use
+    simultaneously the levels stored in a same operator.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            levels: list of dictionaries
+                Multigrid levels (such as defined in 'multigridLevels')
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            levels: list of dictionaries
+                Multigrid levels having their own work arrays"""
+    workLevels = []
+    for level in levels:
+        workLevel = dict(level)
+        for name in ["residual", "lambda", "rhs"]:
+            if name in level:
+                workLevel[name] = np.zeros_like(level[name])
+        workLevels.append(workLevel)
+    
+    return workLevels
+
+def multigridSmooth(level, lam, rhs, nSweeps, smoother, omega = 1.):
+    """ Apply SOR smoothing sweeps on a multigrid level.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            level: dictionary
+                Multigrid level (such as defined in 'multigridLevels')
+            lam: 3D array
+                Lambda field of the level (updated in place)
+            rhs: 3D array
+                Right-hand side of the level
+            nSweeps: int
+                Number of sweeps to apply
+            smoother: String
+                Type of sweep ("sor" or "red-black")
+            omega: float, default 1.
+                Relaxation factor
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lam: 3D array
+                Smoothed lambda field"""
+    for s in range(nSweeps):
+        if smoother == "red-black":
+            for colorCells in [level["redCells"], level["blackCells"]]:
+                smoothColor(colorCells, lam, rhs, level["invDiag"], level["flags"],
+                            omega, level["A"], level["B"])
+        else:
+            smoothSor(level["cells"], lam, rhs, level["invDiag"], level["flags"],
+                      omega, level["A"], level["B"])
+    
+    return lam
+
+def multigridCycle(levels, level, lam, rhs, smoother,
+                   nPreSmoothing = MULTIGRID_PRE_SMOOTHING,
+                   nPostSmoothing = MULTIGRID_POST_SMOOTHING,
+                   nCoarsestSweeps = MULTIGRID_COARSEST_SWEEPS):
+    """ Apply a multigrid V-cycle starting from a given level.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            levels: list of dictionaries
+                Multigrid levels (such as defined in 'multigridLevels')
+            level: int
+                Index of the level where starts the V-cycle
+            lam: 3D array
+                Lambda field of the level (updated in place)
+            rhs: 3D array
+                Right-hand side of the level
+            smoother: String
+                Type of smoothing sweep ("sor" or "red-black")
+            nPreSmoothing: int, default MULTIGRID_PRE_SMOOTHING
+                Number of smoothing sweeps before the coarse grid correction
+            nPostSmoothing: int, default MULTIGRID_POST_SMOOTHING
+                Number of smoothing sweeps after the coarse grid correction
+            nCoarsestSweeps: int, default MULTIGRID_COARSEST_SWEEPS
+                Number of SOR sweeps used to solve the coarsest grid
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lam: 3D array
+                Updated lambda field"""
+    current = levels[level]
+    
+    # Coarsest grid: approximately solved using SOR
+    if level == len(levels) - 1:
+        return multigridSmooth(level = current, lam = lam, rhs = rhs,
+                               nSweeps = nCoarsestSweeps, smoother = smoother,
+                               omega = sorOmega(*current["shape"], current["A"]))
+    
+    multigridSmooth(level = current, lam = lam, rhs = rhs,
+                    nSweeps = nPreSmoothing, smoother = smoother)
+    
+    # Restrict the residual (multiplied by the grid spacing ratio squared
+    # since the equation is scaled by dx²) to the coarse grid
+    calcResidual(current["cells"], lam, rhs, current["residual"],
+                 current["invDiag"], current["flags"], current["A"], current["B"])
+    coarse = levels[level + 1]
+    coarse["rhs"][:] = 0.
+    restrictToCoarse(current["residual"], coarse["rhs"], coarse["cells"], 4.)
+    
+    # Solve the coarse error equation and correct the fine lambda field
+    coarse["lambda"][:] = 0.
+    multigridCycle(levels = levels, level = level + 1, lam = coarse["lambda"],
+                   rhs = coarse["rhs"], smoother = smoother,
+                   nPreSmoothing = nPreSmoothing, nPostSmoothing = nPostSmoothing,
+                   nCoarsestSweeps = nCoarsestSweeps)
+    prolongToFine(coarse["lambda"], coarse["isFluid"], lam, current["cells"])
+    
+    return multigridSmooth(level = current, lam = lam, rhs = rhs,
+                           nSweeps = nPostSmoothing, smoother = smoother)
+
+def fullMultigrid(levels, lambdaN1, rhs, smoother):
+    """ Initializes the finest lambda field using a full multigrid cycle: the
+    right-hand side is restricted down to the coarsest grid, solved there,
+    and the solution interpolated level by level (with one V-cycle per level)
+    up to the finest grid.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            levels: list of dictionaries
+                Multigrid levels (such as defined in 'multigridLevels')
+            lambdaN1: 3D array
+                Lambda field of the finest grid (solver cells updated in place)
+            rhs: 3D array
+                Right-hand side of the finest grid
+            smoother: String
+                Type of smoothing sweep ("sor" or "red-black")
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lambdaN1: 3D array
+                Initialized lambda field of the finest grid"""
+    lambdas = [lambdaN1] + [lev["lambda"] for lev in levels[1:]]
+    rhss = [rhs] + [np.zeros(lev["shape"], dtype = rhs.dtype) for lev in levels[1:]]
+    for l in range(1, len(levels)):
+        restrictToCoarse(rhss[l - 1], rhss[l], levels[l]["cells"], 4.)
+    
+    for l in range(len(levels) - 1, -1, -1):
+        cells = levels[l]["cells"]
+        lambdas[l][cells[:, 0], cells[:, 1], cells[:, 2]] = 0.
+        if l < len(levels) - 1:
+            prolongToFine(lambdas[l + 1], levels[l + 1]["isFluid"], lambdas[l], cells)
+        multigridCycle(levels = levels, level = l, lam = lambdas[l],
+                       rhs = rhss[l], smoother = smoother)
+    
+    return lambdas[0]
+
+def nestedInitialization(levels, lambdaN1, rhs, maxIterations, thresholdIterations):
+    """ Initializes the finest lambda field by grid sequencing: the right-hand
+    side is restricted down to the coarsest grid, lambda is solved there
+    using SOR and the solution is interpolated to initialize the SOR of the 
+    next finer grid, up to the finest grid (which is not solved). 
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            levels: list of dictionaries
+                Grids from the finest to the coarsest one (such as defined 
+                in 'multigridLevels')
+            lambdaN1: 3D array
+                Lambda field of the finest grid (solver cells updated in place)
+            rhs: 3D array
+                Right-hand side of the finest grid
+            maxIterations: int
+                Maximum number of SOR iterations on each coarse grid
+            thresholdIterations: float
+                Threshold of the relative variation of lambda between 2 
+                iterations for stopping the SOR on each coarse grid
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lambdaN1: 3D array
+                Initialized lambda field of the finest grid"""
+    lambdas = [lambdaN1] + [lev["lambda"] for lev in levels[1:]]
+    rhss = [rhs] + [np.zeros(lev["shape"], dtype = rhs.dtype) for lev in levels[1:]]
+    for l in range(1, len(levels)):
+        restrictToCoarse(rhss[l - 1], rhss[l], levels[l]["cells"], 4.)
+    for l in range(len(levels) - 1, -1, -1):
+        cells = levels[l]["cells"]
+        lambdas[l][cells[:, 0], cells[:, 1], cells[:, 2]] = 0.
+        if l < len(levels) - 1:
+            prolongToFine(lambdas[l + 1], levels[l + 1]["isFluid"], lambdas[l], cells)
+        if l == 0:
+            break
+        omega = relaxationFactor(jacobiSpectralRadius(*levels[l]["shape"],
+                                                      A = levels[l]["A"],
+                                                      B = levels[l]["B"]))
+        for N in range(maxIterations):
+            change, norm = smoothSor(cells, lambdas[l], rhss[l], levels[l]["invDiag"],
+                                     levels[l]["flags"], omega, levels[l]["A"],
+                                     levels[l]["B"])
+            if norm == 0 or change / norm < thresholdIterations:
+                break
+        print("Grid sequencing: grid {0} solved in {1} iterations"\
+              .format(levels[l]["shape"], N + 1))
+    
+    return lambdas[0]
+
+def sparseOperator(cells4Solver, flags, invDiag, A, B):
+    """ Assembles the 7-point stencil of the lambda equation into a sparse
+    (CSR) matrix whose unknowns are the cells of the solver. The matrix is
+    symmetric positive definite for a vertically uniform grid (the diagonal
+    is then 2 * (o + A*p + B*q)).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            cells4Solver: 2D array
+                Array of 3D cell coordinates for which the wind solver is applied
+            flags: 3D array
+                Obstacle flags coding the coefficients of the equation
+            invDiag: 3D array
+                Inverse of the diagonal coefficients of the equation
+            A: float
+                Squared ratio of the grid spacing along X and Y axis
+            B: 2D array
+                Squared ratios of the grid spacing along X and Z axis (upper
+                and lower neighbours of each level)
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            matrix: scipy.sparse.csr_matrix
+                Matrix of the lambda equation (one row per cell of cells4Solver)"""
+    nCells = cells4Solver.shape[0]
+    i, j, k = cells4Solver[:, 0], cells4Solver[:, 1], cells4Solver[:, 2]
+    cellFlags = flags[i, j, k]
+    
+    # Index of each solver cell in the matrix (-1 for the other cells)
+    cellIndex = np.full(flags.shape, -1, dtype = np.int64)
+    cellIndex[i, j, k] = np.arange(nCells)
+    
+    rows = [np.arange(nCells)]
+    cols = [np.arange(nCells)]
+    values = [1. / invDiag[i, j, k].astype(np.float64)]
+    # Only the neighbours being solver cells are unknowns (lambda is fixed elsewhere)
+    for flag, factor, di, dj, dk in [(FLAG_E, 1., 1, 0, 0), (FLAG_F, 1., -1, 0, 0),
+                                     (FLAG_G, A, 0, 1, 0), (FLAG_H, A, 0, -1, 0),
+                                     (FLAG_M, B[0, k], 0, 0, 1), (FLAG_N, B[1, k], 0, 0, -1)]:
+        neighbour = cellIndex[i + di, j + dj, k + dk]
+        isKept = (neighbour >= 0) & (cellFlags & flag == 0)
+        rows.append(np.arange(nCells)[isKept])
+        cols.append(neighbour[isKept])
+        values.append(-np.broadcast_to(factor, (nCells, ))[isKept])
+    
+    matrix = sparse.csr_matrix((np.concatenate(values),
+                                (np.concatenate(rows), np.concatenate(cols))),
+                               shape = (nCells, nCells))
+    matrix.sort_indices()
+    
+    return matrix
+
+def krylovPreconditioner(matrix, preconditioner):
+    """ Creates the function applying the conjugate gradient preconditioner
+    to a residual vector.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            matrix: scipy.sparse.csr_matrix
+                Matrix of the lambda equation
+            preconditioner: String
+                Type of preconditioner ("jacobi", "ic" or "amg"). If "amg" is
+                chosen while the 'pyamg' package is not installed, "ic" is used
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            applyPreconditioner: function
+                Function returning the preconditioned vector of a residual vector"""
+    if preconditioner == "amg" and pyamg is None:
+        print("'pyamg' Python package is missing, 'ic' preconditioner used instead of 'amg'")
+        preconditioner = "ic"
+    
+    if preconditioner == "jacobi":
+        invDiag = 1. / matrix.diagonal()
+        applyPreconditioner = lambda r: invDiag * r
+    elif preconditioner == "ic":
+        diag = icFactor(matrix.indptr, matrix.indices, matrix.data)
+        applyPreconditioner = lambda r: icApply(matrix.indptr, matrix.indices,
+                                                matrix.data, diag, r)
+    else:
+        amgPreconditioner = pyamg.smoothed_aggregation_solver(matrix).aspreconditioner(cycle = "V")
+        applyPreconditioner = lambda r: amgPreconditioner.matvec(r)
+    
+    return applyPreconditioner
+
+def krylovSolve(operator, lam, rhs, preconditioner, maxIterations,
+                thresholdIterations, feedback = None, history = None,
+                telemetry = None, telemetryInterval = TELEMETRY_INTERVAL,
+                divergenceFactor = 1., timeStart = None):
+    """ Solves the lambda equation using a preconditioned conjugate gradient
+    applied to the sparse matrix of the equation. The solver stops when the
+    residual norm relative to the initial divergence norm (2-norms of
+    rhs - operator(lambda) and rhs) goes under the threshold, such that the
+    criterion is comparable between runs whatever the initial lambda. The
+    sparse matrix and the preconditioner are stored in the operator.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            operator: dictionary
+                Operator of the lambda equation (such as returned by 'solverOperator')
+            lam: 3D array
+                Initial lambda field (values outside solver cells are kept fixed)
+            rhs: 3D array
+                Right-hand side of the lambda equation
+            preconditioner: String
+                Type of preconditioner ("jacobi", "ic" or "amg")
+            maxIterations: int
+                Maximum number of conjugate gradient iterations
+            thresholdIterations: float
+                Threshold of the relative residual norm for stopping the solver
+            feedback: Qgis.core class QgsProcessingFeedback, default None
+                Base class for providing feedback to QGIS from a processing algorithm (if not in standalone mode).
+            history: list, default None
+                List completed by the records of the convergence state (such
+                as defined in 'recordConvergence'). If None, nothing is recorded
+            telemetry: function, default None
+                Function called with each record of the convergence state
+            telemetryInterval: int, default TELEMETRY_INTERVAL
+                Number of iterations between two records of the convergence state
+            divergenceFactor: float, default 1.
+                Factor converting the residual of the lambda equation into
+                the divergence of the wind field
+            timeStart: float, default None
+                Time of the solver start (elapsed times of the records are 
+                calculated from it). If None, the start of this function is used
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lam: 3D array
+                Lambda field solution of the equation"""
+    timeStartIterations = time.time()
+    if timeStart is None:
+        timeStart = timeStartIterations
+    cells4Solver = operator["cells"]
+    i, j, k = cells4Solver[:, 0], cells4Solver[:, 1], cells4Solver[:, 2]
+    if "matrix" not in operator:
+        operator["matrix"] = sparseOperator(cells4Solver = cells4Solver,
+                                            flags = operator["flags"],
+                                            invDiag = operator["invDiag"],
+                                            A = operator["A"], B = operator["B"])
+        operator["preconditioners"] = {}
+    matrix = operator["matrix"]
+    if preconditioner not in operator["preconditioners"]:
+        operator["preconditioners"][preconditioner] = krylovPreconditioner(matrix = matrix,
+                                                                           preconditioner = preconditioner)
+    applyPreconditioner = operator["preconditioners"][preconditioner]
+    
+    # The correction of the initial lambda is solved (the residual takes
+    # into account the lambda values of the cells which are not solved),
+    # the Krylov vectors being in double precision whatever the lambda precision
+    residual = calcResidual(cells4Solver, lam, rhs, np.zeros(lam.shape, dtype = lam.dtype),
+                            operator["invDiag"], operator["flags"],
+                            operator["A"], operator["B"])[i, j, k].astype(np.float64)
+    rhsNorm = np.linalg.norm(rhs[i, j, k].astype(np.float64))
+    if rhsNorm == 0:
+        rhsNorm = 1.
+    correction = np.zeros(cells4Solver.shape[0])
+    z = applyPreconditioner(residual)
+    direction = z.copy()
+    rz = np.dot(residual, z)
+    for N in range(maxIterations):
+        matrixDirection = matrix.dot(direction)
+        step = rz / np.dot(direction, matrixDirection)
+        correction += step * direction
+        residual -= step * matrixDirection
+        
+        # Record the convergence state
+        relativeResidual = np.linalg.norm(residual) / rhsNorm
+        if (history is not None) and (((N + 1) % telemetryInterval == 0)\
+                                      or (N == maxIterations - 1)\
+                                      or (relativeResidual < thresholdIterations)):
+            recordConvergence(history = history, telemetry = telemetry,
+                              iteration = N + 1, eps = relativeResidual,
+                              maxResidual = np.abs(residual).max(),
+                              divergenceNorm = divergenceFactor\
+                                  * np.sqrt(np.mean(residual ** 2)),
+                              cellsPerIteration = residual.size,
+                              timeStart = timeStart,
+                              timeStartIterations = timeStartIterations)
+        
+        # Check if the condition for ending process is reached
+        if relativeResidual < thresholdIterations:
+            break
+        # Feedback (console and QGIS) every 50 iterations
+        elif N % 50 == 0:
+            textToSend = "Iteration {0} (max {1}) - residual = {2} >= {3}"\
+                .format(N + 1, maxIterations, np.round(relativeResidual,6),
+                        thresholdIterations)
+            print(textToSend)
+            if feedback is not None:
+                feedback.setProgressText(textToSend)
+                if feedback.isCanceled():
+                    feedback.setProgressText("Calculation cancelled by user")
+                    break
+        
+        z = applyPreconditioner(residual)
+        rzNew = np.dot(residual, z)
+        direction = z + rzNew / rz * direction
+        rz = rzNew
+    
+    lam[i, j, k] += correction
+    print("Conjugate gradient stopped after {0} iterations (residual = {1:.2e})"\
+          .format(N + 1, relativeResidual))
+    
+    return lam
+
+def recordConvergence(history, telemetry, iteration, eps, maxResidual,
+                      divergenceNorm, cellsPerIteration, timeStart,
+                      timeStartIterations):
+    """ Adds the convergence state of a solver iteration to the convergence
+    history and sends it to the telemetry function.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            history: list
+                Records of the previous convergence states (completed by the
+                new record)
+            telemetry: function
+                Function called with the new record (None if no function)
+            iteration: int
+                Iteration number
+            eps: float
+                Stopping criterion of the solver at this iteration
+            maxResidual: float
+                Maximum absolute residual of the lambda equation
+            divergenceNorm: float
+                Root mean square of the wind field divergence
+            cellsPerIteration: int
+                Number of cell updates of an iteration
+            timeStart: float
+                Time of the solver start
+            timeStartIterations: float
+                Time of the start of the iterations
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            record: dictionary
+                Convergence state (the keys being the columns of the history)"""
+    elapsedTime = time.time() - timeStart
+    # The speed is calculated since the previous record
+    if history:
+        previousIteration = history[-1][ITERATION_FIELD]
+        previousTime = history[-1][ELAPSED_TIME_FIELD]
+    else:
+        previousIteration = 0
+        previousTime = timeStartIterations - timeStart
+    record = {ITERATION_FIELD: iteration,
+              EPS_FIELD: eps,
+              MAX_RESIDUAL_FIELD: maxResidual,
+              DIVERGENCE_NORM_FIELD: divergenceNorm,
+              CELLS_PER_SECOND_FIELD: cellsPerIteration * (iteration - previousIteration)\
+                  / max(elapsedTime - previousTime, 1e-9),
+              ELAPSED_TIME_FIELD: elapsedTime}
+    history.append(record)
+    if telemetry is not None:
+        telemetry(record)
+    
+    return record
+
+def sorOmega(nx, ny, nz, A):
+    """ Calculates the SOR relaxation factor used by default by the solver.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            nx: int
+                Number of cells along X-axis
+            ny: int
+                Number of cells along Y-axis
+            nz: int
+                Number of cells along Z-axis
+            A: float
+                Ratio dx²/dy²
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            omega: float
+                Relaxation factor"""
+    Xi = ((np.cos(np.pi / nx) + A * np.cos(np.pi / ny)) / (1 + A)) ** 2
+
+    omega = 2. * ((1 - np.sqrt(1 - Xi)) / Xi)
+    if (omega < 1) or (omega > 2):
+        omega = 1.78
+    
+    return omega
+
+def jacobiSpectralRadius(nx, ny, nz, A, B, lines = False):
+    """ Calculates the spectral radius of the (point or vertical line) Jacobi
+    iteration of the lambda equation on a box having Dirichlet conditions on
+    the lateral and top faces and a wall at the ground.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            nx: int
+                Number of cells along X-axis
+            ny: int
+                Number of cells along Y-axis
+            nz: int
+                Number of cells along Z-axis
+            A: float
+                Ratio dx²/dy²
+            B: 2D array
+                Ratios dx²/dz² of the upper (first row) and lower (second row)
+                neighbours of each level (multiplied by the square of the alpha 
+                ratio), their mean being used
+            lines: boolean, default False
+                Whether the spectral radius of the vertical line Jacobi
+                iteration is calculated (else the point Jacobi one)
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            rho: float
+                Spectral radius of the Jacobi iteration"""
+    B = np.mean(B)
+    # The lowest mode is a half-wave horizontally and a quarter-wave vertically
+    cosX = np.cos(np.pi / nx)
+    cosY = np.cos(np.pi / ny)
+    cosZ = np.cos(np.pi / (2 * nz))
+    if lines:
+        return (cosX + A * cosY) / (1 + A + B * (1 - cosZ))
+    else:
+        return (cosX + A * cosY + B * cosZ) / (1 + A + B)
+
+def relaxationFactor(rho):
+    """ Calculates the optimal SOR relaxation factor from the spectral
+    radius of the corresponding Jacobi iteration.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            rho: float
+                Spectral radius of the Jacobi iteration
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            omega: float
+                Relaxation factor"""
+    return 2. / (1 + np.sqrt(1 - min(rho, 1.) ** 2))
+
+def chebyshevOmega(omega, rhoJacobi2, firstHalfSweep = False):
+    """ Calculates the relaxation factor of the next half-sweep (one color)
+    of the Chebyshev accelerated SOR (Press et al., Numerical Recipes, 19.5).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            omega: float
+                Relaxation factor of the current half-sweep
+            rhoJacobi2: float
+                Square of the spectral radius of the Jacobi iteration
+            firstHalfSweep: boolean, default False
+                Whether the current half-sweep is the first one
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            omega: float
+                Relaxation factor of the next half-sweep"""
+    if firstHalfSweep:
+        return 1. / (1 - rhoJacobi2 / 2)
+    else:
+        return 1. / (1 - rhoJacobi2 * omega / 4)
+
+def estimateOmega(changes, omega):
+    """ Estimates a near-optimal SOR relaxation factor from the decay of the
+    lambda variation during the last iterations (Hageman et Young, 1981). As
+    long as omega is lower than the optimal one, the decay ratio tends to the
+    spectral radius of the SOR iteration, giving the spectral radius of the
+    Jacobi iteration. The estimated relaxation factor is thus never lower
+    than the current one.
+    
+    References:
+        Hageman, Louis A., et David M. Young. « Applied Iterative Methods ».
+        Academic Press, New York, 1981.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            changes: list
+                Sum of the absolute variation of lambda at each of the last iterations
+            omega: float
+                Relaxation factor used for these iterations
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            omega: float
+                Estimated relaxation factor"""
+    # Mean decay ratio over the last half of the iterations
+    nRatios = len(changes) // 2
+    if changes[-1 - nRatios] <= 0 or changes[-1] <= 0:
+        return omega
+    mu = (changes[-1] / changes[-1 - nRatios]) ** (1. / nRatios)
+    if mu >= 1:
+        return omega
+    rhoJacobi2 = (mu + omega - 1) ** 2 / (mu * omega ** 2)
+    
+    return max(omega, relaxationFactor(np.sqrt(rhoJacobi2)))
+
+def warmUp(precision = PRECISION, solverMethod = SOLVER_METHOD, relaxation = RELAXATION,
+           gridSequencing = GRID_SEQUENCING, lambdaCache = LAMBDA_CACHE,
+           freeStream = FREE_STREAM, lateralBoundary = LATERAL_BOUNDARY):
+    """ Compiles the numba kernels of the solver (or loads them from the 
+    cache of compiled kernels) by applying the solver to a small grid, such
+    as the first calculation does not wait for their compilation. The grid 
+    is created such as in MainCalculation.main, the kernels being thus 
+    compiled for the argument types of the calculation (C-ordered int32 
+    cells, integer grid spacings).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            precision: String, default PRECISION
+                Floating point precision of the 3D arrays ("float64" or "float32")
+            solverMethod: String, default SOLVER_METHOD
+                Method used to iterate lambda (see 'solver')
+            relaxation: String, default RELAXATION
+                Way the SOR relaxation factor is set (see 'solver')
+            gridSequencing: int, default GRID_SEQUENCING
+                Number of grid sequencing levels (see 'solver')
+            lambdaCache: boolean, default LAMBDA_CACHE
+                Whether the calculations are initialized from the lambda of
+                a previous calculation (the initial lambda being then rescaled)
+            freeStream: boolean, default FREE_STREAM
+                Whether only the levels below the free stream region are solved
+            lateralBoundary: String, default LATERAL_BOUNDARY
+                Boundary condition of the lateral faces of the domain
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            None"""
+    nx, ny, nz = 12, 12, 10
+    buildGrid3D = np.ones((nx, ny, nz), dtype = np.int32)
+    buildGrid3D[1:nx-1, 1:ny-1, 0] = 0
+    buildGrid3D[5:7, 5:7, 1:4] = 0
+    cells4Solver = np.transpose(np.where(buildGrid3D == 1))
+    cells4Solver = cells4Solver[(cells4Solver[:, 0] > 0) & (cells4Solver[:, 0] < nx - 1)\
+                                & (cells4Solver[:, 1] > 0) & (cells4Solver[:, 1] < ny - 1)\
+                                & (cells4Solver[:, 2] > 0) & (cells4Solver[:, 2] < nz - 1)]
+    cells4Solver = np.ascontiguousarray(cells4Solver.astype(np.int32))
+    buildingCoordinates = np.stack(np.where(buildGrid3D == 0)).astype(np.int32)
+    
+    # Initial wind speed located on the cell faces, null at the building faces
+    u0 = np.zeros((nx, ny, nz), dtype = precision)
+    v0 = np.zeros((nx, ny, nz), dtype = precision)
+    w0 = np.zeros((nx, ny, nz), dtype = precision)
+    u0[:, :, 1:] = np.linspace(1., 2., nz - 1)
+    v0[:, :, 1:] = np.linspace(0.5, 1., nz - 1)
+    for wind, axis in [(u0, 0), (v0, 1), (w0, 2)]:
+        wind[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2]] = 0
+        neighbour = buildingCoordinates.copy()
+        neighbour[axis] += 1
+        wind[neighbour[0], neighbour[1], neighbour[2]] = 0
+    
+    # The grid spacings are integers as in the calculation (QGIS integer parameters)
+    parameters = {"x": np.arange(nx), "y": np.arange(ny), "z": np.arange(nz),
+                  "dx": 1, "dy": 1, "dz": 1, "u0": u0, "v0": v0, "w0": w0,
+                  "buildingCoordinates": buildingCoordinates,
+                  "cells4Solver": cells4Solver, "solverMethod": solverMethod,
+                  "precision": precision, "relaxation": relaxation,
+                  "gridSequencing": gridSequencing, "freeStream": freeStream,
+                  "lateralBoundary": lateralBoundary}
+    with WARM_UP_LOCK:
+        solver(**parameters)
+        # A calculation initialized from a cached lambda rescales it
+        if lambdaCache:
+            solver(initialLambda = np.ones((nx, ny, nz), dtype = precision), **parameters)
+
+def initThreadingLayer():
+    """ Launches the numba threading layer from the calling thread (only 
+    once, the next calls doing nothing). The "tbb" threading layer hangs at
+    the exit of the interpreter when it is launched the first time by another
+    thread than the main thread (e.g. a QGIS task or the warm-up thread), 
+    thus it is moved after the other layers ("workqueue" being always 
+    available) in that case (unless a layer has been explicitly set). The parallel kernel used is compiled 
+    for the argument types of the calculation (C-ordered int32 cells).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            None
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            None"""
+    global THREADING_LAYER_LAUNCHED
+    with WARM_UP_LOCK:
+        if THREADING_LAYER_LAUNCHED:
+            return
+        if threading.current_thread() is not threading.main_thread()\
+            and numba.config.THREADING_LAYER == "default":
+            numba.config.THREADING_LAYER_PRIORITY = \
+                [layer for layer in numba.config.THREADING_LAYER_PRIORITY if layer != "tbb"] + ["tbb"]
+        cells = np.ascontiguousarray(np.zeros((1, 3), dtype = np.int32))
+        lam = np.zeros((1, 1, 1))
+        changeNorms(cells, lam, lam)
+        THREADING_LAYER_LAUNCHED = True
+
+@jit(nopython=True, nogil=True, cache=True)
+def decodeFlag(flag):
+    # Coefficients (e, f, g, h, m, n, o, p, q) coded by an obstacle flag
+    return (0. if flag & FLAG_E else 1.,
+            0. if flag & FLAG_F else 1.,
+            0. if flag & FLAG_G else 1.,
+            0. if flag & FLAG_H else 1.,
+            0. if flag & FLAG_M else 1.,
+            0. if flag & FLAG_N else 1.,
+            0.5 if flag & FLAG_O else 1.,
+            0.5 if flag & FLAG_P else 1.,
+            0.5 if flag & FLAG_Q else 1.)
+
+@jit(nopython=True, nogil=True, cache=True)
+def calcLambda(cells4Solver, lambdaN, lambdaN1, omega, alpha1, u0, v0, w0, dx, dy, dz, flags, DESCENDING_Y, A, B):
+    # Vertically uniform grid only (the vertical coefficients of all levels 
+    # being equal)
+    # Go descending order along y
+    if DESCENDING_Y:
+        for k, j, i in np.flip(cells4Solver):
+            e, f, g, h, m, n, o, p, q = decodeFlag(flags[i, j, k])
+            lambdaN1[i, j, k] = omega * (
+                ((-1.) * (dx ** 2 * (-2. * alpha1 ** 2) * (((u0[i, j, k] - u0[i + 1, j, k]) / (dx) + (
+                        v0[i, j, k] - v0[i, j + 1, k]) / (dy) +
+                                                            (w0[i, j, k] - w0[i, j, k + 1]) / (dz)))) + (
+                          e * lambdaN[i - 1, j, k] + f * lambdaN1[i + 1, j, k] + A * (
+                          g * lambdaN[i, j - 1, k] + h * lambdaN1[i, j + 1, k]) + B[0, k] * (
+                                  m * lambdaN[i, j, k - 1] + n * lambdaN1[i, j, k + 1]))) / (
+                        2. * (o + A * p + B[0, k] * q))) + (1 - omega) * lambdaN1[i, j, k]  
+                                      
+    else:
+        for i, j, k in cells4Solver:
+            e, f, g, h, m, n, o, p, q = decodeFlag(flags[i, j, k])
+            lambdaN1[i, j, k] = omega * (
+                ((-1.) * (dx ** 2 * (-2. * alpha1 ** 2) * (((u0[i + 1, j, k] - u0[i, j, k]) / (dx) + (
+                        v0[i, j + 1, k] - v0[i, j, k]) / (dy) +
+                                                            (w0[i, j, k + 1] - w0[i, j, k]) / (dz)))) + (
+                          e * lambdaN[i + 1, j, k] + f * lambdaN1[i - 1, j, k] + A * (
+                          g * lambdaN[i, j + 1, k] + h * lambdaN1[i, j - 1, k]) + B[0, k] * (
+                                  m * lambdaN[i, j, k + 1] + n * lambdaN1[i, j, k - 1]))) / (
+                        2. * (o + A * p + B[0, k] * q))) + (1 - omega) * lambdaN1[i, j, k]  
+                                      
+    return lambdaN1
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def smoothColor(colorCells, lam, rhs, invDiag, flags, omega, A, B):
+    # SOR update of the cells of a color using a precalculated right-hand side
+    # and inverse diagonal: all neighbours of a cell have the other color thus
+    # all cells of 'colorCells' can be updated simultaneously. Returns the sums
+    # of the absolute lambda variations and of the absolute updated lambda
+    change = 0.
+    norm = 0.
+    for c in prange(colorCells.shape[0]):
+        i = colorCells[c, 0]
+        j = colorCells[c, 1]
+        k = colorCells[c, 2]
+        e, f, g, h, m, n, o, p, q = decodeFlag(flags[i, j, k])
+        lamOld = lam[i, j, k]
+        lamNew = omega * (rhs[i, j, k] + (
+                e * lam[i + 1, j, k] + f * lam[i - 1, j, k] + A * (
+                g * lam[i, j + 1, k] + h * lam[i, j - 1, k]) + (
+                B[0, k] * m * lam[i, j, k + 1] + B[1, k] * n * lam[i, j, k - 1]))) * invDiag[i, j, k]\
+            + (1 - omega) * lamOld
+        lam[i, j, k] = lamNew
+        change += abs(lamNew - lamOld)
+        norm += abs(lamNew)
+    
+    return change, norm
+
+@jit(nopython=True, nogil=True, cache=True)
+def smoothSor(cells, lam, rhs, invDiag, flags, omega, A, B):
+    # Same as calcLambda (ascending order) but using a precalculated right-hand 
+    # side and inverse diagonal. Returns the sums of the absolute lambda 
+    # variations and of the absolute updated lambda
+    change = 0.
+    norm = 0.
+    for c in range(cells.shape[0]):
+        i = cells[c, 0]
+        j = cells[c, 1]
+        k = cells[c, 2]
+        e, f, g, h, m, n, o, p, q = decodeFlag(flags[i, j, k])
+        lamOld = lam[i, j, k]
+        lamNew = omega * (rhs[i, j, k] + (
+                e * lam[i + 1, j, k] + f * lam[i - 1, j, k] + A * (
+                g * lam[i, j + 1, k] + h * lam[i, j - 1, k]) + (
+                B[0, k] * m * lam[i, j, k + 1] + B[1, k] * n * lam[i, j, k - 1]))) * invDiag[i, j, k]\
+            + (1 - omega) * lamOld
+        lam[i, j, k] = lamNew
+        change += abs(lamNew - lamOld)
+        norm += abs(lamNew)
+    
+    return change, norm
+
+@jit(nopython=True, nogil=True, cache=True)
+def smoothSorMasked(mask, lam, rhs, invDiag, flags, omega, A, B):
+    # Same as smoothSor but sweeping the grid in memory order (the solver
+    # cells being identified by 'mask') instead of reading a list of cells
+    nx, ny, nz = lam.shape
+    change = 0.
+    norm = 0.
+    for i in range(1, nx - 1):
+        for j in range(1, ny - 1):
+            for k in range(1, nz - 1):
+                if not mask[i, j, k]:
+                    continue
+                e, f, g, h, m, n, o, p, q = decodeFlag(flags[i, j, k])
+                lamOld = lam[i, j, k]
+                lamNew = omega * (rhs[i, j, k] + (
+                        e * lam[i + 1, j, k] + f * lam[i - 1, j, k] + A * (
+                        g * lam[i, j + 1, k] + h * lam[i, j - 1, k]) + (
+                        B[0, k] * m * lam[i, j, k + 1] + B[1, k] * n * lam[i, j, k - 1]))) * invDiag[i, j, k]\
+                    + (1 - omega) * lamOld
+                lam[i, j, k] = lamNew
+                change += abs(lamNew - lamOld)
+                norm += abs(lamNew)
+    
+    return change, norm
+
+@jit(nopython=True, nogil=True, cache=True)
+def calcDivergence(cells, u0, v0, w0, dx, dy, dz, factor, rhs):
+    # Divergence of the initial wind field multiplied by 'factor' in each cell
+    # ('dz' being the thickness of each level)
+    for c in range(cells.shape[0]):
+        i = cells[c, 0]
+        j = cells[c, 1]
+        k = cells[c, 2]
+        rhs[i, j, k] = factor * ((u0[i + 1, j, k] - u0[i, j, k]) / dx
+                                 + (v0[i, j + 1, k] - v0[i, j, k]) / dy
+                                 + (w0[i, j, k + 1] - w0[i, j, k]) / dz[k])
+
+@jit(nopython=True, nogil=True, cache=True)
+def smoothSorBatch(cells, lam, rhs, invDiag, flags, omega, A, B, isActive, change, norm):
+    # Same as smoothSor for several right-hand sides (last axis of 'lam' and
+    # 'rhs'), only the active ones being updated. The sums of the absolute
+    # lambda variations and of the absolute updated lambda of each 
+    # right-hand side are stored in 'change' and 'norm'
+    nFields = isActive.size
+    change[:] = 0.
+    norm[:] = 0.
+    for c in range(cells.shape[0]):
+        i = cells[c, 0]
+        j = cells[c, 1]
+        k = cells[c, 2]
+        e, f, g, h, m, n, o, p, q = decodeFlag(flags[i, j, k])
+        d = omega * invDiag[i, j, k]
+        for r in range(nFields):
+            if not isActive[r]:
+                continue
+            lamOld = lam[i, j, k, r]
+            lamNew = d * (rhs[i, j, k, r] + (
+                    e * lam[i + 1, j, k, r] + f * lam[i - 1, j, k, r] + A * (
+                    g * lam[i, j + 1, k, r] + h * lam[i, j - 1, k, r]) + (
+                    B[0, k] * m * lam[i, j, k + 1, r] + B[1, k] * n * lam[i, j, k - 1, r])))\
+                + (1 - omega) * lamOld
+            lam[i, j, k, r] = lamNew
+            change[r] += abs(lamNew - lamOld)
+            norm[r] += abs(lamNew)
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def smoothLines(lines, lineCells, lam, rhs, invDiag, flags, omega, A, B):
+    # SOR update of vertical lines: the equations of the cells of a line are
+    # solved together (tridiagonal system solved by the Thomas algorithm), 
+    # the horizontal neighbours being taken from the current lambda. Lines
+    # of a same color have no horizontal neighbours in common thus they are
+    # updated simultaneously. Returns the sums of the absolute lambda 
+    # variations and of the absolute updated lambda
+    change = 0.
+    norm = 0.
+    for l in prange(lines.shape[0]):
+        first = lines[l, 0]
+        nCells = lines[l, 1]
+        upper = np.empty(nCells)
+        solution = np.empty(nCells)
+        # Forward elimination
+        for t in range(nCells):
+            i = lineCells[first + t, 0]
+            j = lineCells[first + t, 1]
+            k = lineCells[first + t, 2]
+            e, f, g, h, m, n, o, p, q = decodeFlag(flags[i, j, k])
+            lineRhs = rhs[i, j, k] + e * lam[i + 1, j, k] + f * lam[i - 1, j, k] + A * (
+                    g * lam[i, j + 1, k] + h * lam[i, j - 1, k])
+            # The neighbours located below and above the line are known
+            if t == 0:
+                lineRhs += B[1, k] * n * lam[i, j, k - 1]
+                lowerCoef = 0.
+            else:
+                lowerCoef = -B[1, k] * n
+            if t == nCells - 1:
+                lineRhs += B[0, k] * m * lam[i, j, k + 1]
+            denominator = 1. / invDiag[i, j, k]
+            if t > 0:
+                denominator -= lowerCoef * upper[t - 1]
+                lineRhs -= lowerCoef * solution[t - 1]
+            upper[t] = -B[0, k] * m / denominator
+            solution[t] = lineRhs / denominator
+        # Back substitution and over-relaxation
+        for t in range(nCells - 1, -1, -1):
+            if t < nCells - 1:
+                solution[t] -= upper[t] * solution[t + 1]
+            i = lineCells[first + t, 0]
+            j = lineCells[first + t, 1]
+            k = lineCells[first + t, 2]
+            lamOld = lam[i, j, k]
+            lamNew = omega * solution[t] + (1 - omega) * lamOld
+            lam[i, j, k] = lamNew
+            change += abs(lamNew - lamOld)
+            norm += abs(lamNew)
+    
+    return change, norm
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def changeNorms(cells, lam, lamPrevious):
+    # Sums of the absolute lambda variations and of the absolute lambda
+    # values over the solver cells
+    change = 0.
+    norm = 0.
+    for c in prange(cells.shape[0]):
+        i = cells[c, 0]
+        j = cells[c, 1]
+        k = cells[c, 2]
+        change += abs(lam[i, j, k] - lamPrevious[i, j, k])
+        norm += abs(lam[i, j, k])
+    
+    return change, norm
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def calcResidual(cells, lam, rhs, residual, invDiag, flags, A, B):
+    # Residual of the lambda equation (rhs - operator(lambda)) for each solver cell
+    for c in prange(cells.shape[0]):
+        i = cells[c, 0]
+        j = cells[c, 1]
+        k = cells[c, 2]
+        e, f, g, h, m, n, o, p, q = decodeFlag(flags[i, j, k])
+        residual[i, j, k] = rhs[i, j, k] + (
+                e * lam[i + 1, j, k] + f * lam[i - 1, j, k] + A * (
+                g * lam[i, j + 1, k] + h * lam[i, j - 1, k]) + (
+                B[0, k] * m * lam[i, j, k + 1] + B[1, k] * n * lam[i, j, k - 1])) - lam[i, j, k] / invDiag[i, j, k]
+    
+    return residual
+
+@jit(nopython=True, nogil=True, cache=True)
+def residualNorms(cells, lam, rhs, invDiag, flags, A, B):
+    # Maximum absolute value and sum of the squares of the residual of the
+    # lambda equation over the solver cells
+    maxResidual = 0.
+    squaredResidual = 0.
+    for c in range(cells.shape[0]):
+        i = cells[c, 0]
+        j = cells[c, 1]
+        k = cells[c, 2]
+        e, f, g, h, m, n, o, p, q = decodeFlag(flags[i, j, k])
+        residual = rhs[i, j, k] + (
+                e * lam[i + 1, j, k] + f * lam[i - 1, j, k] + A * (
+                g * lam[i, j + 1, k] + h * lam[i, j - 1, k]) + (
+                B[0, k] * m * lam[i, j, k + 1] + B[1, k] * n * lam[i, j, k - 1])) - lam[i, j, k] / invDiag[i, j, k]
+        maxResidual = max(maxResidual, abs(residual))
+        squaredResidual += residual * residual
+    
+    return maxResidual, squaredResidual
+
+@jit(nopython=True, nogil=True, cache=True)
+def setObstacleFlags(buildingCoordinates, flags, axisFlags):
+    # Set the flags of the neighbours of each building cell along each axis:
+    # the previous cell has a building as next neighbour and the next cell 
+    # has a building as previous neighbour (see obstacleFlags)
+    nx, ny, nz = flags.shape
+    for c in range(buildingCoordinates.shape[1]):
+        i = buildingCoordinates[0, c]
+        j = buildingCoordinates[1, c]
+        k = buildingCoordinates[2, c]
+        if i > 0:
+            flags[i - 1, j, k] |= axisFlags[0, 0] | axisFlags[0, 2]
+        if i < nx - 1:
+            flags[i + 1, j, k] |= axisFlags[0, 1] | axisFlags[0, 2]
+        if j > 0:
+            flags[i, j - 1, k] |= axisFlags[1, 0] | axisFlags[1, 2]
+        if j < ny - 1:
+            flags[i, j + 1, k] |= axisFlags[1, 1] | axisFlags[1, 2]
+        if k > 0:
+            flags[i, j, k - 1] |= axisFlags[2, 0] | axisFlags[2, 2]
+        if k < nz - 1:
+            flags[i, j, k + 1] |= axisFlags[2, 1] | axisFlags[2, 2]
+
+@jit(nopython=True, nogil=True, cache=True)
+def fixedLambdaNorm(cells, lam):
+    # Sum of the absolute lambda values of the cells which are not solved
+    # (without any temporary array, lambda being possibly memory-mapped)
+    norm = 0.
+    for i in range(lam.shape[0]):
+        for j in range(lam.shape[1]):
+            for k in range(lam.shape[2]):
+                norm += abs(lam[i, j, k])
+    for c in range(cells.shape[0]):
+        norm -= abs(lam[cells[c, 0], cells[c, 1], cells[c, 2]])
+    
+    return norm
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def restrictToCoarse(fine, coarse, coarseCells, factor):
+    # Restriction of a fine field to the coarse solver cells: mean of the
+    # 8 fine cells (2I-1 and 2I along each axis) gathered by a coarse cell
+    nx, ny, nz = fine.shape
+    for c in prange(coarseCells.shape[0]):
+        I = coarseCells[c, 0]
+        J = coarseCells[c, 1]
+        K = coarseCells[c, 2]
+        total = 0.
+        for i in range(2 * I - 1, min(2 * I + 1, nx - 1)):
+            for j in range(2 * J - 1, min(2 * J + 1, ny - 1)):
+                for k in range(2 * K - 1, min(2 * K + 1, nz - 1)):
+                    total += fine[i, j, k]
+        coarse[I, J, K] = factor * total / 8.
+    
+    return coarse
+
+@jit(nopython=True, nogil=True, parallel=True, cache=True)
+def prolongToFine(coarse, coarseIsFluid, fine, fineCells):
+    # Add the trilinear interpolation of a coarse field to the fine solver cells
+    # (weights 3/4 for the coarse cell containing the fine cell and 1/4 for
+    # the closest coarse neighbour along each axis, building cells being excluded)
+    for c in prange(fineCells.shape[0]):
+        i = fineCells[c, 0]
+        j = fineCells[c, 1]
+        k = fineCells[c, 2]
+        I = (i - 1) // 2 + 1
+        J = (j - 1) // 2 + 1
+        K = (k - 1) // 2 + 1
+        sI = 1 if i % 2 == 0 else -1
+        sJ = 1 if j % 2 == 0 else -1
+        sK = 1 if k % 2 == 0 else -1
+        total = 0.
+        weights = 0.
+        for ci in range(2):
+            wi = 0.75 - 0.5 * ci
+            for cj in range(2):
+                wj = 0.75 - 0.5 * cj
+                for ck in range(2):
+                    wk = 0.75 - 0.5 * ck
+                    if coarseIsFluid[I + ci * sI, J + cj * sJ, K + ck * sK]:
+                        total += wi * wj * wk * coarse[I + ci * sI, J + cj * sJ, K + ck * sK]
+                        weights += wi * wj * wk
+        if weights > 0:
+            fine[i, j, k] += total / weights
+    
+    return fine
+
+@jit(nopython=True, nogil=True, cache=True)
+def icFactor(indptr, indices, data):
+    # Diagonal of the incomplete Cholesky factorization keeping the sparsity
+    # of the matrix (for a 7-point stencil only the diagonal is modified)
+    nRows = indptr.size - 1
+    diag = np.zeros(nRows)
+    for r in range(nRows):
+        diag[r] = 0.
+        for jj in range(indptr[r], indptr[r + 1]):
+            c = indices[jj]
+            if c < r:
+                diag[r] -= data[jj] ** 2 / diag[c]
+            elif c == r:
+                diag[r] += data[jj]
+    
+    return diag
+
+@jit(nopython=True, nogil=True, cache=True)
+def icApply(indptr, indices, data, diag, residual):
+    # Solves (D + L) D^-1 (D + U) z = residual where L and U are the strict
+    # lower and upper parts of the matrix and D the incomplete Cholesky diagonal
+    nRows = indptr.size - 1
+    z = np.zeros(nRows)
+    for r in range(nRows):
+        s = residual[r]
+        for jj in range(indptr[r], indptr[r + 1]):
+            if indices[jj] < r:
+                s -= data[jj] * z[indices[jj]]
+        z[r] = s / diag[r]
+    for r in range(nRows - 1, -1, -1):
+        s = 0.
+        for jj in range(indptr[r], indptr[r + 1]):
+            if indices[jj] > r:
+                s += data[jj] * z[indices[jj]]
+        z[r] -= s / diag[r]
+    
+    return z
@@ -7,7 +7,8 @@ Created on Mon Oct  4 13:59:31 2021
 """
 import pandas as pd
 import numpy as np
-from .DataUtil import radToDeg, windDirectionFromXY, createIndex, prefix
+from .DataUtil import radToDeg, windDirectionFromXY, createIndex, prefix,\
+    levelInterpolation
 from .Obstacles import windRotation
 from osgeo.gdal import Grid, GridOptions
 from .GlobalVariables import HORIZ_WIND_DIRECTION, HORIZ_WIND_SPEED, WIND_SPEED,\
@@ -73,12 +74,23 @@ def saveBasicOutputs(cursor, z_out, dz, u, v, w, gridName,
                                          verticalWindProfile = verticalWindProfile,
                                          path = netcdf_base_dir_name)
 
+    # For a stretched grid, 'dz' is the thickness of each level (the first
+    # one being the ground level): height of the center of each level
+    if np.ndim(dz) > 0:
+        levelCenters = np.cumsum(dz) - np.asarray(dz) / 2 - dz[0]
+    
     horizOutputUrock = {z_i : "HORIZ_OUTPUT_UROCK_{0}".format(str(z_i).replace(".","_")) for z_i in z_out}
     for z_i in z_out:
         # Keep only wind field for a single horizontal plan (and convert carthesian
         # wind speed into polar at least for horizontal)
         tempoTable = "TEMPO_HORIZ"
-        if z_i % dz % (dz / 2) == 0:
+        if np.ndim(dz) > 0:
+            n_lev, n_lev1, weight1 = levelInterpolation(z = z_i, levelCenters = levelCenters)
+            weight = 1 - weight1
+            ufin = (weight * u[:,:,n_lev] + weight1 * u[:,:,n_lev1])
+            vfin = (weight * v[:,:,n_lev] + weight1 * v[:,:,n_lev1])
+            wfin = (weight * w[:,:,n_lev] + weight1 * w[:,:,n_lev1])
+        elif z_i % dz % (dz / 2) == 0:
             n_lev = int(z_i / dz) + 1
             ufin = u[:,:,n_lev]
             vfin = v[:,:,n_lev]
@@ -1,2 +1,6 @@
 # import qgis libs so that ve set the correct sip api version
-import qgis   # pylint: disable=W0611  # NOQA
\ No newline at end of file
+# (not available when only the numerical tests are run outside QGIS)
+try:
+    import qgis   # pylint: disable=W0611  # NOQA
+except ImportError:
+    pass
@@ -0,0 +1,53 @@
+# coding=utf-8
+"""Tests of the grid extends calculated from the obstacle zones."""
+
+import unittest
+import contextlib
+import io
+import sqlite3
+
+from ..GlobalVariables import ALONG_WIND_ZONE_EXTEND, CROSS_WIND_ZONE_EXTEND,\
+    GEOM_FIELD, DISPLACEMENT_LENGTH_FIELD, WAKE_LENGTH_FIELD
+from ..CalculatesIndicators import zoneExtends
+
+
+class ZoneExtendsTest(unittest.TestCase):
+    """Test the grid extends around the obstacle zones."""
+
+    def setUp(self):
+        # The geometries are stored as their "XMIN XMAX" extend along the
+        # X-axis (the only spatial functions used in the query)
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.create_function("ST_XMIN", 1, lambda geom: float(geom.split()[0]))
+        self.connection.create_function("ST_XMAX", 1, lambda geom: float(geom.split()[1]))
+        self.cursor = self.connection.cursor()
+        self.cursor.execute("""CREATE TABLE ZONE_PROPERTIES ({0} TEXT, {1} REAL, {2} REAL)"""\
+                            .format(GEOM_FIELD, DISPLACEMENT_LENGTH_FIELD, WAKE_LENGTH_FIELD))
+
+    def tearDown(self):
+        self.connection.close()
+
+    def extends(self, **parameters):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return zoneExtends(cursor = self.cursor, zonePropertiesTable = "ZONE_PROPERTIES",
+                               **parameters)
+
+    def test_no_zone(self):
+        """Test that the default extends are used when there is no zone."""
+        self.assertEqual(self.extends(),
+                         (ALONG_WIND_ZONE_EXTEND, ALONG_WIND_ZONE_EXTEND, CROSS_WIND_ZONE_EXTEND))
+
+    def test_zone_dimensions(self):
+        """Test that the extends are the maximum wake length downwind, the
+        maximum displacement length upwind and the maximum zone width cross
+        wind, scaled by the safety factor."""
+        self.cursor.executemany("INSERT INTO ZONE_PROPERTIES VALUES (?, ?, ?)",
+                                [("0 10", 12., 45.), ("30 38", 15., 30.)])
+        self.assertEqual(self.extends(), (45., 15., 10.))
+        self.assertEqual(self.extends(safetyFactor = 1.5), (67.5, 22.5, 15.))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ZoneExtendsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
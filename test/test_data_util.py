@@ -0,0 +1,80 @@
+# coding=utf-8
+"""Tests of the data utilities used by the calculation and to save the outputs."""
+
+import unittest
+import numpy as np
+
+from ..DataUtil import levelInterpolation, centersToFaces, facesToCenters
+
+
+class DataUtilTest(unittest.TestCase):
+    """Test the data utilities."""
+
+    def setUp(self):
+        # Stretched grid levels (the first one being the ground level), such
+        # as in saveData.saveBasicOutputs
+        dz = np.array([2., 2., 3., 4.5, 6.75])
+        self.levelCenters = np.cumsum(dz) - dz / 2 - dz[0]
+        # Wind speed of each level, linear with the height of the level center
+        self.u = np.ones((3, 2, dz.size)) * (2 * self.levelCenters + 1)
+
+    def interpolate(self, z):
+        n_lev, n_lev1, weight1 = levelInterpolation(z = z, levelCenters = self.levelCenters)
+        return (1 - weight1) * self.u[:, :, n_lev] + weight1 * self.u[:, :, n_lev1]
+
+    def test_level_interpolation(self):
+        """Test the linear interpolation between the level centers."""
+        for z in [0.5, 1., 3.5, 5., self.levelCenters[-2]]:
+            with self.subTest(z = z):
+                np.testing.assert_allclose(self.interpolate(z), 2 * z + 1)
+
+    def test_level_interpolation_top(self):
+        """Test that an output height at or above the center of the top level
+        gives the wind speed of the top level."""
+        for z in [self.levelCenters[-1], self.levelCenters[-1] + 0.1, 100.]:
+            with self.subTest(z = z):
+                n_lev, n_lev1, weight1 = levelInterpolation(z = z, levelCenters = self.levelCenters)
+                self.assertEqual(n_lev1, self.levelCenters.size - 1)
+                np.testing.assert_allclose(self.interpolate(z), self.u[:, :, -1])
+
+    def test_faces_interpolation(self):
+        """Test that the plane by plane interpolations of the wind speed
+        between the cell centers and faces give the whole-grid averages."""
+        nx, ny, nz = 6, 5, 4
+        u, v, w = np.random.default_rng(0).random((3, nx, ny, nz))
+        uFaces, vFaces, wFaces = u.copy(), v.copy(), w.copy()
+        centersToFaces(uFaces, vFaces, wFaces)
+        np.testing.assert_allclose(uFaces[1:nx], (u[0:nx-1] + u[1:nx]) / 2)
+        np.testing.assert_allclose(vFaces[:, 1:ny], (v[:, 0:ny-1] + v[:, 1:ny]) / 2)
+        np.testing.assert_allclose(wFaces[:, :, 1:nz], (w[:, :, 0:nz-1] + w[:, :, 1:nz]) / 2)
+        for faces, field in zip([uFaces, vFaces, wFaces], [u, v, w]):
+            np.testing.assert_array_equal(faces[0, 0, 0], field[0, 0, 0])
+
+        uCenters, vCenters, wCenters = u.copy(), v.copy(), w.copy()
+        facesToCenters(uCenters, vCenters, wCenters)
+        inner = (slice(0, nx - 1), slice(0, ny - 1), slice(0, nz - 1))
+        np.testing.assert_allclose(uCenters[inner], (u[inner] + u[1:nx, 0:ny-1, 0:nz-1]) / 2)
+        np.testing.assert_allclose(vCenters[inner], (v[inner] + v[0:nx-1, 1:ny, 0:nz-1]) / 2)
+        np.testing.assert_allclose(wCenters[inner], (w[inner] + w[0:nx-1, 0:ny-1, 1:nz]) / 2)
+        for centers, field in zip([uCenters, vCenters, wCenters], [u, v, w]):
+            np.testing.assert_array_equal(centers[nx - 1], field[nx - 1])
+            np.testing.assert_array_equal(centers[:, ny - 1], field[:, ny - 1])
+            np.testing.assert_array_equal(centers[:, :, nz - 1], field[:, :, nz - 1])
+
+    def test_stretched_faces_interpolation(self):
+        """Test that on a stretched grid, the vertical wind speed interpolated
+        at the faces of the cells is exact for a linear profile."""
+        dz = np.array([2., 2., 3., 4.5, 6.75])
+        uFaces, vFaces, wFaces = self.u.copy(), self.u.copy(), self.u.copy()
+        centersToFaces(uFaces, vFaces, wFaces, dz = dz)
+        # Height of the bottom face of each level (above the ground level)
+        faceHeights = np.cumsum(dz) - dz - dz[0]
+        np.testing.assert_allclose(wFaces[:, :, 1:],
+                                   np.broadcast_to(2 * faceHeights[1:] + 1, (3, 2, dz.size - 1)))
+        np.testing.assert_array_equal(wFaces[:, :, 0], self.u[:, :, 0])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(DataUtilTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
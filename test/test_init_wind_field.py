@@ -0,0 +1,69 @@
+# coding=utf-8
+"""Tests of the vertical grid levels used to initialize the wind field."""
+
+import unittest
+import math
+import sqlite3
+import numpy as np
+
+from ..InitWindField import levelHeights, levelIndexQuery
+
+
+class LevelsTest(unittest.TestCase):
+    """Test the definition of the (possibly stretched) grid levels."""
+
+    def setUp(self):
+        # The SQL functions of H2 which are not defined in SQLite
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.create_function("TRUNC", 1, math.trunc)
+        self.connection.create_function("FLOOR", 1, math.floor)
+        self.connection.create_function("LN", 1, math.log)
+
+    def tearDown(self):
+        self.connection.close()
+
+    def levelIndex(self, height, **parameters):
+        query = levelIndexQuery(heightExpression = "{0!r}".format(float(height)),
+                                **parameters)
+        return self.connection.execute("SELECT " + query).fetchone()[0]
+
+    def test_level_heights(self):
+        """Test the thickness of the uniform and stretched levels."""
+        heights, thicknesses = levelHeights(maxHeight = 21, dz = 2)
+        np.testing.assert_allclose(heights, np.arange(1, 21, 2))
+        np.testing.assert_allclose(thicknesses, 2)
+
+        heights, thicknesses = levelHeights(maxHeight = 30, dz = 2, stretchingHeight = 5,
+                                            stretchingRatio = 1.5)
+        np.testing.assert_allclose(thicknesses, [2, 2, 2, 3, 4.5, 6.75])
+        np.testing.assert_allclose(heights, np.cumsum(thicknesses) - thicknesses / 2)
+
+    def test_level_heights_ratio(self):
+        """Test that a stretching ratio lower than 1 is refused."""
+        for stretchingRatio in [0.9, 0., -1.]:
+            with self.subTest(stretchingRatio = stretchingRatio):
+                with self.assertRaises(ValueError):
+                    levelHeights(maxHeight = 30, dz = 2, stretchingRatio = stretchingRatio)
+                with self.assertRaises(ValueError):
+                    levelIndexQuery("z", dz = 2, stretchingRatio = stretchingRatio)
+
+    def test_level_index_query(self):
+        """Test that the SQL level index of a height corresponds to the level
+        of 'levelHeights' containing this height."""
+        for parameters in [dict(dz = 2, stretchingHeight = 0, stretchingRatio = 1),
+                           dict(dz = 2, stretchingHeight = 5, stretchingRatio = 1.5),
+                           dict(dz = 3, stretchingHeight = 10, stretchingRatio = 1.1),
+                           dict(dz = 1, stretchingHeight = 0, stretchingRatio = 1.25)]:
+            heights, thicknesses = levelHeights(maxHeight = 100, **parameters)
+            bottoms = heights - thicknesses / 2
+            for n in range(heights.size):
+                for height in [bottoms[n] + 1e-3, heights[n],
+                               bottoms[n] + thicknesses[n] - 1e-3]:
+                    with self.subTest(height = height, **parameters):
+                        self.assertEqual(self.levelIndex(height, **parameters), n + 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(LevelsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
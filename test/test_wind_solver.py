@@ -0,0 +1,450 @@
+# coding=utf-8
+"""Regression tests of the wind solver methods on a small grid with a building."""
+
+import unittest
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+from ..DataUtil import centersToFaces
+from ..GlobalVariables import LIST_OF_SOLVER_METHODS, LIST_OF_PRECISIONS,\
+    DIVERGENCE_NORM_FIELD, ITERATION_FIELD, FREE_STREAM_MARGIN, DESCENDING_Y
+from ..WindSolver import solver, solverOperator, divergenceRhs, smoothSor,\
+    startSlabWorkers, slabIteration, stopSlabWorkers, solveCases, usesParallelKernels,\
+    batchSolver, freeStreamLevel, lateralFaceConditions, boundaryFlags,\
+    obstacleFlags, FLAG_E, FLAG_F, FLAG_G, FLAG_H, FLAG_M, FLAG_N, FLAG_O, FLAG_P, FLAG_Q
+
+
+def windCase(precision = "float64", nx = 30, ny = 24, nz = 14, meshSize = 2, dz = 2,
+             building = (slice(12, 16), slice(9, 14), slice(1, 6))):
+    """ Creates the inputs of the wind solver for a grid having a single
+    building, initialized (such as in MainCalculation.main) with a power law
+    wind profile blowing obliquely to the grid axes ('dz' being either the
+    thickness of all levels or of each level)."""
+    isFluid = np.ones((nx, ny, nz), dtype = np.int32)
+    isFluid[1:nx - 1, 1:ny - 1, 0] = 0
+    isFluid[building] = 0
+
+    thicknesses = np.full(nz, float(dz)) if np.ndim(dz) == 0 else np.asarray(dz, dtype = float)
+    profile = ((np.cumsum(thicknesses) - thicknesses / 2.) / 10.) ** 0.2
+    u0 = np.zeros((nx, ny, nz), dtype = precision)
+    v0 = np.zeros((nx, ny, nz), dtype = precision)
+    w0 = np.zeros((nx, ny, nz), dtype = precision)
+    u0[:] = np.cos(0.3) * profile
+    v0[:] = np.sin(0.3) * profile
+
+    cells4Solver = np.transpose(np.where(isFluid == 1))
+    cells4Solver = cells4Solver[(cells4Solver[:, 0] > 0) & (cells4Solver[:, 1] > 0)\
+                                & (cells4Solver[:, 2] > 0) & (cells4Solver[:, 0] < nx - 1)\
+                                & (cells4Solver[:, 1] < ny - 1) & (cells4Solver[:, 2] < nz - 1)]
+    buildingCoordinates = np.stack(np.where(isFluid == 0)).astype(np.int32)
+
+    # Wind speeds located on the faces of the cells, null at building faces
+    centersToFaces(u0, v0, w0, dz = dz)
+    u0[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2]] = 0
+    u0[buildingCoordinates[0] + 1, buildingCoordinates[1], buildingCoordinates[2]] = 0
+    v0[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2]] = 0
+    v0[buildingCoordinates[0], buildingCoordinates[1] + 1, buildingCoordinates[2]] = 0
+    w0[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2]] = 0
+    w0[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] + 1] = 0
+
+    return {"x": np.arange(nx) * meshSize, "y": np.arange(ny) * meshSize,
+            "z": np.concatenate([[0.], np.cumsum(thicknesses[1:])]),
+            "dx": meshSize, "dy": meshSize, "dz": dz,
+            "u0": u0, "v0": v0, "w0": w0,
+            "buildingCoordinates": buildingCoordinates,
+            "cells4Solver": cells4Solver.astype(np.int32)}
+
+def divergenceNorm(u, v, w, case):
+    """ Root mean square of the divergence of a wind field over the solver cells."""
+    i, j, k = case["cells4Solver"].T
+    dz = case["dz"] if np.ndim(case["dz"]) == 0 else case["dz"][k]
+    divergence = (u[i + 1, j, k] - u[i, j, k]) / case["dx"]\
+        + (v[i, j + 1, k] - v[i, j, k]) / case["dy"]\
+        + (w[i, j, k + 1] - w[i, j, k]) / dz
+
+    return np.sqrt(np.mean(divergence.astype(np.float64) ** 2))
+
+def baselineCoefficients(nx, ny, nz, buildingCoordinates):
+    """ Coefficients e, f, g, h, m, n, o, p and q of table 1 (Pardyjak et
+    Brown, 2003) of each cell, set such as in the initial version of the 
+    solver (from the indexes of the cells having a wall below AND front, 
+    left, right or behind)."""
+    e, f, g, h, m, n, o, p, q = np.ones((9, nx, ny, nz))
+    b0, b1, b2 = buildingCoordinates
+    index = lambda i, j, k: pd.MultiIndex.from_tuples(list(zip(*[i, j, k])))
+    values = lambda ind: (ind.get_level_values(0), ind.get_level_values(1), ind.get_level_values(2))
+    indBelow = index(b0, b1, b2 + 1)
+    indBelowFront = indBelow.intersection(index(b0, b1 - 1, b2))
+    indBelowBehind = indBelow.intersection(index(b0, b1 + 1, b2))
+    indBelowLeft = indBelow.intersection(index(b0 + 1, b1, b2))
+    indBelowRight = indBelow.intersection(index(b0 - 1, b1, b2))
+    indBelowAnyAround = indBelowFront.union(indBelowBehind).union(indBelowLeft).union(indBelowRight)
+    indBelowLeftRight = indBelowLeft.union(indBelowRight)
+    indBelowFrontBehind = indBelowFront.union(indBelowBehind)
+    if DESCENDING_Y:
+        e[b0 + 1, b1, b2] = 0.
+        e[values(indBelowLeft)] = 0.
+        f[b0 - 1, b1, b2] = 0.
+        f[values(indBelowRight)] = 0.
+        g[b0, b1 + 1, b2] = 0.
+        g[values(indBelowBehind)] = 0.
+        h[b0, b1 - 1, b2] = 0.
+        h[values(indBelowFront)] = 0.
+        m[b0, b1, b2 + 1] = 0.
+        n[b0, b1, b2 - 1] = 0.
+    else:
+        e[b0 - 1, b1, b2] = 0.
+        e[values(indBelowRight)] = 0.
+        f[b0 + 1, b1, b2] = 0.
+        f[values(indBelowLeft)] = 0.
+        g[b0, b1 - 1, b2] = 0.
+        g[values(indBelowFront)] = 0.
+        h[b0, b1 + 1, b2] = 0.
+        h[values(indBelowBehind)] = 0.
+        m[b0, b1, b2 - 1] = 0.
+        n[b0, b1, b2 + 1] = 0.
+    o[b0 - 1, b1, b2] = 0.5
+    o[b0 + 1, b1, b2] = 0.5
+    p[b0, b1 - 1, b2] = 0.5
+    p[b0, b1 + 1, b2] = 0.5
+    q[b0, b1, b2 + 1] = 0.5
+    q[b0, b1, b2 - 1] = 0.5
+    n[values(indBelowAnyAround)] = 0.
+    o[values(indBelowLeftRight)] = 0.5
+    p[values(indBelowFrontBehind)] = 0.5
+    q[values(indBelowAnyAround)] = 0.5
+
+    return e, f, g, h, m, n, o, p, q
+
+def solveQuietly(**parameters):
+    """ Applies the wind solver without printing its progress."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return solver(**parameters)
+
+def initialLambda(case):
+    """ Right-hand side and initial lambda (1 in the inner cells) of a case."""
+    rhs = divergenceRhs(cells4Solver = case["cells4Solver"], u0 = case["u0"],
+                        v0 = case["v0"], w0 = case["w0"], dx = case["dx"],
+                        dy = case["dy"], dz = case["dz"], alpha1 = 1.)
+    lam = np.zeros(rhs.shape)
+    lam[1:-1, 1:-1, 1:-1] = 1.
+
+    return rhs, lam
+
+
+class WindSolverTest(unittest.TestCase):
+    """Test the wind solver methods."""
+
+    @classmethod
+    def setUpClass(cls):
+        case = windCase()
+        cls.initialDivergence = divergenceNorm(case["u0"], case["v0"], case["w0"], case)
+        cls.reference = solveQuietly(**case, solverMethod = "sor",
+                                     thresholdIterations = 1e-8, maxIterations = 5000)[:3]
+
+    def test_solver_methods(self):
+        """Test that each solver method in each precision removes the 
+        divergence of the initial wind field and gives the same wind field
+        as the 'sor' method."""
+        for precision in LIST_OF_PRECISIONS:
+            case = windCase(precision = precision)
+            for solverMethod in LIST_OF_SOLVER_METHODS:
+                with self.subTest(solverMethod = solverMethod, precision = precision):
+                    u, v, w, history = solveQuietly(**case, solverMethod = solverMethod,
+                                                    precision = precision,
+                                                    thresholdIterations = 1e-6,
+                                                    maxIterations = 2000)
+                    self.assertEqual(u.dtype, np.dtype(precision))
+                    divergence = divergenceNorm(u, v, w, case)
+                    self.assertLess(divergence, 1e-4 * self.initialDivergence)
+                    self.assertAlmostEqual(history[DIVERGENCE_NORM_FIELD].iloc[-1],
+                                           divergence, delta = 1e-3 * self.initialDivergence)
+                    for wind, windReference in zip([u, v, w], self.reference):
+                        np.testing.assert_allclose(wind, windReference, rtol = 0, atol = 2e-5)
+
+    def test_adaptive_relaxation(self):
+        """Test that the adaptive relaxation factor converges faster than the
+        fixed one on a flat grid (the fixed factor, calculated from the 
+        horizontal grid shape only, being then too high)."""
+        case = windCase(nx = 60, ny = 60, nz = 8,
+                        building = (slice(26, 34), slice(24, 36), slice(1, 5)))
+        iterations = {}
+        for relaxation in ["fixed", "adaptive"]:
+            u, v, w, history = solveQuietly(**case, relaxation = relaxation,
+                                            thresholdIterations = 1e-6, maxIterations = 2000)
+            iterations[relaxation] = history[ITERATION_FIELD].iloc[-1]
+            self.assertLess(divergenceNorm(u, v, w, case),
+                            1e-4 * divergenceNorm(case["u0"], case["v0"], case["w0"], case))
+        self.assertLess(iterations["adaptive"], 0.75 * iterations["fixed"])
+
+    def test_grid_sequencing(self):
+        """Test that the grid sequencing converges to the wind field of the
+        solve without sequencing in fewer iterations."""
+        case = windCase(nx = 32, ny = 32, nz = 12,
+                        building = (slice(12, 18), slice(12, 20), slice(1, 6)))
+        reference = solveQuietly(**case, thresholdIterations = 1e-9, maxIterations = 5000)
+        iterations = {}
+        for gridSequencing in [0, 2]:
+            u, v, w, history = solveQuietly(**case, gridSequencing = gridSequencing,
+                                            thresholdIterations = 1e-6, maxIterations = 2000)
+            iterations[gridSequencing] = history[ITERATION_FIELD].iloc[-1]
+            for wind, windReference in zip([u, v, w], reference[:3]):
+                np.testing.assert_allclose(wind, windReference, rtol = 0, atol = 2e-5)
+        self.assertLess(iterations[2], iterations[0])
+
+    def test_stretched_grid(self):
+        """Test that the solver methods available for a vertically stretched
+        grid remove the divergence of the initial wind field (calculated with
+        the thickness of each level)."""
+        dz = 2. * 1.2 ** np.maximum(np.arange(14) - 6, 0)
+        case = windCase(dz = dz)
+        initialDivergence = divergenceNorm(case["u0"], case["v0"], case["w0"], case)
+        for solverMethod in ["sor", "masked-sor", "domain-decomposition", "red-black", "line-sor"]:
+            with self.subTest(solverMethod = solverMethod):
+                u, v, w, history = solveQuietly(**case, solverMethod = solverMethod,
+                                                thresholdIterations = 1e-6,
+                                                maxIterations = 2000)
+                self.assertLess(divergenceNorm(u, v, w, case), 1e-4 * initialDivergence)
+
+    def test_domain_decomposition_slabs(self):
+        """Test that no slab of the domain decomposition is empty when a tall
+        building concentrates the solver cells and that the result is the SOR one."""
+        case = windCase(nx = 40, building = (slice(15, 25), slice(1, 23), slice(1, 12)))
+        nx, ny, nz = case["u0"].shape
+        operator = solverOperator(nx = nx, ny = ny, nz = nz, dx = case["dx"],
+                                  dy = case["dy"], dz = case["dz"],
+                                  buildingCoordinates = case["buildingCoordinates"],
+                                  cells4Solver = case["cells4Solver"])
+        arguments = [operator["invDiag"], operator["flags"], operator["omega"],
+                     operator["A"], operator["B"]]
+        rhs, lamReference = initialLambda(case)
+        for N in range(2000):
+            change, norm = smoothSor(case["cells4Solver"], lamReference, rhs, *arguments)
+            if change / norm < 1e-10:
+                break
+
+        rhs, lam = initialLambda(case)
+        slabs = startSlabWorkers(lam = lam, rhs = rhs, invDiag = operator["invDiag"],
+                                 flags = operator["flags"], cells4Solver = case["cells4Solver"],
+                                 omega = operator["omega"], A = operator["A"], B = operator["B"],
+                                 nThreads = 16)
+        self.assertTrue((np.diff(slabs["limits"]) >= 1).all())
+        self.assertEqual(sum(cells.shape[0] for cells in slabs["firstSlabs"] + slabs["secondSlabs"]),
+                         case["cells4Solver"].shape[0])
+        for N in range(2000):
+            change, norm = slabIteration(slabs)
+            if change / norm < 1e-10:
+                break
+        lam = stopSlabWorkers(slabs)
+        np.testing.assert_allclose(lam, lamReference, rtol = 0, atol = 1e-7)
+
+    def test_solve_cases(self):
+        """Test that the cases are solved simultaneously only when the solver
+        options do not use parallel kernels and give the single case results."""
+        self.assertFalse(usesParallelKernels(solverMethod = "sor", gridSequencing = 0))
+        self.assertTrue(usesParallelKernels(solverMethod = "red-black", gridSequencing = 0))
+        self.assertTrue(usesParallelKernels(solverMethod = "sor", gridSequencing = 1))
+        cases = [windCase(), windCase(nx = 26)]
+        for solverMethod in ["sor", "red-black"]:
+            with self.subTest(solverMethod = solverMethod):
+                parameters = {"solverMethod": solverMethod, "gridSequencing": 0,
+                              "thresholdIterations": 1e-6, "maxIterations": 2000}
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results = solveCases(cases, nThreads = 2, **parameters)
+                for case, result in zip(cases, results):
+                    single = solveQuietly(**case, **parameters)
+                    for wind, windSingle in zip(result[:3], single[:3]):
+                        np.testing.assert_array_equal(wind, windSingle)
+
+    def test_batch_solver(self):
+        """Test that each initial wind field of a batch gives the wind field 
+        of a separate 'sor' solver call (the fields stopping at different
+        iterations)."""
+        base = windCase()
+        geometry = {key: value for key, value in base.items() if key not in ["u0", "v0", "w0"]}
+        members = [(base["u0"], base["v0"]), (0.5 * base["u0"], 1.5 * base["v0"]),
+                   (base["v0"], base["u0"])]
+        parameters = {"thresholdIterations": 1e-6, "maxIterations": 2000}
+        with contextlib.redirect_stdout(io.StringIO()):
+            u, v, w = batchSolver(**geometry, **parameters,
+                                  u0 = np.stack([u0 for u0, v0 in members]),
+                                  v0 = np.stack([v0 for u0, v0 in members]),
+                                  w0 = np.stack([base["w0"] for member in members]))
+        for n, (u0, v0) in enumerate(members):
+            with self.subTest(member = n):
+                single = solveQuietly(**geometry, **parameters, u0 = u0, v0 = v0,
+                                      w0 = base["w0"], solverMethod = "sor")
+                for wind, windSingle in zip([u[n], v[n], w[n]], single[:3]):
+                    np.testing.assert_allclose(wind, windSingle, rtol = 0, atol = 1e-12)
+
+    def test_lambda_cache(self):
+        """Test that a calculation restarted with the same inputs converges 
+        in one iteration from the cached lambda while a calculation with a
+        different wind direction or boundary condition does not use it."""
+        case = windCase()
+        inputs = {"windDirection": 270, "v_ref": 2., "z_ref": 10.}
+        with tempfile.TemporaryDirectory() as directory:
+            parameters = {"thresholdIterations": 1e-6, "maxIterations": 2000,
+                          "lambdaCacheDirectory": directory}
+            first = solveQuietly(**case, **parameters, lambdaCacheInputs = inputs)[3]
+            self.assertGreater(first[ITERATION_FIELD].iloc[-1], 1)
+            restart = solveQuietly(**case, **parameters, lambdaCacheInputs = inputs)[3]
+            self.assertEqual(restart[ITERATION_FIELD].iloc[-1], 1)
+            for changedInputs in [{"lambdaCacheInputs": dict(inputs, windDirection = 260)},
+                                  {"lambdaCacheInputs": inputs, "lateralBoundary": "neumann"}]:
+                with self.subTest(**changedInputs):
+                    changed = solveQuietly(**case, **parameters, **changedInputs)[3]
+                    self.assertGreater(changed[ITERATION_FIELD].iloc[-1], 1)
+            self.assertEqual(len(os.listdir(directory)), 3)
+
+    def test_free_stream(self):
+        """Test that the solve truncated at the free stream region gives the
+        full solve wind field below the free stream level (within 2 % of the
+        maximum wind speed), is divergence free and keeps a null vertical 
+        wind speed above the solved levels."""
+        case = windCase(nz = 24)
+        level = freeStreamLevel(u0 = case["u0"], v0 = case["v0"], w0 = case["w0"],
+                                buildingCoordinates = case["buildingCoordinates"])
+        self.assertEqual(level, 6)
+        parameters = {"thresholdIterations": 1e-8, "maxIterations": 5000}
+        full = solveQuietly(**case, **parameters)
+        u, v, w, history = solveQuietly(**case, **parameters, freeStream = True)
+        maxSpeed = np.abs(full[0]).max()
+        for wind, windFull in zip([u, v, w], full[:3]):
+            np.testing.assert_allclose(wind[:, :, :level], windFull[:, :, :level],
+                                       rtol = 0, atol = 0.02 * maxSpeed)
+        self.assertLess(divergenceNorm(u, v, w, case), 1e-6 * self.initialDivergence)
+        np.testing.assert_array_equal(w[:, :, level + FREE_STREAM_MARGIN:], 0)
+
+    def test_lateral_boundaries(self):
+        """Test the lateral boundary conditions: the wind speed through the 
+        "neumann" faces (zero normal gradient of lambda) is not modified, 
+        and for "outflow", only the faces where the wind enters the domain
+        are "neumann" (the outflow faces having a null lambda)."""
+        case = windCase(nx = 16, ny = 14, nz = 10,
+                        building = (slice(6, 9), slice(5, 8), slice(1, 4)))
+        self.assertEqual(lateralFaceConditions("neumann", u0 = case["u0"], v0 = case["v0"]),
+                         ("neumann",) * 4)
+        self.assertEqual(lateralFaceConditions("outflow", u0 = case["u0"], v0 = case["v0"]),
+                         ("neumann", "dirichlet", "neumann", "dirichlet"))
+        self.assertEqual(lateralFaceConditions("outflow", u0 = -case["u0"], v0 = case["v0"]),
+                         ("dirichlet", "neumann", "neumann", "dirichlet"))
+        
+        flags = boundaryFlags(np.zeros((5, 6, 4), dtype = np.uint16),
+                              lateralBoundaries = ("neumann", "dirichlet", "dirichlet", "neumann"))
+        lowerYFlag, upperYFlag = (FLAG_G, FLAG_H) if DESCENDING_Y else (FLAG_H, FLAG_G)
+        expected = np.zeros((5, 6, 4), dtype = np.uint16)
+        expected[1, :, :] |= FLAG_F | FLAG_O
+        expected[:, -2, :] |= upperYFlag | FLAG_P
+        np.testing.assert_array_equal(flags, expected)
+        
+        # Faces of the lower X, upper X, lower Y and upper Y boundaries
+        faces = [lambda u, v: u[1], lambda u, v: u[-1], lambda u, v: v[:, 1], lambda u, v: v[:, -1]]
+        initialDivergence = divergenceNorm(case["u0"], case["v0"], case["w0"], case)
+        for lateralBoundary, unchangedFaces in [("neumann", [True] * 4),
+                                                ("outflow", [True, False, True, False])]:
+            with self.subTest(lateralBoundary = lateralBoundary):
+                u, v, w, history = solveQuietly(**case, lateralBoundary = lateralBoundary,
+                                                thresholdIterations = 1e-8, maxIterations = 5000)
+                self.assertLess(divergenceNorm(u, v, w, case), 1e-6 * initialDivergence)
+                for face, unchanged in zip(faces, unchangedFaces):
+                    change = np.abs(face(u, v) - face(case["u0"], case["v0"])).max()
+                    if unchanged:
+                        self.assertEqual(change, 0)
+                    else:
+                        self.assertGreater(change, 1e-2)
+
+    def test_obstacle_flags(self):
+        """Test that the obstacle flags code the coefficients of the initial
+        version of the solver for buildings touching the edges of the domain
+        (the initial version wrapping the lower edges neighbours around to 
+        the upper boundary cells, these cells are not compared)."""
+        nx, ny, nz = 8, 7, 6
+        isBuilding = np.zeros((nx, ny, nz), dtype = bool)
+        isBuilding[0:nx - 1, 0:ny - 1, 0] = True
+        isBuilding[0:2, 2:4, 1:3] = True
+        isBuilding[5:nx - 1, 0:2, 1:4] = True
+        isBuilding[3, 4:ny - 1, 1:nz - 1] = True
+        buildingCoordinates = np.stack(np.where(isBuilding)).astype(np.int32)
+        flags = obstacleFlags(nx = nx, ny = ny, nz = nz,
+                              buildingCoordinates = buildingCoordinates)
+        coefficients = [np.where(flags & flag, value, 1.)
+                        for flag, value in [(FLAG_E, 0.), (FLAG_F, 0.), (FLAG_G, 0.),
+                                            (FLAG_H, 0.), (FLAG_M, 0.), (FLAG_N, 0.),
+                                            (FLAG_O, 0.5), (FLAG_P, 0.5), (FLAG_Q, 0.5)]]
+        expected = baselineCoefficients(nx = nx, ny = ny, nz = nz,
+                                        buildingCoordinates = buildingCoordinates)
+        for name, coefficient, coefficientExpected in zip("efghmnopq", coefficients, expected):
+            with self.subTest(coefficient = name):
+                np.testing.assert_array_equal(coefficient[:-1, :-1, :-1],
+                                              coefficientExpected[:-1, :-1, :-1])
+
+    def test_no_iteration(self):
+        """Test that the solver runs without any iteration (the initial lambda
+        being then used) and returns an empty convergence history."""
+        for solverMethod in ["sor", "red-black"]:
+            with self.subTest(solverMethod = solverMethod):
+                u, v, w, history = solveQuietly(**windCase(), solverMethod = solverMethod,
+                                                maxIterations = 0)
+                self.assertEqual(len(history), 0)
+                self.assertTrue(np.isfinite(u).all())
+
+    def test_out_of_core(self):
+        """Test that the 3D fields of the solver (obstacle flags, inverse 
+        diagonal coefficients, right-hand side and lambda) are memory-mapped,
+        the previous lambda only by the methods using it, and that the 
+        out-of-core solve gives the in-memory result."""
+        case = windCase()
+        for solverMethod, keepsPreviousLambda in [("red-black", False), ("multigrid", True)]:
+            with self.subTest(solverMethod = solverMethod), tempfile.TemporaryDirectory() as directory:
+                u, v, w, history = solveQuietly(**case, solverMethod = solverMethod,
+                                                thresholdIterations = 1e-6,
+                                                maxIterations = 2000,
+                                                memmapDirectory = directory)
+                self.assertEqual(os.path.isfile(os.path.join(directory, "memmap_lambdaN.npy")),
+                                 keepsPreviousLambda)
+                for name in ["flags", "invDiag", "rhs", "lambdaN1"]:
+                    self.assertTrue(os.path.isfile(os.path.join(directory,
+                                                                "memmap_{0}.npy".format(name))))
+                for wind, windReference in zip([u, v, w], self.reference):
+                    np.testing.assert_allclose(wind, windReference, rtol = 0, atol = 2e-5)
+                del u, v, w
+
+    def test_warm_up(self):
+        """Test that the warm-up compiles the kernels for the argument types
+        of the calculation: a calculation following the warm-up does not
+        compile any new kernel signature (checked in a new interpreter, the
+        warm-up running in a thread such as in the provider, thus launching
+        the threading layer, and the interpreter exiting once the parallel
+        kernels have been used)."""
+        packageName = __name__.split(".")[-3]
+        packageParent = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        script = "\n".join(["import sys, threading, numba",
+                            "sys.path.insert(0, {0!r})".format(packageParent),
+                            "from {0} import WindSolver".format(packageName),
+                            "from {0}.test.test_wind_solver import windCase".format(packageName),
+                            "kernels = [getattr(WindSolver, name) for name in dir(WindSolver)",
+                            "           if isinstance(getattr(WindSolver, name), numba.core.dispatcher.Dispatcher)]",
+                            "warmUp = threading.Thread(target = WindSolver.warmUp,",
+                            "                          kwargs = {'solverMethod': 'red-black'})",
+                            "warmUp.start()",
+                            "warmUp.join()",
+                            "signatures = [len(kernel.signatures) for kernel in kernels]",
+                            "WindSolver.solver(**windCase(), solverMethod = 'red-black')",
+                            "print(signatures == [len(kernel.signatures) for kernel in kernels])"])
+        result = subprocess.run([sys.executable, "-c", script], capture_output = True,
+                                text = True, timeout = 600)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.splitlines()[-1], "True")
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(WindSolverTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -425,12 +425,23 @@ class URockAlgorithm(QgsProcessingAlgorithm):
                                  alongWindZoneExtend = ALONG_WIND_ZONE_EXTEND,
                                  crossWindZoneExtend = CROSS_WIND_ZONE_EXTEND,
                                  verticalExtend = VERTICAL_EXTEND,
+                                 autoZoneExtend = AUTO_ZONE_EXTEND,
+                                 zoneExtendSafetyFactor = ZONE_EXTEND_SAFETY_FACTOR,
+                                 verticalStretching = VERTICAL_STRETCHING,
                                  cadTriangles = "",
                                  cadTreesIntersection = "",
                                  tempoDirectory = TEMPO_DIRECTORY,
                                  onlyInitialization = ONLY_INITIALIZATION,
                                  maxIterations = MAX_ITERATIONS,
                                  thresholdIterations = THRESHOLD_ITERATIONS,
+                                 solverMethod = SOLVER_METHOD,
+                                 precision = PRECISION,
+                                 lambdaCache = LAMBDA_CACHE,
+                                 relaxation = RELAXATION,
+                                 gridSequencing = GRID_SEQUENCING,
+                                 outOfCore = OUT_OF_CORE,
+                                 freeStream = FREE_STREAM,
+                                 lateralBoundary = LATERAL_BOUNDARY,
                                  idFieldBuild = idBuild,
                                  buildingHeightField = heightBuild,
                                  vegetationBaseHeight = baseHeightVeg,
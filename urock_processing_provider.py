@@ -32,6 +32,9 @@ __revision__ = '$Format:%H$'
 
 from qgis.core import QgsProcessingProvider
 from .urock_processing_algorithm import URockAlgorithm
+from .MainCalculation import warmUpKernels
+from .GlobalVariables import PRECISION
+import threading
 
 
 class URockProvider(QgsProcessingProvider):
@@ -42,6 +45,18 @@ class URockProvider(QgsProcessingProvider):
         """
         QgsProcessingProvider.__init__(self)
 
+    def load(self):
+        """
+        Loads the provider. The numerical kernels of the wind solver are 
+        compiled (or loaded from the disk cache) in a background thread such
+        as the first calculation does not wait for their compilation (the 
+        threading layer of the parallel kernels being launched by this thread
+        too, nothing is done by the main thread of QGIS).
+        """
+        threading.Thread(target = warmUpKernels, kwargs = {"precision": PRECISION},
+                         daemon = True).start()
+        return QgsProcessingProvider.load(self)
+
     def unload(self):
         """
         Unloads the provider. Any tear-down steps required by the provider